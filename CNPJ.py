@@ -3,15 +3,15 @@
 import streamlit as st
 import pandas as pd
 import os
-import requests
-import re
-import time
 from datetime import datetime
-import google.generativeai as genai
-import json
 import io
+import json
 import logging
-from io import StringIO
+import pathlib
+from collections import deque
+from grupos_economicos import CACHE_DIR, GRUPOS_PATH, GrupoEconomicoApp, carregar_grupos, carregar_resultado_anterior
+from planilhas import FORMATOS_SAIDA, EscritorMultiplo, EscritorPrevia, abrir_escritor, acumular_resumo, em_blocos, exportar, ler_em_blocos, ler_linhas, resumo_vazio
+from jobs import GerenciadorJobs
 
 # Configuração da página
 st.set_page_config(
@@ -22,10 +22,10 @@ st.set_page_config(
 
 # Configurar logging
 class StreamlitLogHandler(logging.Handler):
-    """Handler customizado para exibir logs no Streamlit"""
-    def __init__(self):
+    """Handler customizado para exibir logs no Streamlit, com os últimos registros num buffer circular"""
+    def __init__(self, capacidade: int = 5000):
         super().__init__()
-        self.logs = []
+        self.logs = deque(maxlen=capacidade)
     
     def emit(self, record):
         log_entry = self.format(record)
@@ -34,324 +34,295 @@ class StreamlitLogHandler(logging.Handler):
             'level': record.levelname,
             'message': log_entry
         })
+    
+    def registros(self) -> list:
+        """Cópia dos registros; o lock do handler evita ler o deque enquanto um worker escreve"""
+        with self.lock:
+            return list(self.logs)
+    
+    def limpar(self):
+        with self.lock:
+            self.logs.clear()
 
 # Configurar logger
 logger = logging.getLogger('GrupoEconomicoApp')
 logger.setLevel(logging.DEBUG)
 
-# Handler para Streamlit
-streamlit_handler = StreamlitLogHandler()
-streamlit_handler.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
-logger.addHandler(streamlit_handler)
+@st.cache_resource(show_spinner=False)
+def configurar_logs() -> StreamlitLogHandler:
+    """Handlers criados uma vez por processo; o script roda de novo a cada rerun"""
+    # Handler para Streamlit
+    streamlit_handler = StreamlitLogHandler()
+    streamlit_handler.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
+    logger.addHandler(streamlit_handler)
+    
+    # Handler para console (opcional)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(console_handler)
+    return streamlit_handler
 
-# Handler para console (opcional)
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(console_handler)
+streamlit_handler = configurar_logs()
 
-class GrupoEconomicoApp:
-    def __init__(self):
-        self.grupos_conhecidos = {
-            "AMBEV": ["ambev", "brahma", "skol", "antarctica", "anheuser"],
-            "VALE": ["vale", "samarco"],
-            "PETROBRAS": ["petrobras", "br distribuidora"],
-            "ITAU": ["itau", "unibanco"],
-            "BRADESCO": ["bradesco"],
-            "JBS": ["jbs", "friboi", "seara"],
-            "NATURA": ["natura", "avon"],
-            "MAGAZINE LUIZA": ["magalu", "magazine luiza"],
-            "SUZANO": ["suzano"],
-            "GERDAU": ["gerdau"]
-        }
-        logger.info(f"App inicializado com {len(self.grupos_conhecidos)} grupos conhecidos")
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _obter_app(caminho_grupos: str, mtime: float):
+    """App compartilhado entre reruns e sessões; recriado só quando o dicionário muda (mtime)"""
+    return GrupoEconomicoApp(carregar_grupos(caminho_grupos))
+
+def obter_app() -> GrupoEconomicoApp:
+    return _obter_app(GRUPOS_PATH, os.path.getmtime(GRUPOS_PATH))
+
+@st.cache_resource(show_spinner=False)
+def obter_gerenciador_jobs() -> GerenciadorJobs:
+    return GerenciadorJobs(os.path.join(CACHE_DIR, 'jobs'))
+
+def barra_progresso():
+    """Barra de progresso do Streamlit como callback `ao_progredir(concluidos, total, cnpj)` do motor"""
+    progress_bar = st.progress(0)
+    status_text = st.empty()
     
-    def buscar_cnpj(self, cnpj: str):
-        """Busca dados do CNPJ em APIs públicas"""
-        cnpj_limpo = re.sub(r'\D', '', cnpj)
-        logger.debug(f"Buscando CNPJ: {cnpj_limpo}")
-        
-        # Cache simples
-        if f"cnpj_{cnpj_limpo}" in st.session_state:
-            logger.debug(f"CNPJ {cnpj_limpo} encontrado no cache")
-            return st.session_state[f"cnpj_{cnpj_limpo}"]
-        
-        # Tentar APIs
-        for api_url in [
-            f"https://www.receitaws.com.br/v1/cnpj/{cnpj_limpo}",
-            f"https://brasilapi.com.br/api/cnpj/v1/{cnpj_limpo}"
-        ]:
-            try:
-                logger.debug(f"Tentando API: {api_url}")
-                response = requests.get(api_url, timeout=10)
-                logger.debug(f"Status da resposta: {response.status_code}")
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # Processar ReceitaWS
-                    if "receitaws" in api_url:
-                        if data.get('status') == 'OK':
-                            result = {
-                                'razao_social': data.get('nome', ''),
-                                'nome_fantasia': data.get('fantasia', ''),
-                                'atividade': data.get('atividade_principal', {}).get('text', '') if isinstance(data.get('atividade_principal'), dict) else str(data.get('atividade_principal', '')),
-                                'situacao': data.get('situacao', '')
-                            }
-                            logger.info(f"✅ Dados encontrados (ReceitaWS): {result['razao_social']}")
-                            st.session_state[f"cnpj_{cnpj_limpo}"] = result
-                            return result
-                        else:
-                            logger.warning(f"ReceitaWS retornou status: {data.get('status')}")
-                    
-                    # Processar Brasil API
-                    else:
-                        result = {
-                            'razao_social': data.get('razao_social', ''),
-                            'nome_fantasia': data.get('nome_fantasia', ''),
-                            'atividade': data.get('cnae_fiscal_descricao', ''),
-                            'situacao': data.get('descricao_situacao_cadastral', '')
-                        }
-                        logger.info(f"✅ Dados encontrados (BrasilAPI): {result['razao_social']}")
-                        st.session_state[f"cnpj_{cnpj_limpo}"] = result
-                        return result
-            except Exception as e:
-                logger.error(f"Erro ao buscar em {api_url}: {str(e)}")
-                continue
-        
-        logger.warning(f"❌ Nenhuma API retornou dados para CNPJ {cnpj_limpo}")
+    def ao_progredir(concluidos, total, cnpj):
+        if total:
+            progress_bar.progress(min(1.0, concluidos / total))
+        status_text.text(f"Processando {concluidos}{f'/{total}' if total else ''}: {cnpj}")
+    
+    def limpar():
+        progress_bar.empty()
+        status_text.empty()
+    
+    return ao_progredir, limpar
+
+def carregar_anteriores(arquivo):
+    """Linhas reaproveitáveis do resultado anterior enviado (modo incremental), ou None"""
+    if arquivo is None:
         return None
+    arquivo.seek(0)
+    anteriores = carregar_resultado_anterior(arquivo, arquivo.name)
+    st.info(f"🔁 Modo incremental: {len(anteriores)} CNPJs reaproveitáveis no resultado anterior")
+    return anteriores
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def ler_planilha(file_id: str, nome: str, _arquivo) -> pd.DataFrame:
+    """Lê a planilha enviada uma vez por upload (file_id), não a cada rerun"""
+    _arquivo.seek(0)
+    if nome.lower().endswith('.csv'):
+        return pd.read_csv(_arquivo, dtype=str, keep_default_na=False, sep=None, engine='python')
+    return pd.read_excel(_arquivo)
+
+LINHAS_POR_PAGINA = 100
+SAIDAS_DIR = os.path.join(CACHE_DIR, 'saidas')
+# Saídas de sessões encerradas (navegador fechado) não são substituídas por ninguém; somem depois desse prazo
+VALIDADE_SAIDAS = 24 * 3600
+COLUNAS_PRINCIPAIS = ['cnpj_original', 'razao_social', 'grupo_economico', 'confianca']
+
+def guardar_resultado(origem: str, resumo: dict, df: pd.DataFrame = None, caminho: str = None, formato: str = None, previa: EscritorPrevia = None):
+    """Guarda o resultado na sessão: reruns (paginação, downloads) não reprocessam nem recalculam nada
     
-    def buscar_perplexity(self, empresa_data: dict, perplexity_key: str):
-        """Busca informações sobre grupo econômico via Perplexity API"""
-        try:
-            logger.debug("Tentando Perplexity API...")
-            
-            headers = {
-                "Authorization": f"Bearer {perplexity_key}",
-                "Content-Type": "application/json"
-            }
-            
-            razao = empresa_data.get('razao_social', '')
-            fantasia = empresa_data.get('nome_fantasia', '')
-            
-            payload = {
-                "model": "sonar",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "Você é um assistente especializado em identificar grupos econômicos brasileiros. Responda APENAS com JSON no formato: {\"grupo_economico\": \"NOME_DO_GRUPO\", \"confianca\": 85}"
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Identifique o grupo econômico desta empresa brasileira:
-Razão Social: {razao}
-Nome Fantasia: {fantasia}
+    O resultado fica em memória (`df`) ou no arquivo gravado em blocos (`caminho`, no `formato` escolhido),
+    com a `previa` gravada junto para a tabela paginada.
+    """
+    anterior = st.session_state.get('resultado')
+    if anterior:
+        # O resultado substituído não é mais alcançável pela sessão: seus arquivos em .cache/saidas saem junto
+        for arquivo in (anterior['caminho'], anterior['previa'] and anterior['previa'][0]):
+            if arquivo and os.path.exists(arquivo):
+                os.remove(arquivo)
+    st.session_state['resultado'] = {
+        'origem': origem,
+        'nome': f"grupos_economicos_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        'resumo': resumo,
+        'df': df,
+        'caminho': caminho,
+        'formato': formato,
+        'previa': (previa.destino, previa.blocos) if previa is not None else None,
+        'arquivos': {}
+    }
 
-Grupos conhecidos: {list(self.grupos_conhecidos.keys())}
+def limpar_saidas_antigas(validade: float = VALIDADE_SAIDAS):
+    """Remove de SAIDAS_DIR os arquivos (saídas e prévias) modificados há mais de `validade` segundos"""
+    if not os.path.isdir(SAIDAS_DIR):
+        return
+    limite = datetime.now().timestamp() - validade
+    for entrada in os.scandir(SAIDAS_DIR):
+        try:
+            if entrada.is_file() and entrada.stat().st_mtime < limite:
+                os.remove(entrada.path)
+        except OSError:
+            logger.warning(f"Não foi possível remover a saída antiga {entrada.path}")
 
-Se a empresa pertence a algum desses grupos ou você tem certeza de outro grupo econômico relevante, informe. Se for independente ou você não tiver certeza, retorne "INDEPENDENTE".
+def gerar_arquivo(resultado: dict, formato: str) -> bytes:
+    """Conteúdo do download, gerado só no clique (e guardado para os próximos)"""
+    if resultado['caminho'] and formato == resultado['formato']:
+        with open(resultado['caminho'], 'rb') as f:
+            return f.read()
+    if formato not in resultado['arquivos']:
+        blocos = em_blocos(resultado['df']) if resultado['df'] is not None else ler_em_blocos(resultado['caminho'])
+        resultado['arquivos'][formato] = exportar(blocos, formato)
+    return resultado['arquivos'][formato]
 
-Responda APENAS com JSON válido."""
-                    }
-                ],
-                "temperature": 0.2,
-                "max_tokens": 200
-            }
-            
-            response = requests.post(
-                "https://api.perplexity.ai/chat/completions",
-                json=payload,
-                headers=headers,
-                timeout=15
-            )
-            
-            logger.debug(f"Perplexity status: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                content = data.get('choices', [{}])[0].get('message', {}).get('content', '')
-                logger.debug(f"Resposta Perplexity: {content[:200]}...")
-                
-                # Tentar extrair JSON
-                json_match = re.search(r'\{.*?\}', content, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group())
-                    grupo = result.get('grupo_economico', 'INDEPENDENTE')
-                    confianca = result.get('confianca', 75)
-                    
-                    logger.info(f"✅ Grupo identificado por Perplexity: {grupo} ({confianca}%)")
-                    return {
-                        'grupo_economico': grupo,
-                        'confianca': confianca,
-                        'metodo': 'Perplexity'
-                    }
-                else:
-                    logger.warning("Perplexity não retornou JSON válido")
-            else:
-                logger.error(f"Erro Perplexity: {response.status_code} - {response.text[:200]}")
-        except Exception as e:
-            logger.error(f"Erro ao usar Perplexity: {str(e)}")
-        
-        return None
+@st.fragment
+def tabela_resultado(resultado: dict):
+    """Uma página do resultado por vez; trocar de página reexecuta só este trecho"""
+    total = resultado['resumo']['total']
+    paginas = max(1, -(-total // LINHAS_POR_PAGINA))
+    col_pagina, col_colunas = st.columns([1, 3])
+    with col_pagina:
+        pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1, key=f"pagina_{resultado['nome']}")
+    with col_colunas:
+        todas = st.toggle("Mostrar todas as colunas", key=f"colunas_{resultado['nome']}")
     
-    def identificar_grupo(self, empresa_data: dict, gemini_key: str = None, perplexity_key: str = None):
-        """Identifica grupo econômico"""
-        razao = empresa_data.get('razao_social', '').lower()
-        fantasia = empresa_data.get('nome_fantasia', '').lower()
-        
-        logger.debug(f"Identificando grupo para: {razao} / {fantasia}")
-        
-        # Análise por regras (sempre funciona)
-        for grupo, keywords in self.grupos_conhecidos.items():
-            for keyword in keywords:
-                if keyword in razao or keyword in fantasia:
-                    logger.info(f"✅ Grupo identificado por regras: {grupo} (keyword: {keyword})")
-                    return {
-                        'grupo_economico': grupo,
-                        'confianca': 85,
-                        'metodo': 'Regras'
-                    }
-        
-        logger.debug("Nenhum grupo identificado por regras, tentando AI...")
-        
-        # PRIORIDADE 1: Perplexity (mais confiável para pesquisa)
-        if perplexity_key:
-            resultado = self.buscar_perplexity(empresa_data, perplexity_key)
-            if resultado:
-                return resultado
-        else:
-            logger.warning("Chave do Perplexity não fornecida")
-        
-        # PRIORIDADE 2: Gemini (fallback)
-        if gemini_key:
-            try:
-                logger.debug("Tentando Gemini API...")
-                genai.configure(api_key=gemini_key)
-                
-                for modelo in ['gemini-2.5-flash', 'gemini-2.5-pro']:
-                    try:
-                        logger.debug(f"Tentando modelo: {modelo}")
-                        model = genai.GenerativeModel(modelo)
-                        prompt = f"""
-Identifique o grupo econômico da empresa brasileira:
-Razão Social: {empresa_data.get('razao_social', '')}
-Nome Fantasia: {empresa_data.get('nome_fantasia', '')}
+    inicio = (pagina - 1) * LINHAS_POR_PAGINA
+    if resultado['df'] is not None:
+        df = resultado['df'].iloc[inicio:inicio + LINHAS_POR_PAGINA]
+    else:
+        # Resultado em arquivo: só o bloco da página, direto da prévia (sem reler o .xlsx/.csv)
+        df = ler_linhas(*resultado['previa'], inicio, LINHAS_POR_PAGINA)
+    if not todas:
+        df = df[[col for col in COLUNAS_PRINCIPAIS if col in df.columns]]
+    
+    st.dataframe(df, use_container_width=True)
+    st.caption(f"Linhas {min(total, inicio + 1)}–{min(total, inicio + LINHAS_POR_PAGINA)} de {total}")
 
-Grupos conhecidos: {list(self.grupos_conhecidos.keys())}
+def exibir_resultado(resultado: dict):
+    """Estatísticas e gráfico a partir dos agregados, tabela paginada e downloads sob demanda"""
+    resumo = resultado['resumo']
+    st.success(f"✅ Processamento concluído!")
+    col_stat1, col_stat2, col_stat3 = st.columns(3)
+    with col_stat1:
+        st.metric("Total", resumo['total'])
+    with col_stat2:
+        st.metric("Sucessos", resumo['total'] - resumo['erros'])
+    with col_stat3:
+        st.metric("Erros", resumo['erros'])
+    
+    if resumo['grupos']:
+        st.subheader("📊 Distribuição por Grupos")
+        st.bar_chart(pd.Series(resumo['grupos']).sort_values(ascending=False))
+    
+    st.header("📊 Resultado")
+    tabela_resultado(resultado)
+    
+    st.header("💾 Download")
+    principal = resultado['formato'] or 'xlsx'
+    for coluna, formato in zip(st.columns(len(FORMATOS_SAIDA)), FORMATOS_SAIDA):
+        with coluna:
+            st.download_button(
+                label=f"📥 Baixar {formato.upper()}",
+                data=lambda formato=formato: gerar_arquivo(resultado, formato),
+                file_name=f"{resultado['nome']}.{formato}",
+                mime=FORMATOS_SAIDA[formato],
+                type="primary" if formato == principal else "secondary",
+                on_click="ignore",
+                use_container_width=True,
+                key=f"baixar_{resultado['nome']}_{formato}"
+            )
 
-Busque por similaridade, mesmo que o nome não seja exatamente igual. Busque relações óbvias ou históricas, como "Ambev" para "Brahma" ou "Skol". Use o CNPJ para contexto se necessário, mas não dependa dele. qualquer empresa que não se encaixe em grupos conhecidos deve ser classificada como "INDEPENDENTE", mas apenas em último caso.
+ROTULOS_STATUS_JOB = {
+    'na_fila': '⏳ Na fila',
+    'preparando': '🔎 Contando linhas',
+    'executando': '⚙️ Executando',
+    'gravando': '💾 Gravando resultado',
+    'pausado': '⏸️ Pausado',
+    'interrompido': '⚠️ Interrompido',
+    'erro': '❌ Erro',
+    'concluido': '✅ Concluído'
+}
 
-Responda APENAS com JSON válido:
-{{"grupo_economico": "NOME_GRUPO ou INDEPENDENTE", "confianca": 80}}
-                        """
-                        
-                        logger.debug("Enviando prompt para Gemini...")
-                        response = model.generate_content(prompt)
-                        logger.debug(f"Resposta do Gemini: {response.text[:200]}...")
-                        
-                        json_match = re.search(r'\{.*?\}', response.text, re.DOTALL)
-                        
-                        if json_match:
-                            result = json.loads(json_match.group())
-                            logger.info(f"✅ Grupo identificado por Gemini ({modelo}): {result.get('grupo_economico')} ({result.get('confianca')}%)")
-                            return {
-                                'grupo_economico': result.get('grupo_economico', 'INDEPENDENTE'),
-                                'confianca': result.get('confianca', 70),
-                                'metodo': f'Gemini ({modelo})'
-                            }
-                        else:
-                            logger.warning(f"Gemini não retornou JSON válido")
-                        break
-                    except Exception as e:
-                        logger.error(f"Erro com modelo {modelo}: {str(e)}")
-                        continue
-            except Exception as e:
-                logger.error(f"Erro ao usar Gemini: {str(e)}")
-        else:
-            logger.warning("Chave do Gemini não fornecida")
-        
-        # Fallback final
-        logger.warning("⚠️ Caindo no fallback - classificando como INDEPENDENTE")
-        return {
-            'grupo_economico': 'INDEPENDENTE',
-            'confianca': 50,
-            'metodo': 'Padrão'
-        }
+@st.fragment(run_every=2)
+def painel_jobs(gerenciador: GerenciadorJobs, app: GrupoEconomicoApp, gemini_key: str = None, perplexity_key: str = None):
+    """Acompanha os jobs em segundo plano; só lê o status, o processamento roda no servidor"""
+    jobs = gerenciador.listar()
+    if not jobs:
+        return
     
-    def processar_planilha(self, df: pd.DataFrame, cnpj_col: str, gemini_key: str = None, perplexity_key: str = None):
-        """Processa planilha com CNPJs"""
-        logger.info(f"Iniciando processamento de {len(df)} CNPJs")
-        resultados = []
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        for idx, row in df.iterrows():
-            progress = (idx + 1) / len(df)
-            progress_bar.progress(progress)
-            status_text.text(f"Processando {idx+1}/{len(df)}: {row[cnpj_col]}")
-            
-            cnpj = str(row[cnpj_col]).strip()
-            logger.info(f"\n{'='*60}\nProcessando linha {idx+1}: {cnpj}")
-            
-            # Inicializar resultado base
-            resultado = {
-                'cnpj_original': cnpj,
-                'erro': None
-            }
+    st.header("🧾 Jobs em segundo plano")
+    for job in jobs:
+        total = job['total'] or 0
+        with st.container(border=True):
+            st.markdown(f"**{job['arquivo']}** · `{job['id']}` · {ROTULOS_STATUS_JOB.get(job['status'], job['status'])}")
+            if total:
+                st.progress(min(1.0, job['feitas'] / total), text=f"{job['feitas']}/{total} linhas")
+            if job['erro']:
+                st.caption(f"Erro: {job['erro']}")
             
-            # Validar CNPJ
-            cnpj_limpo = re.sub(r'\D', '', cnpj)
-            if len(cnpj_limpo) != 14:
-                logger.error(f"CNPJ inválido: {cnpj} (tamanho: {len(cnpj_limpo)})")
-                resultado['erro'] = 'CNPJ inválido'
-            else:
-                # Buscar dados
-                empresa_data = self.buscar_cnpj(cnpj)
-                
-                if empresa_data:
-                    # Identificar grupo
-                    grupo_info = self.identificar_grupo(empresa_data, gemini_key, perplexity_key)
-                    
-                    resultado.update({
-                        'cnpj': cnpj_limpo,
-                        'razao_social': empresa_data['razao_social'],
-                        'nome_fantasia': empresa_data['nome_fantasia'],
-                        'grupo_economico': grupo_info['grupo_economico'],
-                        'confianca': grupo_info['confianca'],
-                        'metodo_analise': grupo_info['metodo'],
-                        'atividade': empresa_data['atividade'],
-                        'situacao': empresa_data['situacao']
-                    })
-                    logger.info(f"✅ Resultado: {grupo_info['grupo_economico']} ({grupo_info['confianca']}%) via {grupo_info['metodo']}")
-                else:
-                    resultado.update({
-                        'cnpj': cnpj_limpo,
-                        'erro': 'Dados não encontrados'
-                    })
-                    logger.error(f"❌ Dados não encontrados para CNPJ {cnpj}")
-            
-            # Adicionar dados originais da planilha
-            for col in df.columns:
-                if col != cnpj_col:
-                    resultado[f'original_{col}'] = row[col]
-            
-            resultados.append(resultado)
-            
-            # Pausa para não sobrecarregar APIs
-            if idx < len(df) - 1:
-                time.sleep(1)
-        
-        progress_bar.empty()
-        status_text.empty()
-        logger.info(f"Processamento concluído: {len(resultados)} registros")
-        
-        return pd.DataFrame(resultados)
+            if job['status'] in ('executando', 'preparando', 'na_fila'):
+                if st.button("⏸️ Pausar", key=f"pausar_{job['id']}"):
+                    gerenciador.pausar(job['id'])
+            elif job['status'] in ('pausado', 'interrompido', 'erro'):
+                if st.button("▶️ Retomar", key=f"retomar_{job['id']}"):
+                    gerenciador.iniciar(job['id'], app, gemini_key, perplexity_key)
+            elif job['status'] == 'concluido' and os.path.exists(job['caminho_saida']):
+                resumo = job['resumo'] or {}
+                st.caption(f"{resumo.get('total', 0)} linhas, {resumo.get('erros', 0)} erros")
+                # Lido só no clique: o painel é redesenhado a cada 2 segundos
+                st.download_button(
+                    "📥 Baixar resultado",
+                    data=lambda caminho=job['caminho_saida']: pathlib.Path(caminho).read_bytes(),
+                    file_name=job['saida'],
+                    mime=FORMATOS_SAIDA[job['formato_saida']],
+                    on_click="ignore",
+                    key=f"baixar_{job['id']}"
+                )
+
+def painel_metricas(app: GrupoEconomicoApp):
+    """Tempos por etapa, latência das fontes, caches, retentativas e uso das IAs"""
+    metricas = app.metricas
+    instantaneo = json.loads(app.exportar_metricas('json'))
+    histogramas = instantaneo['histogramas']
+    
+    acertos_cache = metricas.valor('cache_total', cache='cnpj', resultado='acerto')
+    consultas_cache = metricas.valor('cache_total', cache='cnpj')
+    tokens = metricas.valor('ia_tokens_total')
+    
+    col_m1, col_m2, col_m3, col_m4, col_m5 = st.columns(5)
+    col_m1.metric("Linhas", f"{metricas.valor('linhas_total'):.0f}")
+    col_m2.metric("Acerto do cache", f"{acertos_cache / consultas_cache:.0%}" if consultas_cache else "-")
+    col_m3.metric("Retentativas HTTP", f"{metricas.valor('http_retentativas_total'):.0f}")
+    col_m4.metric("Tokens de IA", f"{tokens:.0f}")
+    col_m5.metric("Custo estimado", f"US$ {metricas.valor('ia_custo_usd_total'):.4f}")
+    
+    def tabela(nome: str, rotulo: str):
+        linhas = []
+        for item in histogramas.get(nome, []):
+            resumo = item['valor']
+            linhas.append({
+                rotulo: ' / '.join(item['rotulos'].values()) or nome.removesuffix('_segundos'),
+                'chamadas': resumo['total'],
+                'média (ms)': resumo['media'] * 1000 if resumo['media'] is not None else None,
+                'p50 (ms)': resumo['p50'] * 1000 if resumo['p50'] is not None else None,
+                'p95 (ms)': resumo['p95'] * 1000 if resumo['p95'] is not None else None,
+                'p99 (ms)': resumo['p99'] * 1000 if resumo['p99'] is not None else None
+            })
+        return pd.DataFrame(linhas)
+    
+    col_t1, col_t2 = st.columns(2)
+    with col_t1:
+        st.markdown("**⏱️ Tempo por etapa**")
+        st.dataframe(pd.concat([tabela('etapa_segundos', 'etapa'), tabela('linha_segundos', 'etapa')]), hide_index=True, use_container_width=True)
+    with col_t2:
+        st.markdown("**🌐 Latência das fontes de CNPJ**")
+        st.dataframe(tabela('provedor_latencia_segundos', 'fonte / resultado'), hide_index=True, use_container_width=True)
+        latencias = histogramas.get('provedor_latencia_segundos', [])
+        if latencias:
+            st.bar_chart(pd.DataFrame({
+                ' / '.join(item['rotulos'].values()): item['valor']['buckets'] for item in latencias
+            }))
+    
+    col_d1, col_d2, col_d3 = st.columns(3)
+    with col_d1:
+        st.download_button("📥 Métricas (JSON)", data=app.exportar_metricas('json'), file_name="metricas.json", mime="application/json")
+    with col_d2:
+        st.download_button("📥 Métricas (Prometheus)", data=app.exportar_metricas('prometheus'), file_name="metricas.prom", mime="text/plain")
+    with col_d3:
+        if st.button("🔄 Zerar métricas"):
+            metricas.zerar()
+            st.rerun()
 
 def main():
     st.title("🏢 Identificador de Grupos Econômicos")
     st.markdown("**Upload uma planilha com CNPJs e baixe com os grupos econômicos identificados**")
     
-    app = GrupoEconomicoApp()
+    app = obter_app()
     
     # Sidebar
     with st.sidebar:
@@ -362,18 +333,56 @@ def main():
         st.markdown("**🔑 APIs Configuradas:**")
         st.markdown(f"{'✅' if perplexity_key else '❌'} Perplexity (Prioridade 1)")
         st.markdown(f"{'✅' if gemini_key else '❌'} Gemini (Fallback)")
+        st.markdown(f"{'✅' if app.base_offline else '❌'} Base offline da Receita")
         
         st.markdown("---")
         st.markdown("**🐛 Debug**")
         show_logs = st.checkbox("Mostrar logs detalhados", value=False)
+        mostrar_metricas = st.checkbox("📈 Mostrar métricas de desempenho", value=False)
+        
+        max_workers = st.slider(
+            "⚡ Linhas em paralelo",
+            min_value=1, max_value=32, value=8,
+            help="O ritmo de cada API é controlado pelo seu próprio limite de taxa"
+        )
+        tamanho_lote = st.slider(
+            "📦 Empresas por requisição de IA",
+            min_value=1, max_value=50, value=20,
+            help="Empresas sem grupo pelas regras são classificadas juntas ao final; 1 = uma por requisição"
+        )
+        modo_streaming = st.checkbox(
+            "🌊 Modo streaming (arquivos grandes)",
+            value=False,
+            help="Lê e grava a planilha em blocos, sem carregá-la inteira em memória"
+        )
+        executar_em_job = st.checkbox(
+            "🧾 Executar em segundo plano",
+            value=False,
+            help="O processamento continua mesmo se a página for fechada e pode ser retomado após uma queda"
+        )
+        formato_saida = st.selectbox(
+            "Formato de saída",
+            options=list(FORMATOS_SAIDA),
+            disabled=not (modo_streaming or executar_em_job)
+        )
         
         if st.button("🗑️ Limpar cache"):
-            for key in list(st.session_state.keys()):
-                if key.startswith('cnpj_'):
-                    del st.session_state[key]
+            app.cache.limpar()
+            app.cache_classificacao.limpar()
             st.success("Cache limpo!")
             logger.info("Cache limpo manualmente")
         
+        coalescencia = app.metricas_coalescencia()
+        st.caption(
+            "🔗 Chamadas aproveitadas de outra em andamento: "
+            f"{coalescencia['cnpj']['coalescidas']} consultas de CNPJ, "
+            f"{coalescencia['classificacao']['coalescidas']} classificações"
+        )
+        st.caption(
+            f"🕸️ Grafo societário da última execução: {app.metricas.medidor('grafo_societario', tipo='empresas'):.0f} empresas, "
+            f"{app.metricas.medidor('grafo_societario', tipo='componentes_com_grupo'):.0f} componentes com grupo conhecido"
+        )
+        
         st.markdown("---")
         st.markdown("**📋 Como usar:**")
         st.markdown("1. Faça upload da planilha Excel")
@@ -388,15 +397,72 @@ def main():
         
         # Upload do arquivo
         uploaded_file = st.file_uploader(
-            "Escolha um arquivo Excel (.xlsx, .xls)",
-            type=['xlsx', 'xls'],
+            "Escolha um arquivo Excel (.xlsx, .xls) ou CSV",
+            type=['xlsx', 'xls', 'csv'],
             help="Sua planilha deve ter pelo menos uma coluna com CNPJs"
         )
+        arquivo_anterior = st.file_uploader(
+            "🔁 Resultado anterior (opcional)",
+            type=['xlsx', 'csv', 'parquet'],
+            help="Modo incremental: CNPJs que já estão no resultado anterior, e ainda válidos, são copiados sem nova consulta"
+        )
+        
+        if uploaded_file and (modo_streaming or executar_em_job):
+            try:
+                # Só o primeiro bloco é lido para preview e escolha da coluna
+                df_preview = next(ler_em_blocos(uploaded_file, uploaded_file.name, tamanho_bloco=100), pd.DataFrame())
+                uploaded_file.seek(0)
+                st.success(f"✅ Planilha aberta em modo streaming: {len(df_preview.columns)} colunas")
+                
+                with st.expander("👁️ Preview da planilha"):
+                    st.dataframe(df_preview.head())
+                
+                cnpj_column = st.selectbox(
+                    "📋 Selecione a coluna que contém os CNPJs:",
+                    options=df_preview.columns.tolist(),
+                    help="Escolha a coluna com os números de CNPJ"
+                )
+                
+                if executar_em_job and st.button("🚀 Processar em segundo plano", type="primary", use_container_width=True):
+                    gerenciador = obter_gerenciador_jobs()
+                    job_id = gerenciador.criar(
+                        uploaded_file.getvalue(), uploaded_file.name, cnpj_column, formato_saida,
+                        {'max_workers': max_workers, 'tamanho_lote': tamanho_lote},
+                        anterior=(arquivo_anterior.getvalue(), arquivo_anterior.name) if arquivo_anterior else None
+                    )
+                    gerenciador.iniciar(job_id, app, gemini_key, perplexity_key)
+                    st.success(f"✅ Job {job_id} iniciado. Acompanhe o andamento abaixo; pode fechar a página.")
+                
+                if not executar_em_job and st.button("🚀 Processar Planilha", type="primary", use_container_width=True):
+                    nome_saida = f"grupos_economicos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato_saida}"
+                    destino = os.path.join(SAIDAS_DIR, nome_saida)
+                    limpar_saidas_antigas()
+                    os.makedirs(SAIDAS_DIR, exist_ok=True)
+                    
+                    anteriores = carregar_anteriores(arquivo_anterior)
+                    previa = EscritorPrevia(f"{destino}.previa")
+                    with st.spinner("Processando CNPJs em blocos..."):
+                        ao_progredir, limpar_progresso = barra_progresso()
+                        try:
+                            resumo = app.processar_em_blocos(
+                                ler_em_blocos(uploaded_file, uploaded_file.name),
+                                cnpj_column,
+                                EscritorMultiplo([abrir_escritor(destino, formato_saida), previa]),
+                                gemini_key, perplexity_key, max_workers, tamanho_lote,
+                                ao_progredir=ao_progredir, anteriores=anteriores
+                            )
+                        finally:
+                            limpar_progresso()
+                    
+                    guardar_resultado(uploaded_file.file_id, resumo, caminho=destino, formato=formato_saida, previa=previa)
+            except Exception as e:
+                logger.exception("Erro crítico no processamento")
+                st.error(f"❌ Erro ao processar planilha: {e}")
         
-        if uploaded_file:
+        elif uploaded_file:
             try:
                 # Ler planilha
-                df = pd.read_excel(uploaded_file)
+                df = ler_planilha(uploaded_file.file_id, uploaded_file.name, uploaded_file)
                 st.success(f"✅ Planilha carregada: {len(df)} linhas, {len(df.columns)} colunas")
                 logger.info(f"Planilha carregada: {len(df)} linhas")
                 
@@ -413,70 +479,29 @@ def main():
                 
                 # Botão processar
                 if st.button("🚀 Processar Planilha", type="primary", use_container_width=True):
+                    anteriores = carregar_anteriores(arquivo_anterior)
                     
                     with st.spinner("Processando CNPJs..."):
-                        df_resultado = app.processar_planilha(df, cnpj_column, gemini_key, perplexity_key)
-                    
-                    st.success(f"✅ Processamento concluído!")
+                        ao_progredir, limpar_progresso = barra_progresso()
+                        try:
+                            df_resultado = app.processar_planilha(
+                                df, cnpj_column, gemini_key, perplexity_key, max_workers, tamanho_lote,
+                                ao_progredir=ao_progredir, anteriores=anteriores
+                            )
+                        finally:
+                            limpar_progresso()
                     
-                    # Mostrar estatísticas
-                    total_registros = len(df_resultado)
-                    registros_com_erro = df_resultado['erro'].notna().sum()
-                    sucessos = total_registros - registros_com_erro
-                    erros = registros_com_erro
-                    
-                    col_stat1, col_stat2, col_stat3 = st.columns(3)
-                    with col_stat1:
-                        st.metric("Total", len(df_resultado))
-                    with col_stat2:
-                        st.metric("Sucessos", sucessos)
-                    with col_stat3:
-                        st.metric("Erros", erros)
-                    
-                    # Mostrar resultado
-                    st.header("📊 Resultado")
-                    
-                    # Colunas principais para visualização
-                    colunas_principais = ['cnpj_original', 'razao_social', 'grupo_economico', 'confianca']
-                    colunas_disponiveis = [col for col in colunas_principais if col in df_resultado.columns]
-                    
-                    if colunas_disponiveis:
-                        st.dataframe(df_resultado[colunas_disponiveis], use_container_width=True)
-                    
-                    # Gráfico de grupos (se houver sucessos)
-                    if sucessos > 0:
-                        registros_validos = df_resultado[df_resultado['erro'].isna()]
-                        
-                        if len(registros_validos) > 0 and 'grupo_economico' in registros_validos.columns:
-                            grupos_count = registros_validos['grupo_economico'].value_counts()
-                            if len(grupos_count) > 0:
-                                st.subheader("📊 Distribuição por Grupos")
-                                st.bar_chart(grupos_count)
-                    
-                    # Download
-                    st.header("💾 Download")
-                    
-                    # Preparar Excel
-                    buffer = io.BytesIO()
-                    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                        df_resultado.to_excel(writer, index=False, sheet_name='Resultado')
-                    
-                    st.download_button(
-                        label="📥 Baixar Excel com Resultados",
-                        data=buffer.getvalue(),
-                        file_name=f"grupos_economicos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        type="primary",
-                        use_container_width=True
-                    )
-                    
-                    # Detalhes completos
-                    with st.expander("🔍 Ver dados completos"):
-                        st.dataframe(df_resultado, use_container_width=True)
+                    guardar_resultado(uploaded_file.file_id, acumular_resumo(resumo_vazio(), df_resultado), df=df_resultado)
                 
             except Exception as e:
                 logger.exception("Erro crítico no processamento")
                 st.error(f"❌ Erro ao processar planilha: {e}")
+        
+        resultado = st.session_state.get('resultado')
+        if uploaded_file and resultado and resultado['origem'] == uploaded_file.file_id:
+            exibir_resultado(resultado)
+    
+        painel_jobs(obter_gerenciador_jobs(), app, gemini_key, perplexity_key)
     
     with col2:
         st.header("ℹ️ Informações")
@@ -508,14 +533,20 @@ def main():
             st.markdown(f"• {grupo}")
         st.markdown("• E outros...")
     
+    if mostrar_metricas:
+        st.markdown("---")
+        st.header("📈 Métricas de desempenho")
+        painel_metricas(app)
+    
     # Exibir logs se habilitado
     if show_logs:
         st.markdown("---")
         st.header("🐛 Logs de Debug")
         
-        if streamlit_handler.logs:
+        registros = streamlit_handler.registros()
+        if registros:
             # Criar DataFrame com os logs
-            logs_df = pd.DataFrame(streamlit_handler.logs)
+            logs_df = pd.DataFrame(registros)
             
             # Filtros
             col_filter1, col_filter2 = st.columns(2)
@@ -543,7 +574,7 @@ def main():
             
             # Botão para limpar logs
             if st.button("🗑️ Limpar logs"):
-                streamlit_handler.logs.clear()
+                streamlit_handler.limpar()
                 st.rerun()
         else:
             st.info("Nenhum log ainda. Processe uma planilha para ver os logs.")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Base local de CNPJs a partir dos Dados Abertos da Receita Federal
+
+Ingestão (uma vez por mês, quando a Receita publica a base):
+
+    python base_receita.py /caminho/dados_abertos [-o .cache/receita.sqlite3]
+
+O diretório deve conter os arquivos Empresas*, Estabelecimentos* e Cnaes*,
+zipados como distribuídos pela Receita ou já extraídos (CSV ';', latin-1,
+sem cabeçalho). A leitura é em streaming e a gravação em blocos, então a
+memória fica limitada independentemente do tamanho da base.
+"""
+
+import argparse
+import csv
+import io
+import logging
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+
+logger = logging.getLogger('GrupoEconomicoApp')
+
+CAMINHO_PADRAO = os.environ.get('RECEITA_DB_PATH', os.path.join(
+    os.environ.get('GRUPOS_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')),
+    'receita.sqlite3'
+))
+SITUACOES_CADASTRAIS = {1: 'NULA', 2: 'ATIVA', 3: 'SUSPENSA', 4: 'INAPTA', 8: 'BAIXADA'}
+TAMANHO_BLOCO = 50_000
+
+# Prefixos dos arquivos (zip ou CSV extraído) de cada tabela
+ARQUIVOS_TABELAS = {
+    'empresas': ('empresas', 'emprecsv'),
+    'estabelecimentos': ('estabelecimentos', 'estabele'),
+    'cnaes': ('cnaes', 'cnaecsv')
+}
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS empresas (
+        cnpj_basico TEXT NOT NULL,
+        razao_social TEXT
+    );
+    CREATE TABLE IF NOT EXISTS estabelecimentos (
+        cnpj TEXT NOT NULL,
+        nome_fantasia TEXT,
+        situacao INTEGER,
+        cnae INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS cnaes (
+        codigo INTEGER NOT NULL,
+        descricao TEXT
+    );
+"""
+
+# Índices criados só no fim da carga: ordenar uma vez é bem mais rápido que inserir em B-tree aleatoriamente
+INDICES = """
+    CREATE INDEX IF NOT EXISTS idx_empresas_cnpj_basico ON empresas (cnpj_basico);
+    CREATE INDEX IF NOT EXISTS idx_estabelecimentos_cnpj ON estabelecimentos (cnpj);
+    CREATE INDEX IF NOT EXISTS idx_cnaes_codigo ON cnaes (codigo);
+"""
+
+def _ler_csv(caminho: str):
+    """Itera as linhas de um CSV da Receita, ou de cada CSV dentro de um .zip, sem carregar o arquivo"""
+    if zipfile.is_zipfile(caminho):
+        with zipfile.ZipFile(caminho) as zf:
+            for membro in zf.namelist():
+                with zf.open(membro) as f:
+                    yield from csv.reader(io.TextIOWrapper(f, encoding='latin-1', newline=''), delimiter=';')
+    else:
+        with open(caminho, encoding='latin-1', newline='') as f:
+            yield from csv.reader(f, delimiter=';')
+
+def _em_blocos(linhas, tamanho: int = TAMANHO_BLOCO):
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) >= tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+def _inteiro(valor: str):
+    try:
+        return int(valor)
+    except ValueError:
+        return None
+
+def _arquivos_da_tabela(diretorio: str, tabela: str) -> list:
+    prefixos = ARQUIVOS_TABELAS[tabela]
+    return sorted(
+        os.path.join(diretorio, nome) for nome in os.listdir(diretorio)
+        if any(p in nome.lower() for p in prefixos)
+    )
+
+def _linhas_empresas(linhas):
+    for linha in linhas:
+        yield (linha[0], linha[1])
+
+def _linhas_estabelecimentos(linhas):
+    for linha in linhas:
+        yield (linha[0] + linha[1] + linha[2], linha[4], _inteiro(linha[5]), _inteiro(linha[11]))
+
+def _linhas_cnaes(linhas):
+    for linha in linhas:
+        yield (_inteiro(linha[0]), linha[1])
+
+CONVERSORES = {
+    'empresas': (_linhas_empresas, 'INSERT INTO empresas VALUES (?, ?)'),
+    'estabelecimentos': (_linhas_estabelecimentos, 'INSERT INTO estabelecimentos VALUES (?, ?, ?, ?)'),
+    'cnaes': (_linhas_cnaes, 'INSERT INTO cnaes VALUES (?, ?)')
+}
+
+def ingerir(diretorio: str, destino: str, tamanho_bloco: int = TAMANHO_BLOCO) -> dict:
+    """Carrega os arquivos da Receita em uma base SQLite indexada por CNPJ
+
+    A carga é feita em um arquivo temporário e só substitui `destino` ao final,
+    então leitores nunca enxergam uma base pela metade. Retorna a contagem por tabela.
+    """
+    temporario = destino + '.tmp'
+    if os.path.exists(temporario):
+        os.remove(temporario)
+    os.makedirs(os.path.dirname(destino) or '.', exist_ok=True)
+
+    conn = sqlite3.connect(temporario, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-65536')
+    conn.executescript(ESQUEMA)
+
+    contagens = {}
+    inicio = time.monotonic()
+    for tabela, (converter, insert) in CONVERSORES.items():
+        arquivos = _arquivos_da_tabela(diretorio, tabela)
+        if not arquivos:
+            logger.warning(f"Nenhum arquivo de {tabela} encontrado em {diretorio}")
+        contagens[tabela] = 0
+        for arquivo in arquivos:
+            logger.info(f"Ingerindo {tabela}: {os.path.basename(arquivo)}")
+            for bloco in _em_blocos(converter(_ler_csv(arquivo)), tamanho_bloco):
+                conn.execute('BEGIN')
+                conn.executemany(insert, bloco)
+                conn.execute('COMMIT')
+                contagens[tabela] += len(bloco)
+            logger.info(f"{tabela}: {contagens[tabela]} linhas ({time.monotonic() - inicio:.0f}s)")
+
+    logger.info("Criando índices...")
+    conn.executescript(INDICES)
+    conn.execute('ANALYZE')
+    conn.close()
+    os.replace(temporario, destino)
+    logger.info(f"Base offline pronta em {destino} ({time.monotonic() - inicio:.0f}s)")
+    return contagens
+
+class BaseReceita:
+    """Consulta somente leitura à base local gerada por `ingerir`"""
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._local = threading.local()
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(pathlib.Path(self.caminho).resolve().as_uri() + '?mode=ro', uri=True)
+            self._local.conn = conn
+        return conn
+
+    def buscar(self, cnpj: str):
+        """Dados do CNPJ (14 dígitos) no mesmo formato de GrupoEconomicoApp.buscar_cnpj, ou None"""
+        linha = self._conexao().execute(
+            """
+            SELECT e.razao_social, s.nome_fantasia, c.descricao, s.situacao
+            FROM estabelecimentos s
+            LEFT JOIN empresas e ON e.cnpj_basico = substr(s.cnpj, 1, 8)
+            LEFT JOIN cnaes c ON c.codigo = s.cnae
+            WHERE s.cnpj = ?
+            LIMIT 1
+            """,
+            (cnpj,)
+        ).fetchone()
+        if linha is None:
+            return None
+        return {
+            'razao_social': linha[0] or '',
+            'nome_fantasia': linha[1] or '',
+            'atividade': linha[2] or '',
+            'situacao': SITUACOES_CADASTRAIS.get(linha[3], '')
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera a base local de CNPJs a partir dos Dados Abertos da Receita Federal")
+    parser.add_argument('diretorio', help="Diretório com os arquivos Empresas*, Estabelecimentos* e Cnaes*")
+    parser.add_argument('-o', '--saida', default=CAMINHO_PADRAO, help="Arquivo SQLite de saída")
+    parser.add_argument('--bloco', type=int, default=TAMANHO_BLOCO, help="Linhas por transação")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    contagens = ingerir(args.diretorio, args.saida, args.bloco)
+    print(', '.join(f"{tabela}: {n}" for tabela, n in contagens.items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
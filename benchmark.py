@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""Benchmark reprodutível do pipeline, com servidores locais no lugar das APIs
+
+Sobe um processo com imitações de ReceitaWS, BrasilAPI, Perplexity e Gemini
+(latência, taxa de erro e 429 configuráveis), gera planilhas sintéticas com
+taxa de duplicados controlada e roda cada cenário num processo novo, com
+cache vazio, para que o pico de memória e os números sejam comparáveis:
+
+    python benchmark.py                                   # 1k linhas
+    python benchmark.py --linhas 1000 100000 1000000 -o resultados.json
+    python benchmark.py --latencia brasilapi=0.3 --erros 0.05 --taxa-429 0.01
+    python benchmark.py --base resultados_commit_anterior.json
+
+Por linha de planilha, informa linhas/s, latência p50/p99 do processamento de
+cada CNPJ distinto, pico de RSS e chamadas a cada API.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+
+LATENCIAS_PADRAO = {'receitaws': 0.15, 'brasilapi': 0.05, 'perplexity': 0.6, 'gemini': 0.4}
+
+# Nomes com palavras-chave de grupos conhecidos (resolvidos por regras, sem IA)
+NOMES_COM_GRUPO = ['CERVEJARIA BRAHMA', 'VALE MINERACAO', 'PETROBRAS DISTRIBUIDORA', 'BANCO ITAU', 'SEARA ALIMENTOS', 'NATURA COSMETICOS']
+
+def _fracao_do_cnpj(cnpj: str) -> float:
+    """Número determinístico em [0, 1) a partir da raiz, para as filiais terem o mesmo nome"""
+    return zlib.crc32(cnpj[:8].encode()) / 2 ** 32
+
+class ServidorMock(BaseHTTPRequestHandler):
+    """Imitação das APIs; a configuração e os contadores são atributos de classe (um servidor por processo)"""
+    config = {}
+    contadores = {}
+    lock = threading.Lock()
+    aleatorio = random.Random(0)
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _contar(self, provedor: str, status: int):
+        with self.lock:
+            chave = f'{provedor}:{status}'
+            self.contadores[chave] = self.contadores.get(chave, 0) + 1
+
+    def _responder(self, status: int, corpo: dict, headers: dict = None):
+        dados = json.dumps(corpo).encode('utf-8')
+        self.send_response(status)
+        for nome, valor in (headers or {}).items():
+            self.send_header(nome, valor)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _simular(self, provedor: str) -> bool:
+        """Aplica latência, 429 e erro 5xx; retorna False se já respondeu com falha"""
+        with self.lock:
+            sorteio = self.aleatorio.random()
+            jitter = self.aleatorio.uniform(0.5, 1.5)
+        time.sleep(self.config['latencias'].get(provedor, 0) * jitter)
+        if sorteio < self.config['taxa_429']:
+            self._contar(provedor, 429)
+            self._responder(429, {'erro': 'rate limit'}, {'Retry-After': str(self.config['retry_after'])})
+            return False
+        if sorteio < self.config['taxa_429'] + self.config['erros']:
+            self._contar(provedor, 500)
+            self._responder(500, {'erro': 'falha simulada'})
+            return False
+        self._contar(provedor, 200)
+        return True
+
+    @staticmethod
+    def _nome(cnpj: str) -> str:
+        fracao = _fracao_do_cnpj(cnpj)
+        if fracao < ServidorMock.config['fracao_regras']:
+            return f"{NOMES_COM_GRUPO[int(fracao * 1000) % len(NOMES_COM_GRUPO)]} {cnpj[:8]} S.A."
+        return f"EMPRESA {cnpj[:8]} LTDA"
+
+    def _classificar(self, texto: str) -> str:
+        """Resposta de IA: array para prompts em lote (linhas 'cnpj | razão | fantasia'), objeto para os individuais"""
+        cnpjs = re.findall(r'^(\d{14}) \|', texto, re.MULTILINE)
+        if cnpjs:
+            return json.dumps([{'cnpj': c, 'grupo_economico': 'INDEPENDENTE', 'confianca': 70} for c in cnpjs])
+        return '{"grupo_economico": "INDEPENDENTE", "confianca": 60}'
+
+    def do_GET(self):
+        if self.path == '/_estatisticas':
+            with self.lock:
+                return self._responder(200, dict(self.contadores))
+        provedor, _, cnpj = self.path.strip('/').partition('/')
+        if provedor not in ('receitaws', 'brasilapi'):
+            return self._responder(404, {})
+        if not self._simular(provedor):
+            return
+        nome = self._nome(cnpj)
+        if provedor == 'receitaws':
+            return self._responder(200, {
+                'status': 'OK', 'nome': nome, 'fantasia': '',
+                'atividade_principal': [{'text': 'Atividade simulada'}], 'situacao': 'ATIVA'
+            })
+        return self._responder(200, {
+            'razao_social': nome, 'nome_fantasia': '',
+            'cnae_fiscal_descricao': 'Atividade simulada', 'descricao_situacao_cadastral': 'ATIVA'
+        })
+
+    def do_POST(self):
+        corpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path.startswith('/perplexity'):
+            if not self._simular('perplexity'):
+                return
+            texto = corpo['messages'][-1]['content']
+            resposta = self._classificar(texto)
+            return self._responder(200, {
+                'model': corpo.get('model', 'sonar'),
+                'choices': [{'message': {'role': 'assistant', 'content': resposta}}],
+                'usage': {'prompt_tokens': len(texto) // 4, 'completion_tokens': len(resposta) // 4}
+            })
+        if ':generateContent' in self.path:
+            if not self._simular('gemini'):
+                return
+            texto = ' '.join(parte.get('text', '') for c in corpo.get('contents', []) for parte in c.get('parts', []))
+            resposta = self._classificar(texto)
+            return self._responder(200, {
+                'candidates': [{'content': {'parts': [{'text': resposta}], 'role': 'model'}, 'finishReason': 'STOP'}],
+                'usageMetadata': {'promptTokenCount': len(texto) // 4, 'candidatesTokenCount': len(resposta) // 4}
+            })
+        self._responder(404, {})
+
+def _servir_mocks(config: dict, fila):
+    ServidorMock.config = config
+    ServidorMock.aleatorio = random.Random(config['semente'])
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), ServidorMock)
+    servidor.daemon_threads = True
+    fila.put(servidor.server_address[1])
+    servidor.serve_forever()
+
+def iniciar_mocks(config: dict):
+    """Sobe os servidores em outro processo (para não disputar o GIL com o pipeline); retorna (processo, url base)"""
+    contexto = get_context('spawn')
+    fila = contexto.Queue()
+    processo = contexto.Process(target=_servir_mocks, args=(config, fila), daemon=True)
+    processo.start()
+    return processo, f'http://127.0.0.1:{fila.get(timeout=30)}'
+
+def estatisticas_mocks(url_base: str) -> dict:
+    import requests
+
+    return requests.get(f'{url_base}/_estatisticas', timeout=10).json()
+
+def gerar_planilha(caminho: str, linhas: int, duplicados: float = 0.3, invalidos: float = 0.0, semente: int = 0, bloco: int = 100_000) -> int:
+    """CSV com `linhas` CNPJs, dos quais a fração `duplicados` repete CNPJs já presentes; retorna os distintos válidos"""
+    import numpy as np
+    import pandas as pd
+
+    from grupos_economicos import PESOS_DV1, PESOS_DV2
+
+    rng = np.random.default_rng(semente)
+    n_unicos = max(1, round(linhas * (1 - duplicados)))
+    # Raízes distintas e filial 0001..0009, depois os dois dígitos verificadores
+    raizes = rng.choice(10 ** 8, size=n_unicos, replace=False)
+    digitos = np.zeros((n_unicos, 14), dtype=np.int64)
+    for i in range(8):
+        digitos[:, i] = raizes // 10 ** (7 - i) % 10
+    digitos[:, 11] = rng.integers(1, 10, size=n_unicos)
+    for posicao, pesos in ((12, PESOS_DV1), (13, PESOS_DV2)):
+        resto = (digitos[:, :posicao] @ np.array(pesos)) % 11
+        digitos[:, posicao] = np.where(resto < 2, 0, 11 - resto)
+    unicos = np.array([''.join(map(str, linha)) for linha in digitos])
+
+    indices = np.concatenate([np.arange(n_unicos), rng.integers(0, n_unicos, size=linhas - n_unicos)])
+    cnpjs = unicos[rng.permutation(indices)]
+    n_invalidos = int(linhas * invalidos)
+    if n_invalidos:
+        posicoes = rng.choice(linhas, size=n_invalidos, replace=False)
+        cnpjs[posicoes] = [c[:12] + f'{(int(c[12:]) + 1) % 100:02d}' for c in cnpjs[posicoes]]
+    # Metade formatada (XX.XXX.XXX/XXXX-XX), como costuma vir das planilhas
+    formatar = rng.random(linhas) < 0.5
+
+    with open(caminho, 'w', encoding='utf-8', newline='') as f:
+        for inicio in range(0, linhas, bloco):
+            parte = cnpjs[inicio:inicio + bloco]
+            texto = [
+                f'{c[:2]}.{c[2:5]}.{c[5:8]}/{c[8:12]}-{c[12:]}' if fmt else c
+                for c, fmt in zip(parte, formatar[inicio:inicio + bloco])
+            ]
+            pd.DataFrame({'cnpj': texto, 'linha': range(inicio, inicio + len(parte))}).to_csv(f, header=inicio == 0, index=False)
+    return n_unicos
+
+def _executar_cenario(planilha: str, url_base: str, cache_dir: str, parametros: dict) -> dict:
+    """Roda num processo novo: cache vazio e pico de RSS só deste cenário"""
+    os.environ['GRUPOS_CACHE_DIR'] = cache_dir
+    os.environ['RECEITA_DB_PATH'] = os.path.join(cache_dir, 'sem_base_offline.sqlite3')
+    logging.disable(logging.CRITICAL)
+
+    from grupos_economicos import LIMITES_PROVEDORES, GrupoEconomicoApp
+    from planilhas import abrir_escritor, ler_em_blocos
+
+    app = GrupoEconomicoApp(
+        # Os limitadores ficam fora da medida: o ritmo é ditado só pelos servidores
+        limites={provedor: (1e9, 10 ** 6) for provedor in LIMITES_PROVEDORES},
+        urls={
+            'receitaws': f'{url_base}/receitaws/{{cnpj}}',
+            'brasilapi': f'{url_base}/brasilapi/{{cnpj}}',
+            'perplexity': f'{url_base}/perplexity',
+            'gemini': url_base
+        },
+        modo_provedores=parametros['modo_provedores']
+    )
+    inicio = time.perf_counter()
+    resumo = app.processar_em_blocos(
+        ler_em_blocos(planilha, tamanho_bloco=parametros['bloco']), 'cnpj',
+        abrir_escritor(os.path.join(cache_dir, 'resultado.csv')),
+        'benchmark' if parametros['ia'] in ('gemini', 'ambas') else None,
+        'benchmark' if parametros['ia'] in ('perplexity', 'ambas') else None,
+        parametros['workers'], parametros['lote']
+    )
+    segundos = time.perf_counter() - inicio
+
+    linha = json.loads(app.exportar_metricas('json'))['histogramas'].get('linha_segundos', [{}])[0].get('valor', {})
+    return {
+        'segundos': segundos,
+        'linhas': resumo['total'],
+        'erros': resumo['erros'],
+        'p50_ms': linha['p50'] * 1000 if linha.get('p50') is not None else None,
+        'p99_ms': linha['p99'] * 1000 if linha.get('p99') is not None else None,
+        # ru_maxrss é em KiB no Linux e em bytes no macOS
+        'rss_pico_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024),
+        'tokens_ia': app.metricas.valor('ia_tokens_total'),
+        'custo_ia_usd': app.metricas.valor('ia_custo_usd_total')
+    }
+
+def _commit_atual() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def rodar_cenario(linhas: int, url_base: str, args) -> dict:
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as diretorio:
+        planilha = os.path.join(diretorio, 'entrada.csv')
+        distintos = gerar_planilha(planilha, linhas, args.duplicados, args.invalidos, args.semente)
+        parametros = {
+            'workers': args.workers, 'lote': args.lote, 'bloco': args.bloco,
+            'ia': args.ia, 'modo_provedores': args.modo_provedores
+        }
+        antes = estatisticas_mocks(url_base)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            resultado = executor.submit(_executar_cenario, planilha, url_base, os.path.join(diretorio, 'cache'), parametros).result()
+        depois = estatisticas_mocks(url_base)
+
+    chamadas = {}
+    for chave, n in depois.items():
+        provedor = chave.split(':')[0]
+        chamadas[provedor] = chamadas.get(provedor, 0) + n - antes.get(chave, 0)
+    return {
+        'commit': _commit_atual(),
+        'linhas': linhas,
+        'duplicados': args.duplicados,
+        'distintos': distintos,
+        **parametros,
+        **resultado,
+        'linhas_por_s': resultado['linhas'] / resultado['segundos'] if resultado['segundos'] else None,
+        'chamadas_por_linha': {provedor: n / linhas for provedor, n in sorted(chamadas.items())},
+        'respostas': {chave: n - antes.get(chave, 0) for chave, n in sorted(depois.items())}
+    }
+
+def _formatar(valor, casas: int = 1) -> str:
+    return '-' if valor is None else f'{valor:,.{casas}f}'
+
+def imprimir(resultados: list, base: list = None):
+    anteriores = {(r['linhas'], r['duplicados']): r for r in base or []}
+    print(f"{'linhas':>10} {'dup':>5} {'linhas/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8}  chamadas/linha")
+    for r in resultados:
+        chamadas = ', '.join(f'{p}={n:.3f}' for p, n in r['chamadas_por_linha'].items() if n)
+        print(
+            f"{r['linhas']:>10,} {r['duplicados']:>5.0%} {_formatar(r['linhas_por_s']):>10} {_formatar(r['p50_ms']):>8} "
+            f"{_formatar(r['p99_ms']):>8} {_formatar(r['rss_pico_mb']):>8}  {chamadas}"
+        )
+        anterior = anteriores.get((r['linhas'], r['duplicados']))
+        if anterior and anterior.get('linhas_por_s'):
+            variacao = r['linhas_por_s'] / anterior['linhas_por_s'] - 1
+            print(f"{'':>10} vs {anterior.get('commit') or 'base'}: {variacao:+.1%} linhas/s, RSS {r['rss_pico_mb'] - anterior['rss_pico_mb']:+.1f} MB")
+
+def _latencias(pares: list) -> dict:
+    latencias = dict(LATENCIAS_PADRAO)
+    for par in pares or []:
+        provedor, _, valor = par.partition('=')
+        latencias[provedor] = float(valor)
+    return latencias
+
+def main(argv=None):
+    from provedores import MODOS
+
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline com APIs simuladas localmente")
+    parser.add_argument('--linhas', type=int, nargs='+', default=[1_000], help="Tamanhos de planilha (ex.: 1000 100000 1000000)")
+    parser.add_argument('--duplicados', type=float, default=0.3, help="Fração de linhas que repetem um CNPJ já presente")
+    parser.add_argument('--invalidos', type=float, default=0.0, help="Fração de linhas com dígito verificador errado")
+    parser.add_argument('--latencia', nargs='*', metavar='PROVEDOR=SEGUNDOS', help=f"Latência média por API (padrão: {LATENCIAS_PADRAO})")
+    parser.add_argument('--erros', type=float, default=0.0, help="Fração de respostas HTTP 500")
+    parser.add_argument('--taxa-429', type=float, default=0.0, help="Fração de respostas HTTP 429")
+    parser.add_argument('--retry-after', type=float, default=1, help="Retry-After das respostas 429, em segundos")
+    parser.add_argument('--fracao-regras', type=float, default=0.3, help="Fração de empresas com nome de grupo conhecido")
+    parser.add_argument('--ia', choices=('perplexity', 'gemini', 'ambas', 'nenhuma'), default='perplexity')
+    parser.add_argument('-w', '--workers', type=int, default=16)
+    parser.add_argument('-l', '--lote', type=int, default=20)
+    parser.add_argument('-b', '--bloco', type=int, default=5_000)
+    parser.add_argument('-m', '--modo-provedores', choices=MODOS, default='sequencial')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('-o', '--saida', help="Grava os resultados em JSON")
+    parser.add_argument('--base', help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args(argv)
+
+    processo, url_base = iniciar_mocks({
+        'latencias': _latencias(args.latencia),
+        'erros': args.erros,
+        'taxa_429': args.taxa_429,
+        'retry_after': args.retry_after,
+        'fracao_regras': args.fracao_regras,
+        'semente': args.semente
+    })
+    try:
+        resultados = []
+        for linhas in args.linhas:
+            print(f"Cenário: {linhas:,} linhas, {args.duplicados:.0%} duplicados...", file=sys.stderr)
+            resultados.append(rodar_cenario(linhas, url_base, args))
+    finally:
+        processo.terminate()
+
+    base = None
+    if args.base:
+        with open(args.base, encoding='utf-8') as f:
+            base = json.load(f)
+    imprimir(resultados, base)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
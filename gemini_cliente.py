@@ -0,0 +1,117 @@
+"""Cliente do Gemini compartilhado por todas as classificações
+
+O SDK é configurado uma vez por processo (de novo só se a chave ou o
+endpoint mudarem), os GenerativeModel ficam em cache e cada modelo tem um
+disjuntor: depois de falhas seguidas ele fica de fora por um tempo e a
+geração vai direto para o próximo modelo da lista. Respostas podem ser
+pedidas em modo JSON (response_mime_type), sem garimpar o objeto no texto.
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from http_cliente import Disjuntor
+
+logger = logging.getLogger('GrupoEconomicoApp')
+
+# Em ordem de preferência
+MODELOS = ('gemini-2.5-flash', 'gemini-2.5-pro')
+
+_configuracao = None
+_lock_configuracao = threading.Lock()
+
+def configurar(api_key: str, endpoint: str = ''):
+    """Configura o SDK (global no processo) só quando a chave ou o endpoint mudam; retorna o módulo genai"""
+    global _configuracao
+    import google.generativeai as genai
+
+    with _lock_configuracao:
+        if _configuracao != (api_key, endpoint):
+            if endpoint:
+                # Endpoint próprio (ex.: servidor local de teste) só funciona com o transporte REST
+                genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': endpoint})
+            else:
+                genai.configure(api_key=api_key)
+            _configuracao = (api_key, endpoint)
+            logger.debug("SDK do Gemini configurado")
+        return genai, _configuracao
+
+class ClienteGemini:
+    """Modelos do Gemini com handles reaproveitados, disjuntor por modelo e geração em paralelo
+
+    `ao_usar(modelo, tokens_entrada, tokens_saida)` é chamado a cada resposta,
+    para a contabilidade de tokens e custo.
+    """
+    def __init__(self, modelos=MODELOS, endpoint: str = '', limitador=None, ao_usar=None,
+                 falhas_para_resfriar: int = 2, resfriamento: float = 300, max_paralelo: int = 4):
+        self.modelos = tuple(modelos)
+        self.endpoint = endpoint
+        self.limitador = limitador
+        self.ao_usar = ao_usar
+        self.disjuntores = {modelo: Disjuntor(falhas_para_resfriar, resfriamento) for modelo in self.modelos}
+        self._handles = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_paralelo, thread_name_prefix='gemini')
+
+    def _handle(self, api_key: str, modelo: str, modo_json: bool):
+        genai, configuracao = configurar(api_key, self.endpoint)
+        # O GenerativeModel guarda o cliente da configuração em que foi usado pela primeira vez
+        chave = (modelo, modo_json, configuracao)
+        with self._lock:
+            handle = self._handles.get(chave)
+            if handle is None:
+                self._handles = {k: h for k, h in self._handles.items() if k[2] == configuracao}
+                handle = self._handles[chave] = genai.GenerativeModel(
+                    modelo, generation_config={'response_mime_type': 'application/json'} if modo_json else None
+                )
+            return handle
+
+    def ordem(self) -> list:
+        """Modelos fora do resfriamento, na ordem configurada; se todos estiverem resfriando, o que volta primeiro"""
+        disponiveis = [modelo for modelo in self.modelos if self.disjuntores[modelo].permitir()]
+        return disponiveis or [min(self.modelos, key=lambda modelo: self.disjuntores[modelo].aberto_ate)]
+
+    def gerar(self, prompt: str, api_key: str, modo_json: bool = False):
+        """Gera texto com o primeiro modelo saudável que responder; retorna (texto, modelo) ou (None, None)"""
+        for modelo in self.ordem():
+            disjuntor = self.disjuntores[modelo]
+            try:
+                handle = self._handle(api_key, modelo, modo_json)
+                if self.limitador is not None:
+                    self.limitador.adquirir()
+                logger.debug(f"Enviando prompt para Gemini ({modelo})...")
+                response = handle.generate_content(prompt)
+                texto = response.text
+            except Exception as e:
+                disjuntor.registrar_falha()
+                logger.error(f"Erro com modelo {modelo}: {str(e)}")
+                continue
+
+            disjuntor.registrar_sucesso()
+            if self.ao_usar is not None:
+                uso = getattr(response, 'usage_metadata', None)
+                self.ao_usar(modelo, getattr(uso, 'prompt_token_count', 0) or 0, getattr(uso, 'candidates_token_count', 0) or 0)
+            logger.debug(f"Resposta do Gemini: {texto[:200]}...")
+            return texto, modelo
+
+        return None, None
+
+    def gerar_json(self, prompt: str, api_key: str):
+        """Gera em modo JSON e decodifica; retorna (objeto, modelo) ou (None, modelo) se a resposta não for JSON"""
+        texto, modelo = self.gerar(prompt, api_key, modo_json=True)
+        if texto is None:
+            return None, None
+        try:
+            return json.loads(texto), modelo
+        except ValueError:
+            logger.warning(f"Gemini ({modelo}) não retornou JSON válido")
+            return None, modelo
+
+    def gerar_varios(self, prompts: list, api_key: str, modo_json: bool = False) -> list:
+        """gerar() para vários prompts em paralelo (até max_paralelo), na ordem dos prompts"""
+        return list(self._executor.map(lambda prompt: self.gerar(prompt, api_key, modo_json), prompts))
+
+    def saude(self) -> dict:
+        return {modelo: self.disjuntores[modelo].permitir() for modelo in self.modelos}
@@ -0,0 +1,1730 @@
+#!/usr/bin/env python3
+"""Motor de identificação de grupos econômicos, sem dependência do Streamlit
+
+Uso como biblioteca:
+
+    from grupos_economicos import GrupoEconomicoApp
+    app = GrupoEconomicoApp()
+    df_resultado = app.processar_planilha(df, 'cnpj', ao_progredir=print)
+
+Uso pela linha de comando (chaves em GEMINI_API_KEY / PERPLEXITY_API_KEY):
+
+    python -m grupos_economicos planilha.xlsx -o resultado.parquet
+
+pandas e o SDK do Gemini só são importados quando realmente usados, para que
+workers e tarefas agendadas iniciem rápido.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from base_receita import BaseReceita, CAMINHO_PADRAO as RECEITA_DB_PATH
+from gemini_cliente import ClienteGemini
+from http_cliente import ClienteHTTP
+from metricas import Metricas
+from provedores import MODOS as MODOS_PROVEDORES, EstrategiaProvedores, ProvedorBrasilAPI, ProvedorReceitaWS
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger('GrupoEconomicoApp')
+
+# Dicionário de grupos e palavras-chave (JSON {"GRUPO": ["keyword", ...]} ou CSV grupo,keyword)
+GRUPOS_PATH = os.environ.get('GRUPOS_CONHECIDOS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grupos_conhecidos.json'))
+
+def carregar_grupos(caminho: str) -> dict:
+    """Carrega o dicionário de grupos de um arquivo JSON ou CSV"""
+    if caminho.lower().endswith('.csv'):
+        grupos = {}
+        with open(caminho, newline='', encoding='utf-8') as f:
+            for linha in csv.DictReader(f):
+                grupos.setdefault(linha['grupo'].strip(), []).append(linha['keyword'].strip())
+    else:
+        with open(caminho, encoding='utf-8') as f:
+            grupos = json.load(f)
+    logger.info(f"Dicionário de grupos carregado de {caminho}: {len(grupos)} grupos, {sum(len(k) for k in grupos.values())} keywords")
+    return grupos
+
+# Limites por provedor: (requisições por minuto, rajada máxima)
+LIMITES_PROVEDORES = {
+    'receitaws': (3, 3),
+    'brasilapi': (60, 5),
+    'perplexity': (50, 5),
+    'gemini': (60, 5)
+}
+
+# Endpoints (sobrescrevíveis por ambiente, ex.: servidores locais de teste) e conexões por host
+URLS_PROVEDORES = {
+    'receitaws': os.environ.get('RECEITAWS_URL', 'https://www.receitaws.com.br/v1/cnpj/{cnpj}'),
+    'brasilapi': os.environ.get('BRASILAPI_URL', 'https://brasilapi.com.br/api/cnpj/v1/{cnpj}'),
+    'perplexity': os.environ.get('PERPLEXITY_URL', 'https://api.perplexity.ai/chat/completions'),
+    # Vazio = endpoint padrão do SDK; preenchido, o SDK usa REST nesse host (ex.: http://127.0.0.1:8080)
+    'gemini': os.environ.get('GEMINI_URL', '')
+}
+POOLS_PROVEDORES = {
+    'receitaws': 4,
+    'brasilapi': 16,
+    'perplexity': 8
+}
+
+# Preço das IAs em US$ por milhão de tokens (entrada, saída), para a estimativa de custo
+PRECOS_IA = {
+    'sonar': (1.00, 1.00),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-pro': (1.25, 10.00)
+}
+
+# Como consultar as fontes de CNPJ: sequencial, hedged ou corrida (ver provedores.py)
+MODO_PROVEDORES = os.environ.get('MODO_PROVEDORES', 'sequencial')
+
+# Colunas do resultado, nesta ordem, antes das colunas originais (original_<col>)
+COLUNAS_RESULTADO = [
+    'cnpj_original', 'erro', 'cnpj', 'razao_social', 'nome_fantasia',
+    'grupo_economico', 'confianca', 'metodo_analise', 'atividade', 'situacao', 'processado_em'
+]
+
+class LimitadorTaxa:
+    """Token bucket thread-safe para limitar a taxa de chamadas a um provedor"""
+    def __init__(self, por_minuto: float, rajada: int = 1):
+        self.taxa = por_minuto / 60.0
+        self.capacidade = max(1, rajada)
+        self.tokens = float(self.capacidade)
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def adquirir(self, timeout: float = None) -> bool:
+        """Consome um token, esperando até `timeout` segundos (None = sem limite)"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                agora = time.monotonic()
+                self.tokens = min(self.capacidade, self.tokens + (agora - self.ultimo) * self.taxa)
+                self.ultimo = agora
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                espera = (1 - self.tokens) / self.taxa
+            
+            if limite is not None:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                espera = min(espera, restante)
+            time.sleep(espera)
+
+class _Voo:
+    """Uma chamada em andamento e o resultado que será entregue a todos que a aguardam"""
+    __slots__ = ('concluido', 'resultado', 'erro')
+    
+    def __init__(self):
+        self.concluido = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+class Coalescedor:
+    """Single-flight: chamadas simultâneas com a mesma chave esperam uma única execução e recebem o mesmo resultado
+    
+    Só agrupa chamadas que se sobrepõem no tempo; depois que a execução
+    termina, a próxima chamada executa de novo (o cache é que evita repetição).
+    """
+    def __init__(self):
+        self._voos = {}
+        self._lock = threading.Lock()
+        self.executadas = 0
+        self.coalescidas = 0
+    
+    def executar(self, chave, funcao, *args, **kwargs):
+        with self._lock:
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = _Voo()
+                self.executadas += 1
+            else:
+                self.coalescidas += 1
+        
+        if not lider:
+            voo.concluido.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.resultado
+        
+        try:
+            voo.resultado = funcao(*args, **kwargs)
+            return voo.resultado
+        except Exception as e:
+            voo.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._voos[chave]
+            voo.concluido.set()
+    
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                'executadas': self.executadas,
+                'coalescidas': self.coalescidas,
+                'em_andamento': len(self._voos)
+            }
+
+# Cache persistente de CNPJs (compartilhado entre sessões e processos)
+CACHE_DIR = os.environ.get('GRUPOS_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+DIA = 24 * 3600
+TTL_CAMPOS_CNPJ = {
+    'razao_social': 180 * DIA,
+    'nome_fantasia': 90 * DIA,
+    'atividade': 90 * DIA,
+    'situacao': 7 * DIA,
+    'qsa': 90 * DIA
+}
+# Campos guardados como JSON e que podem faltar (entradas gravadas antes de existirem, base offline sem QSA)
+CAMPOS_JSON_CNPJ = {'qsa'}
+TTL_NAO_ENCONTRADO = 1 * DIA
+TTL_CLASSIFICACAO = 90 * DIA
+NAO_ENCONTRADO = object()
+
+# Prompts das IAs (fazem parte da versão do cache de classificação)
+PROMPT_SISTEMA_PERPLEXITY = "Você é um assistente especializado em identificar grupos econômicos brasileiros. Responda APENAS com JSON no formato: {\"grupo_economico\": \"NOME_DO_GRUPO\", \"confianca\": 85}"
+
+PROMPT_PERPLEXITY = """Identifique o grupo econômico desta empresa brasileira:
+Razão Social: {razao}
+Nome Fantasia: {fantasia}
+
+Grupos conhecidos: {grupos}
+
+Se a empresa pertence a algum desses grupos ou você tem certeza de outro grupo econômico relevante, informe. Se for independente ou você não tiver certeza, retorne "INDEPENDENTE".
+
+Responda APENAS com JSON válido."""
+
+PROMPT_GEMINI = """
+Identifique o grupo econômico da empresa brasileira:
+Razão Social: {razao}
+Nome Fantasia: {fantasia}
+
+Grupos conhecidos: {grupos}
+
+Busque por similaridade, mesmo que o nome não seja exatamente igual. Busque relações óbvias ou históricas, como "Ambev" para "Brahma" ou "Skol". Use o CNPJ para contexto se necessário, mas não dependa dele. qualquer empresa que não se encaixe em grupos conhecidos deve ser classificada como "INDEPENDENTE", mas apenas em último caso.
+
+Responda APENAS com JSON válido:
+{{"grupo_economico": "NOME_GRUPO ou INDEPENDENTE", "confianca": 80}}
+"""
+
+PROMPT_SISTEMA_LOTE = "Você é um assistente especializado em identificar grupos econômicos brasileiros. Responda APENAS com um array JSON, um objeto por empresa."
+
+PROMPT_LOTE = """Identifique o grupo econômico de cada empresa brasileira abaixo.
+
+Grupos conhecidos: {grupos}
+
+Empresas (cnpj | razão social | nome fantasia):
+{empresas}
+
+Se a empresa pertence a algum desses grupos ou você tem certeza de outro grupo econômico relevante, informe. Se for independente ou você não tiver certeza, use "INDEPENDENTE".
+
+Responda APENAS com um array JSON válido, com um objeto para cada cnpj listado:
+[{{"cnpj": "00000000000000", "grupo_economico": "NOME_GRUPO ou INDEPENDENTE", "confianca": 80}}]"""
+
+def _linha_lote(empresa: dict) -> str:
+    return f"{empresa['cnpj']} | {empresa.get('razao_social', '')} | {empresa.get('nome_fantasia', '')}"
+
+def _extrair_itens_json(texto: str) -> list:
+    """Extrai os objetos de uma resposta em array JSON, aproveitando o que der de respostas truncadas"""
+    array_match = re.search(r'\[.*\]', texto, re.DOTALL)
+    if array_match:
+        try:
+            itens = json.loads(array_match.group())
+            return [item for item in itens if isinstance(item, dict)]
+        except ValueError:
+            pass
+    
+    itens = []
+    for obj_match in re.finditer(r'\{[^{}]*\}', texto):
+        try:
+            itens.append(json.loads(obj_match.group()))
+        except ValueError:
+            continue
+    return itens
+
+def normalizar_nome(nome: str) -> str:
+    """Minúsculas, sem acentos e sem pontuação, com espaços colapsados"""
+    sem_acento = unicodedata.normalize('NFKD', nome or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', sem_acento.lower()).split())
+
+PESOS_DV1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+PESOS_DV2 = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+
+def normalizar_cnpjs(valores) -> pd.DataFrame:
+    """Limpa e valida uma coluna inteira de CNPJs de uma vez
+    
+    Remove a pontuação, devolve os zeros à esquerda que o Excel tira de
+    números (inclusive '7526557000100.0') e confere os dois dígitos
+    verificadores (módulo 11). Retorna, no índice da entrada, as colunas
+    'original' (texto da célula), 'cnpj' (14 dígitos, só quando válido) e
+    'erro' (None quando válido).
+    """
+    import numpy as np
+    import pandas as pd
+    
+    valores = valores if isinstance(valores, pd.Series) else pd.Series(list(valores), dtype=object)
+    original = valores.astype(str).str.strip()
+    
+    # Célula numérica: só dígitos (com '.0' de float) perdeu os zeros à esquerda; texto com pontuação não é completado
+    numerico = original.str.fullmatch(r'\d+(?:\.0+)?')
+    digitos = original.str.replace(r'\D', '', regex=True)
+    digitos = digitos.where(~numerico, original.str.replace(r'\.0+$', '', regex=True).str.zfill(14))
+    
+    tamanho_ok = digitos.str.len() == 14
+    dv_ok = pd.Series(False, index=valores.index)
+    if tamanho_ok.any():
+        candidatos = digitos[tamanho_ok]
+        d = np.frombuffer(''.join(candidatos).encode('ascii'), dtype=np.uint8).reshape(-1, 14).astype(np.int64) - 48
+        resto1 = (d[:, :12] @ np.array(PESOS_DV1)) % 11
+        dv1 = np.where(resto1 < 2, 0, 11 - resto1)
+        resto2 = (d[:, :13] @ np.array(PESOS_DV2)) % 11
+        dv2 = np.where(resto2 < 2, 0, 11 - resto2)
+        # Sequências repetidas (00000000000000, 11111111111111...) passam no módulo 11 mas não existem
+        repetido = (d == d[:, :1]).all(axis=1)
+        dv_ok[tamanho_ok] = (d[:, 12] == dv1) & (d[:, 13] == dv2) & ~repetido
+    
+    erro = pd.Series(None, index=valores.index, dtype=object)
+    erro[~tamanho_ok] = 'CNPJ inválido'
+    erro[tamanho_ok & ~dv_ok] = 'CNPJ inválido (dígito verificador)'
+    return pd.DataFrame({'original': original, 'cnpj': digitos.where(dv_ok), 'erro': erro}, index=valores.index)
+
+def carregar_resultado_anterior(origem, nome: str = None, validade: float = TTL_CLASSIFICACAO) -> dict:
+    """Lê um resultado anterior (.xlsx, .csv ou .parquet) e devolve {cnpj: resultado} das linhas reaproveitáveis
+    
+    Ficam de fora linhas com erro, sem grupo, classificadas pelo fallback
+    'Padrão' ou processadas há mais de `validade` segundos. Linhas sem
+    'processado_em' (arquivos de versões anteriores) valem como processadas agora.
+    """
+    import pandas as pd
+    from planilhas import ler_em_blocos
+    
+    limite = pd.Timestamp.now() - pd.Timedelta(seconds=validade)
+    anteriores = {}
+    for bloco in ler_em_blocos(origem, nome):
+        faltando = {'cnpj', 'grupo_economico', 'confianca', 'metodo_analise'} - set(bloco.columns)
+        if faltando:
+            raise ValueError(f"O resultado anterior não tem as colunas: {', '.join(sorted(faltando))}")
+        
+        bloco = bloco.reindex(columns=COLUNAS_RESULTADO).replace('', None)
+        bloco['cnpj'] = normalizar_cnpjs(bloco['cnpj'].fillna(''))['cnpj']
+        bloco['confianca'] = pd.to_numeric(bloco['confianca'], errors='coerce')
+        processado_em = pd.to_datetime(bloco['processado_em'], errors='coerce')
+        validas = (
+            bloco['cnpj'].notna() & bloco['erro'].isna() & bloco['grupo_economico'].notna()
+            & (bloco['metodo_analise'] != 'Padrão') & (processado_em.isna() | (processado_em >= limite))
+        )
+        for linha in bloco[validas].astype(object).where(bloco[validas].notna(), None).to_dict('records'):
+            if linha['confianca'] is not None and float(linha['confianca']).is_integer():
+                linha['confianca'] = int(linha['confianca'])
+            # Sem data, a linha passa a contar a validade a partir de agora
+            linha['processado_em'] = linha['processado_em'] or time.strftime('%Y-%m-%d')
+            anteriores[linha['cnpj']] = linha
+    
+    logger.info(f"Resultado anterior: {len(anteriores)} CNPJs reaproveitáveis")
+    return anteriores
+
+def _regex_trie(palavras) -> str:
+    """Monta uma alternância fatorada por prefixos (trie), evitando testar cada palavra em cada posição"""
+    trie = {}
+    for palavra in palavras:
+        no = trie
+        for ch in palavra:
+            no = no.setdefault(ch, {})
+        no[''] = {}
+    
+    def montar(no):
+        ramos = [re.escape(ch) + montar(filho) for ch, filho in sorted(no.items()) if ch]
+        if not ramos:
+            return ''
+        opcional = '' in no
+        if len(ramos) == 1 and not opcional:
+            return ramos[0]
+        return '(?:' + '|'.join(ramos) + ')' + ('?' if opcional else '')
+    
+    return montar(trie)
+
+class MatcherGrupos:
+    """Palavras-chave dos grupos compiladas em uma única regex sobre nomes normalizados
+    
+    A busca ignora acentos, maiúsculas e pontuação. Por padrão a keyword pode
+    estar dentro de uma palavra, como na regra original ("itau" casa com
+    "ITAUCARD" e "ITAUSA"); com palavra_inteira=True só palavras inteiras
+    contam ("vale" deixa de casar com "valença", mas "itau" também deixa de
+    casar com "itaucard").
+    """
+    def __init__(self, grupos: dict, palavra_inteira: bool = False):
+        self.grupos_por_keyword = {}
+        for grupo, keywords in grupos.items():
+            for keyword in keywords:
+                keyword_norm = normalizar_nome(keyword)
+                if keyword_norm and grupo not in self.grupos_por_keyword.get(keyword_norm, []):
+                    self.grupos_por_keyword.setdefault(keyword_norm, []).append(grupo)
+        
+        alternativas = _regex_trie(self.grupos_por_keyword)
+        self.palavra_inteira = palavra_inteira
+        if palavra_inteira:
+            self.padrao = rf'(?<![a-z0-9])(?:{alternativas})(?![a-z0-9])'
+        else:
+            self.padrao = f'(?:{alternativas})'
+        self.regex = re.compile(self.padrao) if self.grupos_por_keyword else None
+        # O lookahead não consome o texto: acha a keyword mais longa em cada posição, mesmo dentro de outra
+        self.regex_sobreposta = re.compile(f'(?=({self.padrao}))') if self.grupos_por_keyword else None
+    
+    def encontrar(self, texto: str) -> list:
+        """Todos os grupos encontrados no texto, com a keyword e a posição no texto normalizado
+        
+        Keywords sobrepostas também contam ("bradesco" dentro de "bradesco
+        seguros", "luiza" dentro de "magazine luiza"). A lista vem por posição
+        e, na mesma posição, da keyword mais longa para a mais curta.
+        """
+        if self.regex is None:
+            return []
+        normalizado = normalizar_nome(texto)
+        encontrados = []
+        for m in self.regex_sobreposta.finditer(normalizado):
+            inicio = m.start()
+            # Keywords mais curtas que começam na mesma posição são prefixos da mais longa
+            for fim in range(m.end(1), inicio, -1):
+                keyword = normalizado[inicio:fim]
+                if keyword not in self.grupos_por_keyword:
+                    continue
+                if self.palavra_inteira and fim < len(normalizado) and normalizado[fim] != ' ':
+                    continue
+                encontrados.extend(
+                    {'grupo': grupo, 'keyword': keyword, 'inicio': inicio, 'fim': fim}
+                    for grupo in self.grupos_por_keyword[keyword]
+                )
+        return encontrados
+    
+    def classificar_serie(self, nomes: pd.Series) -> pd.DataFrame:
+        """Classifica uma Series de nomes de uma vez: primeiro grupo e keyword por linha (NaN sem match)
+        
+        "Primeiro" é o mesmo de encontrar(): a keyword mais longa na posição mais à esquerda.
+        """
+        import pandas as pd
+        
+        if self.regex is None:
+            return pd.DataFrame({'grupo': None, 'keyword': None}, index=nomes.index)
+        normalizados = (
+            nomes.fillna('').astype(str)
+            .str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.lower()
+            .str.replace(r'[^a-z0-9]+', ' ', regex=True)
+            .str.split().str.join(' ')
+        )
+        keywords = normalizados.str.extract(f'({self.padrao})', expand=False)
+        grupos = keywords.map(lambda kw: self.grupos_por_keyword[kw][0], na_action='ignore')
+        return pd.DataFrame({'grupo': grupos, 'keyword': keywords}, index=nomes.index)
+
+# Similaridade aproximada: acima do limiar, o grupo é aceito sem consultar IA
+LIMIAR_SIMILARIDADE = float(os.environ.get('LIMIAR_SIMILARIDADE', '0.8'))
+
+# Sufixos societários removidos do fim da razão social (já normalizada: "S/A" vira "s a")
+SUFIXOS_SOCIETARIOS = re.compile(r'(?:\s+(?:ltda|limitada|eireli|epp|mei|me|ss|s a|sa|em recuperacao judicial))+$')
+PALAVRAS_VAZIAS = {'de', 'da', 'do', 'das', 'dos', 'e'}
+ABREVIACOES = {
+    'cia': 'companhia',
+    'bras': 'brasileira',
+    'bco': 'banco',
+    'ind': 'industria',
+    'inds': 'industrias',
+    'com': 'comercio',
+    'dist': 'distribuidora',
+    'distrib': 'distribuidora',
+    'part': 'participacoes',
+    'participacoe': 'participacoes',
+    'adm': 'administracao',
+    'emp': 'empreendimentos',
+    'serv': 'servicos',
+    'servs': 'servicos',
+    'nac': 'nacional',
+    'intl': 'internacional',
+    'mag': 'magazine'
+}
+
+# Palavras (já expandidas) comuns a empresas de qualquer grupo: pesam pouco na similaridade,
+# senão "CIA BRASILEIRA DE DISTRIBUICAO" e "CIA BRASILEIRA DE ALUMINIO" se parecem só por "companhia brasileira"
+PALAVRAS_GENERICAS = {
+    'companhia', 'brasileira', 'brasileiro', 'brasil', 'nacional', 'internacional', 'grupo', 'holding',
+    'sociedade', 'empresa', 'empresas', 'comercio', 'comercial', 'industria', 'industrias', 'industrial',
+    'distribuidora', 'distribuicao', 'participacoes', 'administracao', 'empreendimentos', 'servicos',
+    'banco', 'produtos', 'alimentos', 'bebidas', 'transportes', 'importacao', 'exportacao'
+}
+PESO_PALAVRA_GENERICA = 0.2
+# Apelidos com menos caracteres que isso (ou sem nenhuma palavra distintiva) têm n-gramas demais em comum com qualquer nome
+MIN_CARACTERES_SIMILARIDADE = 4
+
+def normalizar_razao(nome: str) -> str:
+    """normalizar_nome sem sufixos societários (LTDA, S.A., EIRELI...) e preposições, com abreviações expandidas"""
+    nome = SUFIXOS_SOCIETARIOS.sub('', normalizar_nome(nome))
+    return ' '.join(ABREVIACOES.get(t, t) for t in nome.split() if t not in PALAVRAS_VAZIAS)
+
+def termos_distintivos(nome: str) -> list:
+    """Palavras de normalizar_razao que identificam a empresa, sem as PALAVRAS_GENERICAS"""
+    return [t for t in normalizar_razao(nome).split() if t not in PALAVRAS_GENERICAS]
+
+class IndiceSimilaridade:
+    """Índice invertido de n-gramas de caracteres sobre os apelidos dos grupos (nome do grupo + keywords)
+    
+    Nomes e apelidos são comparados depois de normalizar_razao (abreviações
+    expandidas), com os n-gramas das PALAVRAS_GENERICAS valendo
+    PESO_PALAVRA_GENERICA: "companhia", "brasileira", "distribuidora"... ajudam
+    a confirmar um apelido que as contém, mas sozinhas não casam nada. A
+    pontuação é o coeficiente de Dice ponderado entre os n-gramas do apelido
+    e os de cada janela de palavras do nome com tamanho parecido, de modo que
+    "CERVEJARIA ANHEUSSER LTDA" compare "anheusser" com "anheuser" e não o
+    nome inteiro. Só apelidos que compartilham n-gramas suficientes com o
+    nome para alcançar o limiar chegam a ser pontuados.
+    """
+    def __init__(self, grupos: dict, n: int = 3, limiar: float = LIMIAR_SIMILARIDADE):
+        self.n = n
+        self.limiar = limiar
+        self.apelidos = []
+        self.indice = {}
+        vistos = set()
+        for grupo, keywords in grupos.items():
+            for apelido in [grupo, *keywords]:
+                tokens = normalizar_razao(apelido).split()
+                apelido_norm = ' '.join(tokens)
+                if (len(apelido_norm.replace(' ', '')) < MIN_CARACTERES_SIMILARIDADE
+                        or not any(t not in PALAVRAS_GENERICAS for t in tokens)
+                        or (grupo, apelido_norm) in vistos):
+                    continue
+                vistos.add((grupo, apelido_norm))
+                ngramas = self._ngramas(tokens)
+                for ngrama, peso in ngramas.items():
+                    self.indice.setdefault(ngrama, []).append((len(self.apelidos), peso))
+                self.apelidos.append((grupo, apelido_norm, len(tokens), ngramas, sum(ngramas.values())))
+    
+    def _ngramas(self, tokens: list) -> dict:
+        """{n-grama: peso}, com o peso da palavra mais distintiva que o n-grama toca"""
+        texto = f" {' '.join(tokens)} "
+        pesos = [0.0]
+        for t in tokens:
+            pesos += [PESO_PALAVRA_GENERICA if t in PALAVRAS_GENERICAS else 1.0] * len(t) + [0.0]
+        ngramas = {}
+        for i in range(max(1, len(texto) - self.n + 1)):
+            ngrama = texto[i:i + self.n]
+            ngramas[ngrama] = max(ngramas.get(ngrama, 0.0), max(pesos[i:i + self.n]))
+        return ngramas
+    
+    def pontuar(self, nome: str):
+        """Melhor (grupo, apelido, pontuação) para o nome; (None, None, 0.0) sem candidatos"""
+        melhor = (None, None, 0.0)
+        tokens = normalizar_razao(nome).split()
+        if not any(t not in PALAVRAS_GENERICAS for t in tokens):
+            return melhor
+        
+        compartilhados = {}
+        for ngrama, peso in self._ngramas(tokens).items():
+            for i, peso_apelido in self.indice.get(ngrama, ()):
+                compartilhados[i] = compartilhados.get(i, 0.0) + min(peso, peso_apelido)
+        
+        janelas = {}
+        for i, c in compartilhados.items():
+            grupo, apelido, palavras, ngramas, total = self.apelidos[i]
+            # Limite superior do Dice com peso c em comum; abaixo do limiar nem compara
+            if 2 * c / (total + c) < self.limiar:
+                continue
+            for k in range(max(1, palavras - 1), min(len(tokens), palavras + 1) + 1):
+                for inicio in range(len(tokens) - k + 1):
+                    chave = (inicio, k)
+                    if chave not in janelas:
+                        janela = self._ngramas(tokens[inicio:inicio + k])
+                        janelas[chave] = (janela, sum(janela.values()))
+                    janela, total_janela = janelas[chave]
+                    comum = sum(min(peso, ngramas[ngrama]) for ngrama, peso in janela.items() if ngrama in ngramas)
+                    pontuacao = 2 * comum / (total_janela + total)
+                    if pontuacao > melhor[2]:
+                        melhor = (grupo, apelido, pontuacao)
+        return melhor
+    
+    def pontuar_em_massa(self, nomes) -> list:
+        """pontuar() para vários nomes, calculando cada nome distinto uma vez"""
+        calculados = {}
+        resultados = []
+        for nome in nomes:
+            if nome not in calculados:
+                calculados[nome] = self.pontuar(nome)
+            resultados.append(calculados[nome])
+        return resultados
+
+# Sócio sem documento (ReceitaWS) só vira ligação quando o nome é claramente de pessoa jurídica.
+# "S/A" e "S.A." (normalizados "s a") só contam no fim do nome; "sa" solto é o sobrenome Sá
+NOME_PESSOA_JURIDICA = re.compile(r'(?<![a-z0-9])(?:ltda|limitada|eireli|cia|companhia|participacoes|holding|empreendimentos)(?![a-z0-9])|(?<![a-z0-9])s a$')
+
+class UniaoBusca:
+    """Union-find com compressão de caminho e união por tamanho"""
+    def __init__(self):
+        self.pai = {}
+        self.tamanho = {}
+    
+    def encontrar(self, no):
+        if no not in self.pai:
+            self.pai[no] = no
+            self.tamanho[no] = 1
+            return no
+        while self.pai[no] != no:
+            self.pai[no] = self.pai[self.pai[no]]
+            no = self.pai[no]
+        return no
+    
+    def unir(self, a, b):
+        """Junta os conjuntos de a e b; retorna (raiz que ficou, raiz absorvida) ou None se já estavam juntos"""
+        raiz_a, raiz_b = self.encontrar(a), self.encontrar(b)
+        if raiz_a == raiz_b:
+            return None
+        if self.tamanho[raiz_a] < self.tamanho[raiz_b]:
+            raiz_a, raiz_b = raiz_b, raiz_a
+        self.pai[raiz_b] = raiz_a
+        self.tamanho[raiz_a] += self.tamanho.pop(raiz_b)
+        return raiz_a, raiz_b
+
+class GrafoSocietario:
+    """Componentes conexos de empresas ligadas por raiz de CNPJ ou por sócio pessoa jurídica em comum
+    
+    Os nós são raízes de CNPJ ('raiz:12345678') e nomes normalizados de
+    pessoas jurídicas ('nome:...'): cada empresa liga sua raiz ao próprio
+    nome e à raiz (ou ao nome, sem documento) de cada sócio PJ. Sócios pessoa
+    física não ligam empresas. O grafo cresce a cada CNPJ consultado na execução, e o
+    grupo conhecido de um membro vale para o componente inteiro.
+    """
+    def __init__(self):
+        self._uniao = UniaoBusca()
+        self._grupos = {}
+        self._cnpjs = set()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def ligacoes(empresa_data: dict) -> list:
+        """Nós ligados à raiz da empresa: o próprio nome e seus sócios pessoa jurídica"""
+        nos = []
+        razao = normalizar_nome(empresa_data.get('razao_social', ''))
+        if razao:
+            nos.append(f'nome:{razao}')
+        for socio in empresa_data.get('qsa') or []:
+            documento = socio.get('documento')
+            nome = normalizar_nome(socio.get('nome', ''))
+            if documento:
+                nos.append(f'raiz:{documento[:8]}')
+            elif NOME_PESSOA_JURIDICA.search(nome):
+                nos.append(f'nome:{nome}')
+        return nos
+    
+    def adicionar(self, cnpj: str, empresa_data: dict):
+        raiz = f'raiz:{cnpj[:8]}'
+        ligacoes = self.ligacoes(empresa_data)
+        with self._lock:
+            self._cnpjs.add(cnpj)
+            self._uniao.encontrar(raiz)
+            for no in ligacoes:
+                self._unir(raiz, no)
+    
+    def _unir(self, a, b):
+        unidos = self._uniao.unir(a, b)
+        if unidos is None:
+            return
+        raiz, absorvida = unidos
+        grupo_absorvido = self._grupos.pop(absorvida, None)
+        grupo = self._grupos.get(raiz)
+        if grupo_absorvido and (grupo is None or self._prioridade(grupo_absorvido) > self._prioridade(grupo)):
+            if grupo is not None and grupo['grupo_economico'] != grupo_absorvido['grupo_economico']:
+                logger.debug(f"Grafo societário liga {grupo['grupo_economico']} e {grupo_absorvido['grupo_economico']}; mantendo o de maior confiança")
+            self._grupos[raiz] = grupo_absorvido
+    
+    @staticmethod
+    def _prioridade(grupo_info: dict):
+        # Empate de confiança decidido pelo nome: o grupo do componente não depende da ordem das empresas
+        return grupo_info['confianca'], grupo_info['grupo_economico']
+    
+    def definir_grupo(self, cnpj: str, grupo_info: dict):
+        """Registra o grupo de uma empresa; INDEPENDENTE e o fallback padrão não dizem nada sobre o componente"""
+        if grupo_info['grupo_economico'] == 'INDEPENDENTE' or grupo_info['metodo'] in ('Padrão', 'QSA'):
+            return
+        with self._lock:
+            raiz = self._uniao.encontrar(f'raiz:{cnpj[:8]}')
+            atual = self._grupos.get(raiz)
+            if atual is None or self._prioridade(grupo_info) > self._prioridade(atual):
+                self._grupos[raiz] = grupo_info
+    
+    def grupo(self, cnpj: str):
+        """Grupo conhecido do componente da empresa, ou None"""
+        with self._lock:
+            return self._grupos.get(self._uniao.encontrar(f'raiz:{cnpj[:8]}'))
+    
+    def componente(self, cnpj: str):
+        """Identificador do componente da empresa (muda quando componentes se juntam)"""
+        with self._lock:
+            return self._uniao.encontrar(f'raiz:{cnpj[:8]}')
+    
+    def componentes(self) -> dict:
+        """{identificador: [cnpjs]} das empresas adicionadas"""
+        saida = {}
+        with self._lock:
+            for cnpj in self._cnpjs:
+                saida.setdefault(self._uniao.encontrar(f'raiz:{cnpj[:8]}'), []).append(cnpj)
+        return saida
+    
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                'empresas': len(self._cnpjs),
+                'nos': len(self._uniao.pai),
+                'componentes_com_grupo': len(self._grupos)
+            }
+
+class CacheSQLite:
+    """Base dos caches SQLite: conexão por thread e transações com lock de escrita"""
+    def __init__(self, caminho: str, esquema: str):
+        self.caminho = caminho
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+        self._conexao().executescript(esquema)
+    
+    def _conexao(self):
+        """Conexão por thread; WAL permite leitores e um escritor simultâneos entre processos"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    @contextmanager
+    def _transacao(self):
+        conn = self._conexao()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+class CacheCNPJ(CacheSQLite):
+    """Cache SQLite de consultas de CNPJ com TTL por campo e despejo LRU
+    
+    Cada campo vence no seu próprio prazo e o registro dura até o campo mais
+    longo vencer. `obter` devolve só os campos ainda válidos: com algum campo
+    vencido (ver `vencidos`), quem consulta busca os dados de novo e pode usar
+    os campos válidos se nenhuma fonte responder.
+    """
+    def __init__(self, caminho: str = None, ttl_campos: dict = None, ttl_nao_encontrado: float = TTL_NAO_ENCONTRADO, max_entradas: int = 200_000):
+        self.ttl_campos = {**TTL_CAMPOS_CNPJ, **(ttl_campos or {})}
+        self.ttl_nao_encontrado = ttl_nao_encontrado
+        self.max_entradas = max_entradas
+        self._escritas = 0
+        super().__init__(caminho or os.path.join(CACHE_DIR, 'cnpj_cache.sqlite3'), """
+            CREATE TABLE IF NOT EXISTS cnpj_campos (
+                cnpj TEXT NOT NULL,
+                campo TEXT NOT NULL,
+                valor TEXT,
+                expira_em REAL NOT NULL,
+                PRIMARY KEY (cnpj, campo)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS cnpj_acesso (
+                cnpj TEXT PRIMARY KEY,
+                nao_encontrado INTEGER NOT NULL DEFAULT 0,
+                expira_em REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_cnpj_acesso_lru ON cnpj_acesso (ultimo_acesso);
+        """)
+    
+    def obter(self, cnpj: str):
+        """Retorna os campos ainda válidos em cache, NAO_ENCONTRADO para negativos válidos ou None se expirado/ausente"""
+        conn = self._conexao()
+        agora = time.time()
+        entrada = conn.execute(
+            'SELECT nao_encontrado, expira_em FROM cnpj_acesso WHERE cnpj = ?', (cnpj,)
+        ).fetchone()
+        if entrada is None or entrada[1] <= agora:
+            return None
+        
+        if entrada[0]:
+            dados = NAO_ENCONTRADO
+        else:
+            campos = conn.execute(
+                'SELECT campo, valor FROM cnpj_campos WHERE cnpj = ? AND expira_em > ?', (cnpj, agora)
+            ).fetchall()
+            dados = dict(campos)
+            if not dados:
+                return None
+            for campo in CAMPOS_JSON_CNPJ & dados.keys():
+                dados[campo] = json.loads(dados[campo])
+        
+        conn.execute('UPDATE cnpj_acesso SET ultimo_acesso = ? WHERE cnpj = ?', (agora, cnpj))
+        return dados
+    
+    def vencidos(self, dados: dict) -> list:
+        """Campos obrigatórios que faltam em dados devolvidos por `obter` (vencidos antes do resto)"""
+        return [campo for campo in self.ttl_campos if campo not in CAMPOS_JSON_CNPJ and campo not in dados]
+    
+    def salvar(self, cnpj: str, dados: dict):
+        """Grava os campos do CNPJ, cada um com seu próprio TTL"""
+        agora = time.time()
+        linhas = [
+            (cnpj, campo, json.dumps(dados.get(campo) or [], ensure_ascii=False) if campo in CAMPOS_JSON_CNPJ else dados.get(campo, ''), agora + ttl)
+            for campo, ttl in self.ttl_campos.items()
+        ]
+        self._gravar(cnpj, linhas, False, agora + max(self.ttl_campos.values()), agora)
+    
+    def salvar_nao_encontrado(self, cnpj: str):
+        """Grava um resultado negativo com TTL curto"""
+        agora = time.time()
+        self._gravar(cnpj, [], True, agora + self.ttl_nao_encontrado, agora)
+    
+    def _gravar(self, cnpj, linhas, nao_encontrado, expira_em, agora):
+        with self._transacao() as conn:
+            conn.execute('DELETE FROM cnpj_campos WHERE cnpj = ?', (cnpj,))
+            conn.executemany('INSERT INTO cnpj_campos VALUES (?, ?, ?, ?)', linhas)
+            conn.execute(
+                'INSERT OR REPLACE INTO cnpj_acesso VALUES (?, ?, ?, ?)',
+                (cnpj, int(nao_encontrado), expira_em, agora)
+            )
+        
+        self._escritas += 1
+        if self._escritas % 500 == 0:
+            self.despejar()
+    
+    def despejar(self):
+        """Remove expirados e, acima de max_entradas, os CNPJs acessados há mais tempo"""
+        with self._transacao() as conn:
+            agora = time.time()
+            conn.execute('DELETE FROM cnpj_acesso WHERE expira_em <= ?', (agora,))
+            conn.execute('DELETE FROM cnpj_campos WHERE expira_em <= ?', (agora,))
+            conn.execute(
+                'DELETE FROM cnpj_acesso WHERE cnpj IN ('
+                ' SELECT cnpj FROM cnpj_acesso ORDER BY ultimo_acesso DESC LIMIT -1 OFFSET ?)',
+                (self.max_entradas,)
+            )
+            conn.execute('DELETE FROM cnpj_campos WHERE cnpj NOT IN (SELECT cnpj FROM cnpj_acesso)')
+    
+    def limpar(self):
+        """Apaga todo o cache"""
+        with self._transacao() as conn:
+            conn.execute('DELETE FROM cnpj_campos')
+            conn.execute('DELETE FROM cnpj_acesso')
+    
+    def __len__(self):
+        return self._conexao().execute('SELECT COUNT(*) FROM cnpj_acesso').fetchone()[0]
+
+class CacheClassificacao(CacheSQLite):
+    """Cache de grupos identificados por IA, por raiz do CNPJ e por nome normalizado
+    
+    Entradas de outra versão (hash dos grupos conhecidos e dos prompts) são
+    descartadas. Um LRU em memória atende repetições sem tocar no SQLite.
+    """
+    def __init__(self, versao: str, caminho: str = None, ttl: float = TTL_CLASSIFICACAO, max_entradas: int = 100_000, max_memoria: int = 20_000):
+        self.versao = versao
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.max_memoria = max_memoria
+        self._memoria = OrderedDict()
+        self._lock_memoria = threading.Lock()
+        super().__init__(caminho or os.path.join(CACHE_DIR, 'classificacao_cache.sqlite3'), """
+            CREATE TABLE IF NOT EXISTS classificacao (
+                chave TEXT PRIMARY KEY,
+                versao TEXT NOT NULL,
+                grupo_economico TEXT NOT NULL,
+                confianca INTEGER,
+                metodo TEXT NOT NULL,
+                expira_em REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_classificacao_lru ON classificacao (ultimo_acesso);
+        """)
+        with self._transacao() as conn:
+            removidas = conn.execute('DELETE FROM classificacao WHERE versao != ?', (versao,)).rowcount
+        if removidas:
+            logger.info(f"Cache de classificação: {removidas} entradas de versões anteriores descartadas")
+    
+    @staticmethod
+    def chaves(empresa_data: dict, cnpj: str = None):
+        """Chaves de busca: raiz do CNPJ (8 dígitos) e razão social + nome fantasia normalizados"""
+        chaves = []
+        if cnpj:
+            chaves.append(f"raiz:{cnpj[:8]}")
+        nome = f"{normalizar_nome(empresa_data.get('razao_social', ''))}|{normalizar_nome(empresa_data.get('nome_fantasia', ''))}"
+        if nome != '|':
+            chaves.append(f"nome:{nome}")
+        return chaves
+    
+    def _lembrar(self, chave, resultado, expira_em):
+        with self._lock_memoria:
+            self._memoria[chave] = (resultado, expira_em)
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+    
+    def obter(self, chaves: list):
+        """Retorna a classificação da primeira chave encontrada ou None"""
+        agora = time.time()
+        with self._lock_memoria:
+            for chave in chaves:
+                item = self._memoria.get(chave)
+                if item and item[1] > agora:
+                    self._memoria.move_to_end(chave)
+                    return dict(item[0])
+        
+        conn = self._conexao()
+        for chave in chaves:
+            linha = conn.execute(
+                'SELECT grupo_economico, confianca, metodo, expira_em FROM classificacao'
+                ' WHERE chave = ? AND versao = ? AND expira_em > ?',
+                (chave, self.versao, agora)
+            ).fetchone()
+            if linha:
+                conn.execute('UPDATE classificacao SET ultimo_acesso = ? WHERE chave = ?', (agora, chave))
+                resultado = {'grupo_economico': linha[0], 'confianca': linha[1], 'metodo': linha[2]}
+                for c in chaves:
+                    self._lembrar(c, resultado, linha[3])
+                return dict(resultado)
+        return None
+    
+    def salvar(self, chaves: list, resultado: dict):
+        """Grava a classificação sob todas as chaves"""
+        agora = time.time()
+        expira_em = agora + self.ttl
+        with self._transacao() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO classificacao VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (chave, self.versao, resultado['grupo_economico'], resultado['confianca'], resultado['metodo'], expira_em, agora)
+                    for chave in chaves
+                ]
+            )
+            conn.execute(
+                'DELETE FROM classificacao WHERE chave IN ('
+                ' SELECT chave FROM classificacao ORDER BY ultimo_acesso DESC LIMIT -1 OFFSET ?)',
+                (self.max_entradas,)
+            )
+        for chave in chaves:
+            self._lembrar(chave, resultado, expira_em)
+    
+    def limpar(self):
+        """Apaga todo o cache"""
+        with self._lock_memoria:
+            self._memoria.clear()
+        with self._transacao() as conn:
+            conn.execute('DELETE FROM classificacao')
+
+class GrupoEconomicoApp:
+    def __init__(self, grupos: dict = None, limites: dict = None, cache: CacheCNPJ = None, cache_classificacao: CacheClassificacao = None, base_offline: BaseReceita = None, urls: dict = None, http: ClienteHTTP = None, provedores_cnpj: list = None, modo_provedores: str = None, metricas: Metricas = None, limiar_similaridade: float = LIMIAR_SIMILARIDADE):
+        self.grupos_conhecidos = grupos if grupos is not None else carregar_grupos(GRUPOS_PATH)
+        self.limites = {**LIMITES_PROVEDORES, **(limites or {})}
+        self.limitadores = {
+            provedor: LimitadorTaxa(por_minuto, rajada)
+            for provedor, (por_minuto, rajada) in self.limites.items()
+        }
+        self.urls = {**URLS_PROVEDORES, **(urls or {})}
+        self.metricas = metricas if metricas is not None else Metricas()
+        self.http = http or ClienteHTTP(pools={
+            '{0.scheme}://{0.netloc}/'.format(urlsplit(self.urls[provedor])): tamanho
+            for provedor, tamanho in POOLS_PROVEDORES.items()
+        }, metricas=self.metricas)
+        # Fontes de CNPJ na ordem de preferência inicial; outras fontes implementam provedores.ProvedorCNPJ
+        self.gemini = ClienteGemini(
+            endpoint=self.urls['gemini'], limitador=self.limitadores['gemini'],
+            ao_usar=lambda modelo, entrada, saida: self.registrar_uso_ia('gemini', modelo, entrada, saida)
+        )
+        self.estrategia = EstrategiaProvedores(
+            provedores_cnpj or [ProvedorReceitaWS(self.urls['receitaws']), ProvedorBrasilAPI(self.urls['brasilapi'])],
+            self.http, self.limitadores, modo_provedores or MODO_PROVEDORES, metricas=self.metricas
+        )
+        # Lista de grupos dos prompts, montada uma vez
+        self.lista_grupos = str(list(self.grupos_conhecidos.keys()))
+        self.matcher = MatcherGrupos(self.grupos_conhecidos)
+        self.similaridade = IndiceSimilaridade(self.grupos_conhecidos, limiar=limiar_similaridade)
+        self.cache = cache if cache is not None else CacheCNPJ()
+        self.cache_classificacao = cache_classificacao or CacheClassificacao(self.versao_classificacao())
+        # Base local da Receita (gerada por base_receita.py), consultada antes das APIs
+        if base_offline is None and os.path.exists(RECEITA_DB_PATH):
+            base_offline = BaseReceita(RECEITA_DB_PATH)
+        self.base_offline = base_offline
+        # Consultas e classificações idênticas em andamento (de qualquer sessão ou worker) viram uma só
+        self.coalescedores = {'cnpj': Coalescedor(), 'classificacao': Coalescedor()}
+        logger.info(f"App inicializado com {len(self.grupos_conhecidos)} grupos conhecidos")
+    
+    def versao_classificacao(self) -> str:
+        """Hash dos grupos conhecidos e dos prompts; muda quando qualquer um deles muda"""
+        conteudo = json.dumps(
+            [self.grupos_conhecidos, PROMPT_SISTEMA_PERPLEXITY, PROMPT_PERPLEXITY, PROMPT_GEMINI, PROMPT_SISTEMA_LOTE, PROMPT_LOTE],
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()[:16]
+    
+    def metricas_coalescencia(self) -> dict:
+        """Execuções e chamadas aproveitadas de outra em andamento, por tipo"""
+        return {tipo: coalescedor.metricas() for tipo, coalescedor in self.coalescedores.items()}
+    
+    def exportar_metricas(self, formato: str = 'json') -> str:
+        """Todas as métricas (etapas, fontes, caches, IAs e coalescência) em 'json' ou 'prometheus'"""
+        for tipo, valores in self.metricas_coalescencia().items():
+            for resultado in ('executadas', 'coalescidas'):
+                self.metricas.definir('coalescencia_chamadas', valores[resultado], tipo=tipo, resultado=resultado)
+        for modelo, disponivel in self.gemini.saude().items():
+            self.metricas.definir('gemini_modelo_disponivel', int(disponivel), modelo=modelo)
+        if formato == 'prometheus':
+            return self.metricas.para_prometheus()
+        return self.metricas.para_json()
+    
+    def registrar_uso_ia(self, provedor: str, modelo: str, tokens_entrada: int, tokens_saida: int):
+        """Soma tokens e custo estimado (PRECOS_IA) de uma resposta de IA"""
+        self.metricas.contar('ia_requisicoes_total', provedor=provedor, modelo=modelo)
+        self.metricas.contar('ia_tokens_total', tokens_entrada, provedor=provedor, modelo=modelo, tipo='entrada')
+        self.metricas.contar('ia_tokens_total', tokens_saida, provedor=provedor, modelo=modelo, tipo='saida')
+        preco_entrada, preco_saida = PRECOS_IA.get(modelo, (0.0, 0.0))
+        custo = (tokens_entrada * preco_entrada + tokens_saida * preco_saida) / 1_000_000
+        self.metricas.contar('ia_custo_usd_total', custo, provedor=provedor, modelo=modelo)
+    
+    def buscar_cnpj(self, cnpj: str):
+        """Busca dados do CNPJ em APIs públicas; buscas simultâneas do mesmo CNPJ compartilham uma requisição"""
+        cnpj_limpo = re.sub(r'\D', '', cnpj)
+        return self.coalescedores['cnpj'].executar(cnpj_limpo, self._buscar_cnpj, cnpj_limpo)
+    
+    def _buscar_cnpj(self, cnpj_limpo: str):
+        logger.debug(f"Buscando CNPJ: {cnpj_limpo}")
+        
+        # Cache persistente
+        with self.metricas.cronometrar('cache'):
+            em_cache = self.cache.obter(cnpj_limpo)
+        if em_cache is NAO_ENCONTRADO:
+            self.metricas.contar('cache_total', cache='cnpj', resultado='negativo')
+            logger.debug(f"CNPJ {cnpj_limpo} marcado como não encontrado no cache")
+            return None
+        vencidos = self.cache.vencidos(em_cache) if em_cache is not None else None
+        if vencidos == []:
+            self.metricas.contar('cache_total', cache='cnpj', resultado='acerto')
+            logger.debug(f"CNPJ {cnpj_limpo} encontrado no cache")
+            return em_cache
+        self.metricas.contar('cache_total', cache='cnpj', resultado='vencido' if vencidos else 'falta')
+        
+        # Base offline da Receita
+        if self.base_offline is not None:
+            try:
+                with self.metricas.cronometrar('base_offline'):
+                    result = self.base_offline.buscar(cnpj_limpo)
+                self.metricas.contar('cache_total', cache='base_offline', resultado='acerto' if result else 'falta')
+                if result:
+                    logger.info(f"✅ Dados encontrados (base offline): {result['razao_social']}")
+                    return result
+            except Exception as e:
+                logger.error(f"Erro ao consultar base offline: {str(e)}")
+        
+        # APIs públicas, na ordem e com o paralelismo da estratégia configurada
+        with self.metricas.cronometrar('http'):
+            result, nao_encontrado = self.estrategia.buscar(cnpj_limpo)
+        if result:
+            self.cache.salvar(cnpj_limpo, result)
+            return result
+        
+        logger.warning(f"❌ Nenhuma API retornou dados para CNPJ {cnpj_limpo}")
+        # Só cacheia negativo quando alguma API afirmou que o CNPJ não existe (não em falhas de rede)
+        if nao_encontrado:
+            self.cache.salvar_nao_encontrado(cnpj_limpo)
+        elif vencidos and 'razao_social' in em_cache:
+            # Sem resposta das fontes: os campos ainda válidos bastam para classificar; os vencidos ficam em branco
+            logger.warning(f"Usando dados em cache do CNPJ {cnpj_limpo} sem {', '.join(vencidos)} (vencidos)")
+            return {**{campo: '' for campo in vencidos}, **em_cache}
+        return None
+    
+    def _completar_perplexity(self, mensagens: list, perplexity_key: str, max_tokens: int = 200, timeout: float = 15):
+        """Envia mensagens ao Perplexity e retorna o texto da resposta (None em erro)"""
+        headers = {
+            "Authorization": f"Bearer {perplexity_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": "sonar",
+            "messages": mensagens,
+            "temperature": 0.2,
+            "max_tokens": max_tokens
+        }
+        
+        self.limitadores['perplexity'].adquirir()
+        response = self.http.post(
+            'perplexity',
+            self.urls['perplexity'],
+            json=payload,
+            headers=headers,
+            timeout=timeout
+        )
+        
+        logger.debug(f"Perplexity status: {response.status_code}")
+        
+        if response.status_code != 200:
+            logger.error(f"Erro Perplexity: {response.status_code} - {response.text[:200]}")
+            return None
+        
+        data = response.json()
+        uso = data.get('usage') or {}
+        self.registrar_uso_ia('perplexity', data.get('model') or payload['model'], uso.get('prompt_tokens', 0), uso.get('completion_tokens', 0))
+        content = data.get('choices', [{}])[0].get('message', {}).get('content', '')
+        logger.debug(f"Resposta Perplexity: {content[:200]}...")
+        return content
+    
+    def buscar_perplexity(self, empresa_data: dict, perplexity_key: str):
+        """Busca informações sobre grupo econômico via Perplexity API"""
+        try:
+            logger.debug("Tentando Perplexity API...")
+            
+            content = self._completar_perplexity([
+                {
+                    "role": "system",
+                    "content": PROMPT_SISTEMA_PERPLEXITY
+                },
+                {
+                    "role": "user",
+                    "content": PROMPT_PERPLEXITY.format(
+                        razao=empresa_data.get('razao_social', ''),
+                        fantasia=empresa_data.get('nome_fantasia', ''),
+                        grupos=self.lista_grupos
+                    )
+                }
+            ], perplexity_key)
+            
+            if content is not None:
+                # Tentar extrair JSON
+                json_match = re.search(r'\{.*?\}', content, re.DOTALL)
+                if json_match:
+                    result = json.loads(json_match.group())
+                    grupo = result.get('grupo_economico', 'INDEPENDENTE')
+                    confianca = result.get('confianca', 75)
+                    
+                    logger.info(f"✅ Grupo identificado por Perplexity: {grupo} ({confianca}%)")
+                    return {
+                        'grupo_economico': grupo,
+                        'confianca': confianca,
+                        'metodo': 'Perplexity'
+                    }
+                else:
+                    logger.warning("Perplexity não retornou JSON válido")
+        except Exception as e:
+            logger.error(f"Erro ao usar Perplexity: {str(e)}")
+        
+        return None
+    
+    def identificar_grupo_local(self, empresa_data: dict, cnpj: str = None):
+        """Identifica o grupo sem chamar IA: regras e cache de classificação (None se não resolver)"""
+        razao = empresa_data.get('razao_social', '').lower()
+        fantasia = empresa_data.get('nome_fantasia', '').lower()
+        
+        logger.debug(f"Identificando grupo para: {razao} / {fantasia}")
+        
+        # Análise por regras (sempre funciona)
+        with self.metricas.cronometrar('regras'):
+            matches = self.matcher.encontrar(razao) or self.matcher.encontrar(fantasia)
+        if matches:
+            grupo, keyword = matches[0]['grupo'], matches[0]['keyword']
+            logger.info(f"✅ Grupo identificado por regras: {grupo} (keyword: {keyword})")
+            return {
+                'grupo_economico': grupo,
+                'confianca': 85,
+                'metodo': 'Regras'
+            }
+        
+        # Classificações anteriores por IA (filiais da mesma raiz ou mesmo nome)
+        with self.metricas.cronometrar('cache_classificacao'):
+            em_cache = self.cache_classificacao.obter(CacheClassificacao.chaves(empresa_data, cnpj))
+        self.metricas.contar('cache_total', cache='classificacao', resultado='acerto' if em_cache else 'falta')
+        if em_cache:
+            logger.info(f"✅ Grupo encontrado no cache de classificação: {em_cache['grupo_economico']} (via {em_cache['metodo']})")
+            return em_cache
+        
+        return None
+    
+    def _resultado_similaridade(self, pontuacao: tuple):
+        """Resultado de classificação para um (grupo, apelido, pontuação) acima do limiar, senão None"""
+        grupo, apelido, valor = pontuacao
+        self.metricas.contar('similaridade_total', resultado='aceito' if valor >= self.similaridade.limiar else 'abaixo')
+        if valor < self.similaridade.limiar:
+            return None
+        logger.info(f"✅ Grupo identificado por similaridade: {grupo} (apelido: {apelido}, {valor:.2f})")
+        return {
+            'grupo_economico': grupo,
+            'confianca': round(85 * valor),
+            'metodo': 'Similaridade'
+        }
+    
+    def identificar_por_similaridade(self, empresa_data: dict):
+        """Compara razão social e nome fantasia com os apelidos dos grupos (None abaixo do limiar)"""
+        with self.metricas.cronometrar('similaridade'):
+            pontuacao = max(
+                self.similaridade.pontuar_em_massa([empresa_data.get('razao_social', ''), empresa_data.get('nome_fantasia', '')]),
+                key=lambda p: p[2]
+            )
+        return self._resultado_similaridade(pontuacao)
+    
+    def _similaridade_em_massa(self, empresas: list) -> list:
+        """Resultado de similaridade (ou None) de cada empresa, pontuando os nomes distintos de uma vez"""
+        with self.metricas.cronometrar('similaridade'):
+            pontuacoes = self.similaridade.pontuar_em_massa(
+                [empresa.get(campo, '') for empresa in empresas for campo in ('razao_social', 'nome_fantasia')]
+            )
+        return [
+            self._resultado_similaridade(max(pontuacoes[2 * i:2 * i + 2], key=lambda p: p[2]))
+            for i in range(len(empresas))
+        ]
+    
+    def identificar_por_grafo(self, cnpj: str, grafo: GrafoSocietario):
+        """Grupo já conhecido de outra empresa do mesmo componente societário (None se não houver)"""
+        grupo_info = grafo.grupo(cnpj)
+        if grupo_info is None:
+            return None
+        self.metricas.contar('grafo_total', resultado='propagado')
+        logger.info(f"✅ Grupo identificado pelo grafo societário: {grupo_info['grupo_economico']}")
+        return {
+            'grupo_economico': grupo_info['grupo_economico'],
+            'confianca': grupo_info['confianca'],
+            'metodo': 'QSA'
+        }
+    
+    def identificar_grupo(self, empresa_data: dict, gemini_key: str = None, perplexity_key: str = None, cnpj: str = None, grafo: GrafoSocietario = None):
+        """Identifica grupo econômico (com `grafo`, também pelo grafo societário da execução)"""
+        resultado = (
+            self.identificar_grupo_local(empresa_data, cnpj)
+            or self.identificar_por_similaridade(empresa_data)
+            or (self.identificar_por_grafo(cnpj, grafo) if cnpj and grafo is not None else None)
+        )
+        return resultado or self.identificar_por_ia(empresa_data, gemini_key, perplexity_key, cnpj)
+    
+    def identificar_por_ia(self, empresa_data: dict, gemini_key: str = None, perplexity_key: str = None, cnpj: str = None):
+        """Classifica uma empresa por IA (Perplexity, depois Gemini), com cache e sem chamadas repetidas em paralelo"""
+        chaves_cache = CacheClassificacao.chaves(empresa_data, cnpj)
+        # Mesmo nome (ou mesma raiz, sem nome) sendo classificado em paralelo: espera a mesma resposta da IA
+        with self.metricas.cronometrar('ia'):
+            return self.coalescedores['classificacao'].executar(
+                chaves_cache[-1] if chaves_cache else id(empresa_data),
+                self._identificar_grupo_ia, empresa_data, gemini_key, perplexity_key, chaves_cache
+            )
+    
+    def _identificar_grupo_ia(self, empresa_data: dict, gemini_key: str, perplexity_key: str, chaves_cache: list):
+        logger.debug("Nenhum grupo identificado por regras, tentando AI...")
+        
+        # PRIORIDADE 1: Perplexity (mais confiável para pesquisa)
+        if perplexity_key:
+            resultado = self.buscar_perplexity(empresa_data, perplexity_key)
+            if resultado:
+                self.cache_classificacao.salvar(chaves_cache, resultado)
+                return resultado
+        else:
+            logger.warning("Chave do Perplexity não fornecida")
+        
+        # PRIORIDADE 2: Gemini (fallback)
+        if gemini_key:
+            try:
+                logger.debug("Tentando Gemini API...")
+                result, modelo = self.gemini.gerar_json(
+                    PROMPT_GEMINI.format(
+                        razao=empresa_data.get('razao_social', ''),
+                        fantasia=empresa_data.get('nome_fantasia', ''),
+                        grupos=self.lista_grupos
+                    ),
+                    gemini_key
+                )
+                
+                if isinstance(result, dict):
+                    logger.info(f"✅ Grupo identificado por Gemini ({modelo}): {result.get('grupo_economico')} ({result.get('confianca')}%)")
+                    resultado = {
+                        'grupo_economico': result.get('grupo_economico', 'INDEPENDENTE'),
+                        'confianca': result.get('confianca', 70),
+                        'metodo': f'Gemini ({modelo})'
+                    }
+                    self.cache_classificacao.salvar(chaves_cache, resultado)
+                    return resultado
+            except Exception as e:
+                logger.error(f"Erro ao usar Gemini: {str(e)}")
+        else:
+            logger.warning("Chave do Gemini não fornecida")
+        
+        # Fallback final
+        logger.warning("⚠️ Caindo no fallback - classificando como INDEPENDENTE")
+        return {
+            'grupo_economico': 'INDEPENDENTE',
+            'confianca': 50,
+            'metodo': 'Padrão'
+        }
+    
+    def _montar_lotes(self, empresas: list, tamanho_lote: int, max_tokens_prompt: int):
+        """Divide as empresas em lotes limitados por quantidade e por tokens estimados (~4 caracteres/token)
+        
+        O orçamento de cada lote é max_tokens_prompt menos a parte fixa do
+        prompt (instruções e lista de grupos); uma empresa que não caiba vai
+        sozinha no seu lote.
+        """
+        fixo = len(PROMPT_SISTEMA_LOTE + PROMPT_LOTE.format(grupos=self.lista_grupos, empresas='')) // 4 + 1
+        orcamento = max_tokens_prompt - fixo
+        if orcamento <= 0:
+            logger.warning(f"Parte fixa do prompt de lote (~{fixo} tokens) passa de max_tokens_prompt={max_tokens_prompt}: uma empresa por lote")
+        lotes, lote, tokens = [], [], 0
+        for empresa in empresas:
+            tokens_empresa = len(_linha_lote(empresa)) // 4 + 1
+            if lote and (len(lote) >= tamanho_lote or tokens + tokens_empresa > orcamento):
+                lotes.append(lote)
+                lote, tokens = [], 0
+            lote.append(empresa)
+            tokens += tokens_empresa
+        if lote:
+            lotes.append(lote)
+        return lotes
+    
+    def _itens_lote(self, texto: str, lote: list, metodo: str) -> dict:
+        """{cnpj: resultado} com os itens válidos da resposta de um lote"""
+        esperados = {empresa['cnpj'] for empresa in lote}
+        resultados = {}
+        for item in _extrair_itens_json(texto):
+            cnpj = re.sub(r'\D', '', str(item.get('cnpj', '')))
+            if cnpj in esperados and item.get('grupo_economico'):
+                resultados[cnpj] = {
+                    'grupo_economico': item['grupo_economico'],
+                    'confianca': item.get('confianca', 70),
+                    'metodo': f'{metodo} lote'
+                }
+        logger.info(f"Lote de {len(lote)} empresas via {metodo}: {len(resultados)} classificadas")
+        return resultados
+    
+    def _classificar_lotes_ia(self, lotes: list, gemini_key: str = None, perplexity_key: str = None, lotes_paralelos: int = 4) -> list:
+        """Envia os lotes às IAs e retorna, por lote, {cnpj: resultado} com os itens que vieram válidos
+        
+        Mesma prioridade da classificação individual: todos os lotes vão ao
+        Perplexity (até `lotes_paralelos` de cada vez) e os que voltarem sem
+        nenhum item válido vão juntos ao Gemini, em paralelo pelo ClienteGemini.
+        """
+        prompts = [
+            PROMPT_LOTE.format(grupos=self.lista_grupos, empresas='\n'.join(_linha_lote(empresa) for empresa in lote))
+            for lote in lotes
+        ]
+        respostas = [{} for _ in lotes]
+        
+        def perplexity(i):
+            with self.metricas.cronometrar('ia_lote'):
+                try:
+                    texto = self._completar_perplexity(
+                        [{"role": "system", "content": PROMPT_SISTEMA_LOTE}, {"role": "user", "content": prompts[i]}],
+                        perplexity_key, max_tokens=40 * len(lotes[i]) + 100, timeout=60
+                    )
+                except Exception as e:
+                    logger.error(f"Erro no lote via Perplexity: {str(e)}")
+                    return {}
+            return self._itens_lote(texto, lotes[i], 'Perplexity') if texto else {}
+        
+        if perplexity_key:
+            with ThreadPoolExecutor(max_workers=max(1, min(lotes_paralelos, len(lotes))), thread_name_prefix='lote_ia') as executor:
+                respostas = list(executor.map(perplexity, range(len(lotes))))
+        
+        faltando = [i for i, resposta in enumerate(respostas) if not resposta]
+        if gemini_key and faltando:
+            with self.metricas.cronometrar('ia_lote'):
+                geradas = self.gemini.gerar_varios([prompts[i] for i in faltando], gemini_key, modo_json=True)
+            for i, (texto, modelo) in zip(faltando, geradas):
+                if texto:
+                    respostas[i] = self._itens_lote(texto, lotes[i], f'Gemini ({modelo})')
+        return respostas
+    
+    def classificar_em_lote(self, empresas: list, gemini_key: str = None, perplexity_key: str = None, tamanho_lote: int = 25, max_tokens_prompt: int = 3000, max_tentativas: int = 2, lotes_paralelos: int = 4, similaridade: bool = True):
+        """Classifica várias empresas por IA com poucas requisições
+        
+        Cada empresa é um dict com 'cnpj', 'razao_social' e 'nome_fantasia'.
+        Com `similaridade`, as que passam do limiar de similaridade com um
+        grupo conhecido não vão à IA (quem já pontuou as empresas passa False).
+        Até `lotes_paralelos` lotes ficam em andamento ao mesmo tempo no
+        Perplexity; no Gemini, o limite é o do ClienteGemini (os limitadores de
+        taxa continuam valendo). Itens ausentes ou malformados
+        na resposta são reenviados em lotes menores;
+        o que sobrar após max_tentativas cai na classificação individual.
+        Retorna {cnpj: resultado}.
+        """
+        resultados = {}
+        pendentes = list({empresa['cnpj']: empresa for empresa in empresas}.values())
+        
+        # Similaridade com os grupos conhecidos antes da IA
+        if similaridade:
+            for empresa, resultado in zip(pendentes, self._similaridade_em_massa(pendentes)):
+                if resultado:
+                    resultados[empresa['cnpj']] = resultado
+            pendentes = [empresa for empresa in pendentes if empresa['cnpj'] not in resultados]
+        
+        if perplexity_key or gemini_key:
+            for tentativa in range(max_tentativas):
+                if not pendentes:
+                    break
+                lotes = self._montar_lotes(pendentes, max(1, tamanho_lote >> tentativa), max_tokens_prompt)
+                logger.info(f"Classificação em lote (tentativa {tentativa + 1}): {len(pendentes)} empresas em {len(lotes)} lote(s)")
+                respostas = self._classificar_lotes_ia(lotes, gemini_key, perplexity_key, lotes_paralelos)
+                for lote, classificados in zip(lotes, respostas):
+                    for empresa in lote:
+                        if empresa['cnpj'] in classificados:
+                            resultados[empresa['cnpj']] = classificados[empresa['cnpj']]
+                            self.cache_classificacao.salvar(CacheClassificacao.chaves(empresa, empresa['cnpj']), resultados[empresa['cnpj']])
+                pendentes = [empresa for empresa in pendentes if empresa['cnpj'] not in resultados]
+        
+        for empresa in pendentes:
+            resultados[empresa['cnpj']] = self.identificar_por_ia(empresa, gemini_key, perplexity_key, cnpj=empresa['cnpj'])
+        return resultados
+    
+    @staticmethod
+    def _aplicar_grupo(resultado: dict, grupo_info: dict):
+        resultado.update({
+            'grupo_economico': grupo_info['grupo_economico'],
+            'confianca': grupo_info['confianca'],
+            'metodo_analise': grupo_info['metodo']
+        })
+        logger.info(f"✅ Resultado: {grupo_info['grupo_economico']} ({grupo_info['confianca']}%) via {grupo_info['metodo']}")
+    
+    def processar_linha(self, pos: int, cnpj_valor, gemini_key: str = None, perplexity_key: str = None, adiar_ia: bool = False, grafo: GrafoSocietario = None):
+        """Processa uma linha da planilha: busca dados do CNPJ e identifica o grupo
+        
+        Com adiar_ia=True, linhas que precisariam de IA voltam com a chave
+        '_pendente_ia' para serem classificadas depois em lote. A empresa entra
+        no `grafo` societário da execução, quando informado.
+        """
+        inicio = time.perf_counter()
+        cnpj = str(cnpj_valor).strip()
+        logger.info(f"\n{'='*60}\nProcessando linha {pos+1}: {cnpj}")
+        
+        # Inicializar resultado base
+        resultado = {
+            'cnpj_original': cnpj,
+            'erro': None
+        }
+        
+        # Validar CNPJ
+        cnpj_limpo = re.sub(r'\D', '', cnpj)
+        if len(cnpj_limpo) != 14:
+            logger.error(f"CNPJ inválido: {cnpj} (tamanho: {len(cnpj_limpo)})")
+            resultado['erro'] = 'CNPJ inválido'
+        else:
+            # Buscar dados
+            resultado['processado_em'] = time.strftime('%Y-%m-%d')
+            empresa_data = self.buscar_cnpj(cnpj)
+            
+            if empresa_data:
+                if grafo is not None:
+                    grafo.adicionar(cnpj_limpo, empresa_data)
+                resultado.update({
+                    'cnpj': cnpj_limpo,
+                    'razao_social': empresa_data['razao_social'],
+                    'nome_fantasia': empresa_data['nome_fantasia'],
+                    'atividade': empresa_data['atividade'],
+                    'situacao': empresa_data['situacao']
+                })
+                
+                # Identificar grupo
+                if adiar_ia:
+                    grupo_info = self.identificar_grupo_local(empresa_data, cnpj_limpo)
+                    if grupo_info is None:
+                        resultado['_pendente_ia'] = {**empresa_data, 'cnpj': cnpj_limpo}
+                else:
+                    grupo_info = self.identificar_grupo(empresa_data, gemini_key, perplexity_key, cnpj=cnpj_limpo, grafo=grafo)
+                if grupo_info:
+                    if grafo is not None:
+                        grafo.definir_grupo(cnpj_limpo, grupo_info)
+                    self._aplicar_grupo(resultado, grupo_info)
+            else:
+                resultado.update({
+                    'cnpj': cnpj_limpo,
+                    'erro': 'Dados não encontrados'
+                })
+                logger.error(f"❌ Dados não encontrados para CNPJ {cnpj}")
+        
+        self.metricas.observar('linha_segundos', time.perf_counter() - inicio)
+        return resultado
+    
+    def processar_cnpjs(self, cnpjs: list, gemini_key: str = None, perplexity_key: str = None, max_workers: int = 1, tamanho_lote: int = 1, ao_progredir=None, inicio: int = 0, anteriores: dict = None, grafo: GrafoSocietario = None):
+        """Processa uma lista de CNPJs e devolve os resultados na mesma ordem
+        
+        A coluna inteira é normalizada e validada antes de qualquer consulta;
+        só os CNPJs válidos distintos são processados e o resultado de cada um
+        é replicado para todas as linhas em que ele aparece. CNPJs presentes em
+        `anteriores` (ver carregar_resultado_anterior) são copiados de lá sem
+        nenhuma consulta.
+        
+        Primeiro todas as empresas são consultadas e passam pelas regras e
+        pelo cache de classificação; só então as que sobraram passam por
+        similaridade, grafo societário e IA (um representante por componente,
+        em lotes quando tamanho_lote > 1). O resultado não depende da ordem
+        das linhas, de max_workers nem de tamanho_lote.
+        
+        O grafo societário é da execução: sem `grafo`, um novo é criado para
+        esta lista; quem processa em partes (blocos, jobs, shards) passa o
+        mesmo grafo para todas. Nada fica no app entre execuções, então o
+        resultado de uma planilha não depende do que rodou antes.
+        """
+        grafo = grafo if grafo is not None else GrafoSocietario()
+
+        with self.metricas.cronometrar('normalizacao'):
+            normalizados = normalizar_cnpjs(cnpjs)
+        originais = normalizados['original'].tolist()
+        limpos = normalizados['cnpj'].tolist()
+        erros = normalizados['erro'].tolist()
+        
+        # Primeira linha e quantidade de linhas de cada CNPJ válido distinto
+        primeira_linha, ocorrencias = {}, {}
+        for pos, cnpj in enumerate(limpos):
+            if isinstance(cnpj, str):
+                primeira_linha.setdefault(cnpj, pos)
+                ocorrencias[cnpj] = ocorrencias.get(cnpj, 0) + 1
+        unicos = list(primeira_linha)
+        invalidos = len(limpos) - sum(ocorrencias.values())
+        if invalidos:
+            logger.warning(f"{invalidos} CNPJ(s) inválido(s) descartado(s) antes das consultas")
+        logger.info(f"{len(limpos)} linhas, {len(unicos)} CNPJs válidos distintos")
+        self.metricas.contar('linhas_total', len(limpos))
+        self.metricas.contar('cnpjs_invalidos_total', invalidos)
+        self.metricas.contar('cnpjs_distintos_total', len(unicos))
+        
+        por_cnpj = {}
+        ao_progredir = ao_progredir or (lambda concluidos, cnpj: None)
+        concluidos = invalidos
+        
+        # Modo incremental: linhas ainda válidas do resultado anterior passam direto e alimentam o grafo societário
+        reaproveitados = [cnpj for cnpj in unicos if cnpj in (anteriores or {})]
+        if reaproveitados:
+            for cnpj in reaproveitados:
+                anterior = por_cnpj[cnpj] = dict(anteriores[cnpj])
+                grafo.adicionar(cnpj, anterior)
+                grafo.definir_grupo(cnpj, {
+                    'grupo_economico': anterior['grupo_economico'],
+                    'confianca': anterior['confianca'] or 0,
+                    'metodo': anterior['metodo_analise']
+                })
+                concluidos += ocorrencias[cnpj]
+            unicos = [cnpj for cnpj in unicos if cnpj not in por_cnpj]
+            logger.info(f"{len(reaproveitados)} CNPJs reaproveitados do resultado anterior, {len(unicos)} a processar")
+            self.metricas.contar('cnpjs_reaproveitados_total', len(reaproveitados))
+            ao_progredir(concluidos, reaproveitados[-1])
+        
+        if max_workers <= 1:
+            for cnpj in unicos:
+                por_cnpj[cnpj] = self.processar_linha(inicio + primeira_linha[cnpj], cnpj, gemini_key, perplexity_key, True, grafo)
+                concluidos += ocorrencias[cnpj]
+                ao_progredir(concluidos, cnpj)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cnpj') as executor:
+                futuros = {
+                    executor.submit(self.processar_linha, inicio + primeira_linha[cnpj], cnpj, gemini_key, perplexity_key, True, grafo): cnpj
+                    for cnpj in unicos
+                }
+                for futuro in as_completed(futuros):
+                    cnpj = futuros[futuro]
+                    por_cnpj[cnpj] = futuro.result()
+                    concluidos += ocorrencias[cnpj]
+                    ao_progredir(concluidos, cnpj)
+        
+        # Com todas as consultas feitas (e o grafo completo), o que as regras não resolveram passa,
+        # nesta ordem, por similaridade, grafo societário e IA, em qualquer ordem de linhas e paralelismo
+        pendentes = [por_cnpj[cnpj] for cnpj in unicos if '_pendente_ia' in por_cnpj[cnpj]]
+        for r, grupo_info in zip(pendentes, self._similaridade_em_massa([r['_pendente_ia'] for r in pendentes])):
+            if grupo_info:
+                del r['_pendente_ia']
+                grafo.definir_grupo(r['cnpj'], grupo_info)
+                self._aplicar_grupo(r, grupo_info)
+        
+        # Componente com grupo conhecido resolve sem IA; dos demais, só um representante vai à IA
+        componentes = {}
+        for r in pendentes:
+            if '_pendente_ia' not in r:
+                continue
+            grupo_info = self.identificar_por_grafo(r['cnpj'], grafo)
+            if grupo_info:
+                del r['_pendente_ia']
+                self._aplicar_grupo(r, grupo_info)
+            else:
+                componentes.setdefault(grafo.componente(r['cnpj']), []).append(r)
+        
+        if componentes:
+            representantes = [membros[0]['_pendente_ia'] for membros in componentes.values()]
+            if tamanho_lote > 1:
+                logger.info(f"Classificando {len(componentes)} componentes societários ({sum(map(len, componentes.values()))} empresas) por IA em lotes de até {tamanho_lote}")
+                grupos = self.classificar_em_lote(representantes, gemini_key, perplexity_key, tamanho_lote=tamanho_lote, similaridade=False)
+            else:
+                logger.info(f"Classificando {len(componentes)} componentes societários ({sum(map(len, componentes.values()))} empresas) por IA")
+                with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='ia') as executor:
+                    grupos = dict(zip(
+                        [empresa['cnpj'] for empresa in representantes],
+                        executor.map(lambda empresa: self.identificar_por_ia(empresa, gemini_key, perplexity_key, empresa['cnpj']), representantes)
+                    ))
+            for membros in componentes.values():
+                grupo_info = grupos[membros[0]['cnpj']]
+                grafo.definir_grupo(membros[0]['cnpj'], grupo_info)
+                for r in membros:
+                    del r['_pendente_ia']
+                    # O fallback padrão não é uma classificação: não há o que herdar
+                    herdar = r is not membros[0] and grupo_info['metodo'] != 'Padrão'
+                    self._aplicar_grupo(r, {**grupo_info, 'metodo': 'QSA'} if herdar else grupo_info)
+                self.metricas.contar('grafo_total', len(membros) - 1, resultado='propagado')
+        
+        for tipo, valor in grafo.metricas().items():
+            self.metricas.definir('grafo_societario', valor, tipo=tipo)
+        return [
+            {**por_cnpj[cnpj], 'cnpj_original': original} if isinstance(cnpj, str)
+            else {'cnpj_original': original, 'erro': erro}
+            for original, cnpj, erro in zip(originais, limpos, erros)
+        ]
+    
+    @staticmethod
+    def montar_resultado(df: pd.DataFrame, cnpj_col: str, resultados: list) -> pd.DataFrame:
+        """Junta os resultados às colunas originais pelo índice da linha, sem copiar célula a célula"""
+        import pandas as pd
+        
+        df_resultado = pd.DataFrame(resultados, index=df.index, columns=COLUNAS_RESULTADO)
+        originais = df.drop(columns=[cnpj_col]).add_prefix('original_')
+        return pd.concat([df_resultado, originais], axis=1)
+    
+    def processar_planilha(self, df: pd.DataFrame, cnpj_col: str, gemini_key: str = None, perplexity_key: str = None, max_workers: int = 1, tamanho_lote: int = 1, ao_progredir=None, anteriores: dict = None):
+        """Processa planilha com CNPJs
+        
+        Com max_workers > 1 as linhas são processadas em paralelo; o ritmo das
+        chamadas externas é controlado pelos limitadores de cada provedor e a
+        ordem das linhas de saída é a mesma da entrada. Com tamanho_lote > 1 as
+        empresas que precisam de IA são classificadas ao final, várias por requisição.
+        `ao_progredir(concluidos, total, cnpj)` é chamado a cada linha concluída.
+        Com `anteriores`, só as linhas novas ou vencidas são enriquecidas.
+        """
+        logger.info(f"Iniciando processamento de {len(df)} CNPJs ({max_workers} worker(s))")
+        total = len(df)
+        
+        resultados = self.processar_cnpjs(
+            df[cnpj_col].tolist(), gemini_key, perplexity_key, max_workers, tamanho_lote,
+            (lambda concluidos, cnpj: ao_progredir(concluidos, total, cnpj)) if ao_progredir else None,
+            anteriores=anteriores
+        )
+        
+        logger.info(f"Processamento concluído: {len(resultados)} registros")
+        
+        return self.montar_resultado(df, cnpj_col, resultados)
+    
+    def processar_em_blocos(self, blocos, cnpj_col: str, escritor, gemini_key: str = None, perplexity_key: str = None, max_workers: int = 1, tamanho_lote: int = 1, total: int = None, ao_progredir=None, anteriores: dict = None):
+        """Processa a planilha bloco a bloco, gravando cada bloco no escritor assim que fica pronto
+        
+        Só os agregados (totais e contagem por grupo) ficam em memória; o
+        resultado completo está no destino do escritor. `total` (se conhecido)
+        é repassado a `ao_progredir(concluidos, total, cnpj)`.
+        """
+        from planilhas import acumular_resumo, resumo_vazio
+        
+        resumo = resumo_vazio()
+        # Um grafo societário para a planilha inteira: empresas de blocos diferentes também se ligam
+        grafo = GrafoSocietario()
+        try:
+            for bloco in blocos:
+                feitos = resumo['total']
+                progresso_bloco = (
+                    (lambda concluidos, cnpj, feitos=feitos: ao_progredir(feitos + concluidos, total, cnpj))
+                    if ao_progredir else None
+                )
+                
+                resultados = self.processar_cnpjs(
+                    bloco[cnpj_col].tolist(), gemini_key, perplexity_key, max_workers, tamanho_lote, progresso_bloco,
+                    inicio=feitos, anteriores=anteriores, grafo=grafo
+                )
+                df_bloco = self.montar_resultado(bloco, cnpj_col, resultados)
+                escritor.escrever(df_bloco)
+                acumular_resumo(resumo, df_bloco)
+                logger.info(f"Bloco gravado: {resumo['total']} linhas processadas")
+        finally:
+            escritor.fechar()
+        
+        logger.info(f"Processamento em blocos concluído: {resumo['total']} registros")
+        return resumo
+
+
+def _progresso_terminal(intervalo: float = 2.0):
+    """Callback de progresso que escreve no stderr no máximo a cada `intervalo` segundos"""
+    ultimo = [0.0]
+    
+    def ao_progredir(concluidos, total, cnpj):
+        agora = time.monotonic()
+        if agora - ultimo[0] >= intervalo or concluidos == total:
+            ultimo[0] = agora
+            print(f"\r{concluidos}{f'/{total}' if total else ''} linhas", end='', file=sys.stderr, flush=True)
+    
+    return ao_progredir
+
+def _detectar_coluna_cnpj(colunas: list) -> str:
+    for coluna in colunas:
+        if 'cnpj' in str(coluna).lower():
+            return coluna
+    return colunas[0]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Identifica grupos econômicos de uma planilha de CNPJs")
+    parser.add_argument('entrada', help="Planilha de entrada (.xlsx, .xls ou .csv)")
+    parser.add_argument('-o', '--saida', required=True, help="Arquivo de saída (.xlsx, .csv ou .parquet)")
+    parser.add_argument('-c', '--coluna', help="Coluna com os CNPJs (padrão: a primeira com 'cnpj' no nome)")
+    parser.add_argument('-w', '--workers', type=int, default=8, help="Linhas processadas em paralelo")
+    parser.add_argument('-l', '--lote', type=int, default=20, help="Empresas por requisição de IA (1 = uma por requisição)")
+    parser.add_argument('-b', '--bloco', type=int, default=5_000, help="Linhas lidas e gravadas por bloco")
+    parser.add_argument('-p', '--processos', type=int, default=1, help="Processos em paralelo; a entrada é dividida por raiz de CNPJ")
+    parser.add_argument('-m', '--modo-provedores', choices=MODOS_PROVEDORES, default=MODO_PROVEDORES, help="Como consultar as fontes de CNPJ")
+    parser.add_argument('-s', '--limiar-similaridade', type=float, default=LIMIAR_SIMILARIDADE, help="Pontuação (0 a 1) a partir da qual a similaridade com um grupo dispensa a IA")
+    parser.add_argument('-a', '--anterior', help="Resultado de uma execução anterior (.xlsx, .csv ou .parquet): só linhas novas ou vencidas são enriquecidas")
+    parser.add_argument('--validade-dias', type=float, default=TTL_CLASSIFICACAO / DIA, help="Idade máxima, em dias, das linhas reaproveitadas do resultado anterior")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Mostra os logs no stderr")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    
+    from planilhas import abrir_escritor, ler_em_blocos
+    
+    blocos = ler_em_blocos(args.entrada, tamanho_bloco=args.bloco)
+    primeiro = next(blocos, None)
+    if primeiro is None:
+        print("Planilha vazia", file=sys.stderr)
+        return 1
+    coluna = args.coluna or _detectar_coluna_cnpj(list(primeiro.columns))
+    if coluna not in primeiro.columns:
+        print(f"Coluna '{coluna}' não encontrada. Colunas: {', '.join(map(str, primeiro.columns))}", file=sys.stderr)
+        return 2
+    
+    def todos_os_blocos():
+        yield primeiro
+        yield from blocos
+    
+    app = GrupoEconomicoApp(modo_provedores=args.modo_provedores, limiar_similaridade=args.limiar_similaridade)
+    chaves = os.environ.get('GEMINI_API_KEY'), os.environ.get('PERPLEXITY_API_KEY')
+    anteriores = carregar_resultado_anterior(args.anterior, validade=args.validade_dias * DIA) if args.anterior else None
+    if args.processos > 1:
+        from shards import processar_em_shards
+        
+        blocos.close()
+        resumo = processar_em_shards(
+            app, args.entrada, args.saida, coluna, args.processos, *chaves,
+            args.workers, args.lote, args.bloco, ao_progredir=_progresso_terminal(), anteriores=anteriores
+        )
+    else:
+        resumo = app.processar_em_blocos(
+            todos_os_blocos(), coluna, abrir_escritor(args.saida), *chaves,
+            args.workers, args.lote, ao_progredir=_progresso_terminal(), anteriores=anteriores
+        )
+    print(file=sys.stderr)
+    print(f"{resumo['total']} linhas, {resumo['erros']} erros -> {args.saida}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
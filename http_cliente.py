@@ -0,0 +1,159 @@
+"""Cliente HTTP compartilhado pelas chamadas externas (APIs de CNPJ e IAs)
+
+Uma única requests.Session com pool de conexões keep-alive por host, retry
+com backoff exponencial e jitter, respeito ao Retry-After e um disjuntor
+(circuit breaker) por provedor que para de chamá-lo enquanto estiver falhando.
+"""
+
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('GrupoEconomicoApp')
+
+STATUS_REPETIR = {429, 500, 502, 503, 504}
+
+class CircuitoAberto(Exception):
+    """O provedor está suspenso pelo disjuntor; a chamada nem foi feita"""
+
+class Disjuntor:
+    """Circuit breaker: abre após `falhas_para_abrir` falhas seguidas e volta a liberar chamadas após `tempo_aberto`
+
+    Passado o prazo, o disjuntor fica meio-aberto: não há uma vaga única de
+    teste, todas as chamadas concorrentes passam, mas a primeira falha já o
+    reabre e um sucesso o fecha. O limitador de taxa de cada provedor é que
+    segura a rajada nesse momento.
+    """
+    def __init__(self, falhas_para_abrir: int = 5, tempo_aberto: float = 60):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.tempo_aberto = tempo_aberto
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self.lock = threading.Lock()
+
+    def permitir(self) -> bool:
+        """Se o prazo de abertura já passou (não reserva nada: serve de consulta e de portão)"""
+        with self.lock:
+            return time.monotonic() >= self.aberto_ate
+
+    def registrar_sucesso(self):
+        with self.lock:
+            self.falhas = 0
+            self.aberto_ate = 0.0
+
+    def registrar_falha(self):
+        with self.lock:
+            self.falhas += 1
+            if self.falhas >= self.falhas_para_abrir:
+                # Meio-aberto: passado o prazo, uma nova falha reabre imediatamente
+                self.aberto_ate = time.monotonic() + self.tempo_aberto
+                self.falhas = self.falhas_para_abrir - 1
+
+    def pausar(self, segundos: float):
+        """Suspende o provedor por um período conhecido (ex.: janela de rate limit)"""
+        with self.lock:
+            self.aberto_ate = max(self.aberto_ate, time.monotonic() + segundos)
+
+def retry_after(response) -> float:
+    """Segundos pedidos pelo header Retry-After (número ou data HTTP), ou None"""
+    valor = response.headers.get('Retry-After')
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class ClienteHTTP:
+    """Session compartilhada com pool por host, retry/backoff e disjuntor por provedor"""
+    def __init__(self, pools: dict = None, pool_padrao: int = 10, max_tentativas: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 30, max_retry_after: float = 30, falhas_para_abrir: int = 5, tempo_aberto: float = 60, metricas=None):
+        self.metricas = metricas
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.falhas_para_abrir = falhas_para_abrir
+        self.tempo_aberto = tempo_aberto
+        self.disjuntores = {}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        padrao = HTTPAdapter(pool_connections=20, pool_maxsize=pool_padrao)
+        self.session.mount('https://', padrao)
+        self.session.mount('http://', padrao)
+        # Prefixos mais longos têm precedência no requests, então cada host ganha seu próprio pool
+        for prefixo, tamanho in (pools or {}).items():
+            self.session.mount(prefixo, HTTPAdapter(pool_connections=1, pool_maxsize=tamanho))
+
+    def disjuntor(self, provedor: str) -> Disjuntor:
+        with self._lock:
+            if provedor not in self.disjuntores:
+                self.disjuntores[provedor] = Disjuntor(self.falhas_para_abrir, self.tempo_aberto)
+            return self.disjuntores[provedor]
+
+    def _backoff(self, tentativa: int) -> float:
+        # Full jitter: espera uniforme entre 0 e o teto exponencial
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** tentativa))
+
+    def _contar_retentativa(self, provedor: str, motivo: str):
+        if self.metricas is not None:
+            self.metricas.contar('http_retentativas_total', provedor=provedor, motivo=motivo)
+
+    def requisitar(self, provedor: str, metodo: str, url: str, **kwargs) -> requests.Response:
+        """Faz a requisição com retry; levanta CircuitoAberto se o provedor estiver suspenso
+
+        Respostas 429/5xx são repetidas até max_tentativas; a última resposta é
+        devolvida ao chamador. Um Retry-After maior que max_retry_after suspende
+        o provedor por esse tempo e devolve a resposta sem esperar.
+        """
+        disjuntor = self.disjuntor(provedor)
+        for tentativa in range(self.max_tentativas):
+            if not disjuntor.permitir():
+                raise CircuitoAberto(f"{provedor} suspenso temporariamente")
+
+            ultima = tentativa == self.max_tentativas - 1
+            try:
+                response = self.session.request(metodo, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                disjuntor.registrar_falha()
+                if ultima:
+                    raise
+                espera = self._backoff(tentativa)
+                self._contar_retentativa(provedor, type(e).__name__)
+                logger.debug(f"{provedor}: {type(e).__name__}, nova tentativa em {espera:.1f}s")
+                time.sleep(espera)
+                continue
+
+            if response.status_code not in STATUS_REPETIR:
+                disjuntor.registrar_sucesso()
+                return response
+
+            disjuntor.registrar_falha()
+            espera = retry_after(response)
+            if espera is not None and espera > self.max_retry_after:
+                logger.warning(f"{provedor}: HTTP {response.status_code}, suspenso por {espera:.0f}s (Retry-After)")
+                disjuntor.pausar(espera)
+                return response
+            if ultima:
+                return response
+
+            espera = espera if espera is not None else self._backoff(tentativa)
+            self._contar_retentativa(provedor, str(response.status_code))
+            logger.debug(f"{provedor}: HTTP {response.status_code}, nova tentativa em {espera:.1f}s")
+            time.sleep(espera)
+
+    def get(self, provedor: str, url: str, **kwargs) -> requests.Response:
+        return self.requisitar(provedor, 'GET', url, **kwargs)
+
+    def post(self, provedor: str, url: str, **kwargs) -> requests.Response:
+        return self.requisitar(provedor, 'POST', url, **kwargs)
@@ -0,0 +1,253 @@
+"""Jobs de processamento retomáveis, independentes da sessão do Streamlit
+
+Cada job fica em um diretório próprio com a planilha de entrada, os
+metadados (job.json) e um checkpoint SQLite com o resultado de cada linha já
+processada. O job roda em uma thread do servidor, então sobrevive a reruns e
+desconexões do navegador; se o processo cair, `iniciar` de novo continua de
+onde parou, pulando as linhas que já estão no checkpoint. A interface só consulta `status`.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+from planilhas import abrir_escritor, acumular_resumo, ler_em_blocos, resumo_vazio
+
+logger = logging.getLogger('GrupoEconomicoApp')
+
+# Linhas processadas entre dois commits do checkpoint; numa queda, no máximo
+# esse tanto é refeito (e as consultas dessas linhas já estão nos caches)
+LINHAS_POR_CHECKPOINT = 100
+
+STATUS_ATIVOS = ('na_fila', 'preparando', 'executando', 'gravando')
+
+class Job:
+    """Acesso aos arquivos de um job: metadados e checkpoint por linha"""
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        self.id = os.path.basename(diretorio)
+        self._lock = threading.Lock()
+
+    @property
+    def caminho_meta(self):
+        return os.path.join(self.diretorio, 'job.json')
+
+    def meta(self) -> dict:
+        with open(self.caminho_meta, encoding='utf-8') as f:
+            return json.load(f)
+
+    def atualizar(self, **campos):
+        """Atualiza os metadados com escrita atômica (arquivo temporário + rename)"""
+        with self._lock:
+            meta = self.meta()
+            meta.update(campos, atualizado_em=datetime.now().isoformat(timespec='seconds'))
+            temporario = self.caminho_meta + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+            os.replace(temporario, self.caminho_meta)
+            return meta
+
+    def abrir_checkpoint(self):
+        conn = sqlite3.connect(os.path.join(self.diretorio, 'checkpoint.sqlite3'), timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS linhas (pos INTEGER PRIMARY KEY, resultado TEXT NOT NULL)')
+        return conn
+
+    def linhas_feitas(self) -> set:
+        conn = self.abrir_checkpoint()
+        try:
+            return {pos for (pos,) in conn.execute('SELECT pos FROM linhas')}
+        finally:
+            conn.close()
+
+    def contar_feitas(self) -> int:
+        conn = self.abrir_checkpoint()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM linhas').fetchone()[0]
+        finally:
+            conn.close()
+
+    def gravar_linhas(self, conn, linhas: list):
+        """Grava [(pos, resultado)] numa única transação"""
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany(
+            'INSERT OR REPLACE INTO linhas VALUES (?, ?)',
+            [(pos, json.dumps(resultado, ensure_ascii=False, default=str)) for pos, resultado in linhas]
+        )
+        conn.execute('COMMIT')
+
+    def ler_linhas(self, conn, posicoes) -> dict:
+        posicoes = [int(p) for p in posicoes]
+        resultados = {}
+        for i in range(0, len(posicoes), 900):
+            parte = posicoes[i:i + 900]
+            marcadores = ','.join('?' * len(parte))
+            for pos, resultado in conn.execute(f'SELECT pos, resultado FROM linhas WHERE pos IN ({marcadores})', parte):
+                resultados[pos] = json.loads(resultado)
+        return resultados
+
+class GerenciadorJobs:
+    """Cria, executa em segundo plano e consulta jobs de processamento"""
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        self._threads = {}
+        self._cancelar = {}
+        self._lock = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+
+    def job(self, job_id: str) -> Job:
+        return Job(os.path.join(self.diretorio, job_id))
+
+    def criar(self, conteudo: bytes, nome_arquivo: str, cnpj_col: str, formato_saida: str = 'xlsx', parametros: dict = None, anterior: tuple = None) -> str:
+        """Grava a entrada e os metadados de um novo job; retorna o id
+
+        `anterior` = (conteúdo, nome do arquivo) de um resultado anterior, para o modo incremental.
+        """
+        job_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        diretorio = os.path.join(self.diretorio, job_id)
+        os.makedirs(diretorio)
+
+        extensao = os.path.splitext(nome_arquivo)[1].lower() or '.xlsx'
+        with open(os.path.join(diretorio, f'entrada{extensao}'), 'wb') as f:
+            f.write(conteudo)
+        if anterior is not None:
+            extensao_anterior = os.path.splitext(anterior[1])[1].lower() or '.xlsx'
+            with open(os.path.join(diretorio, f'anterior{extensao_anterior}'), 'wb') as f:
+                f.write(anterior[0])
+
+        meta = {
+            'id': job_id,
+            'arquivo': nome_arquivo,
+            'entrada': f'entrada{extensao}',
+            'anterior': f'anterior{extensao_anterior}' if anterior is not None else None,
+            'cnpj_col': cnpj_col,
+            'formato_saida': formato_saida,
+            'saida': f'grupos_economicos_{job_id}.{formato_saida}',
+            'parametros': parametros or {},
+            'status': 'na_fila',
+            'total': None,
+            'resumo': None,
+            'erro': None,
+            'criado_em': datetime.now().isoformat(timespec='seconds')
+        }
+        with open(os.path.join(diretorio, 'job.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        logger.info(f"Job {job_id} criado para {nome_arquivo}")
+        return job_id
+
+    def em_execucao(self, job_id: str) -> bool:
+        with self._lock:
+            thread = self._threads.get(job_id)
+            return thread is not None and thread.is_alive()
+
+    def iniciar(self, job_id: str, app, gemini_key: str = None, perplexity_key: str = None) -> bool:
+        """Executa (ou retoma) o job numa thread do servidor; as chaves de API não são gravadas em disco"""
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return False
+            self._cancelar[job_id] = threading.Event()
+            thread = threading.Thread(
+                target=self._executar,
+                args=(job_id, app, gemini_key, perplexity_key),
+                name=f'job-{job_id}',
+                daemon=True
+            )
+            self._threads[job_id] = thread
+        thread.start()
+        return True
+
+    def pausar(self, job_id: str):
+        """Pede a parada do job ao fim do checkpoint corrente"""
+        with self._lock:
+            evento = self._cancelar.get(job_id)
+        if evento:
+            evento.set()
+
+    def status(self, job_id: str) -> dict:
+        job = self.job(job_id)
+        meta = job.meta()
+        meta['feitas'] = job.contar_feitas()
+        # Ativo nos metadados mas sem thread viva: o processo caiu ou foi reiniciado
+        if meta['status'] in STATUS_ATIVOS and not self.em_execucao(job_id):
+            meta['status'] = 'interrompido'
+        meta['caminho_saida'] = os.path.join(job.diretorio, meta['saida'])
+        return meta
+
+    def listar(self, limite: int = 10) -> list:
+        ids = sorted(
+            (nome for nome in os.listdir(self.diretorio) if os.path.exists(os.path.join(self.diretorio, nome, 'job.json'))),
+            reverse=True
+        )
+        return [self.status(job_id) for job_id in ids[:limite]]
+
+    def _executar(self, job_id: str, app, gemini_key: str, perplexity_key: str):
+        job = self.job(job_id)
+        cancelar = self._cancelar[job_id]
+        meta = job.meta()
+        entrada = os.path.join(job.diretorio, meta['entrada'])
+        cnpj_col = meta['cnpj_col']
+        parametros = meta['parametros']
+        conn = job.abrir_checkpoint()
+
+        try:
+            from grupos_economicos import GrafoSocietario
+
+            # Um grafo societário por job; ao retomar, as linhas já gravadas no checkpoint não voltam a ele
+            grafo = GrafoSocietario()
+            anteriores = None
+            if meta.get('anterior'):
+                from grupos_economicos import carregar_resultado_anterior
+
+                anteriores = carregar_resultado_anterior(os.path.join(job.diretorio, meta['anterior']))
+            if meta['total'] is None:
+                job.atualizar(status='preparando', erro=None)
+                total = sum(len(bloco) for bloco in ler_em_blocos(entrada))
+                meta = job.atualizar(total=total)
+
+            job.atualizar(status='executando', erro=None)
+            feitas = job.linhas_feitas()
+            logger.info(f"Job {job_id}: {len(feitas)}/{meta['total']} linhas já no checkpoint")
+
+            for bloco in ler_em_blocos(entrada):
+                pendentes = bloco.loc[~bloco.index.isin(feitas), cnpj_col]
+                for inicio in range(0, len(pendentes), LINHAS_POR_CHECKPOINT):
+                    if cancelar.is_set():
+                        job.atualizar(status='pausado')
+                        logger.info(f"Job {job_id} pausado")
+                        return
+                    parte = pendentes.iloc[inicio:inicio + LINHAS_POR_CHECKPOINT]
+                    resultados = app.processar_cnpjs(
+                        parte.tolist(), gemini_key, perplexity_key,
+                        parametros.get('max_workers', 1), parametros.get('tamanho_lote', 1),
+                        inicio=int(parte.index[0]), anteriores=anteriores, grafo=grafo
+                    )
+                    job.gravar_linhas(conn, list(zip(parte.index.tolist(), resultados)))
+
+            self._gerar_saida(job, conn, meta, app)
+        except Exception as e:
+            logger.exception(f"Job {job_id} falhou")
+            job.atualizar(status='erro', erro=str(e))
+        finally:
+            conn.close()
+
+    def _gerar_saida(self, job: Job, conn, meta: dict, app):
+        """Monta o arquivo final a partir do checkpoint, bloco a bloco"""
+        job.atualizar(status='gravando')
+        resumo = resumo_vazio()
+        escritor = abrir_escritor(os.path.join(job.diretorio, meta['saida']), meta['formato_saida'])
+        try:
+            for bloco in ler_em_blocos(os.path.join(job.diretorio, meta['entrada'])):
+                resultados = job.ler_linhas(conn, bloco.index)
+                df_bloco = app.montar_resultado(bloco, meta['cnpj_col'], [resultados[pos] for pos in bloco.index])
+                escritor.escrever(df_bloco)
+                acumular_resumo(resumo, df_bloco)
+        finally:
+            escritor.fechar()
+
+        job.atualizar(status='concluido', resumo=resumo)
+        logger.info(f"Job {job.id} concluído: {resumo['total']} linhas")
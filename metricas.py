@@ -0,0 +1,201 @@
+"""Métricas de desempenho em memória: contadores, medidores e histogramas
+
+Thread-safe e sem dependências; o registro pode ser exportado como JSON ou
+no formato texto do Prometheus. Os quantis dos histogramas são estimados
+por interpolação dentro dos buckets, como faz o histogram_quantile do Prometheus.
+"""
+
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites superiores dos buckets de latência, em segundos
+BUCKETS_LATENCIA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+DESCRICOES = {
+    'etapa_segundos': 'Duração de cada etapa do processamento',
+    'linha_segundos': 'Duração do processamento de um CNPJ distinto (todas as etapas)',
+    'provedor_latencia_segundos': 'Latência das consultas às fontes de CNPJ',
+    'linhas_total': 'Linhas de planilha processadas',
+    'cnpjs_invalidos_total': 'Linhas descartadas por CNPJ inválido antes das consultas',
+    'cnpjs_distintos_total': 'CNPJs válidos distintos consultados',
+    'cnpjs_reaproveitados_total': 'CNPJs copiados de um resultado anterior (modo incremental) sem consulta',
+    'cache_total': 'Consultas aos caches por resultado',
+    'similaridade_total': 'Classificações por similaridade aceitas ou abaixo do limiar',
+    'http_retentativas_total': 'Novas tentativas de requisições HTTP',
+    'ia_requisicoes_total': 'Requisições às IAs',
+    'ia_tokens_total': 'Tokens consumidos nas IAs',
+    'ia_custo_usd_total': 'Custo estimado das IAs em dólares',
+    'coalescencia_chamadas': 'Chamadas executadas e aproveitadas pelo single-flight',
+    'grafo_total': 'Classificações herdadas de outra empresa do mesmo componente societário',
+    'grafo_societario': 'Tamanho do grafo societário da última execução (empresas, nós e componentes com grupo)',
+    'gemini_modelo_disponivel': 'Modelo do Gemini fora do resfriamento (1) ou suspenso após falhas (0)'
+}
+
+class Histograma:
+    """Contagens por bucket (não cumulativas), soma e total de observações"""
+    def __init__(self, limites=BUCKETS_LATENCIA):
+        self.limites = tuple(limites)
+        self.contagens = [0] * (len(self.limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                break
+        else:
+            i = len(self.limites)
+        self.contagens[i] += 1
+        self.soma += valor
+        self.total += 1
+
+    def quantil(self, q: float) -> float:
+        if not self.total:
+            return None
+        alvo = q * self.total
+        acumulado = 0
+        for i, n in enumerate(self.contagens):
+            if acumulado + n >= alvo and n:
+                inferior = self.limites[i - 1] if i > 0 else 0.0
+                if i == len(self.limites):
+                    return inferior
+                return inferior + (self.limites[i] - inferior) * (alvo - acumulado) / n
+            acumulado += n
+        return self.limites[-1]
+
+    def resumo(self) -> dict:
+        return {
+            'total': self.total,
+            'soma': round(self.soma, 6),
+            'media': round(self.soma / self.total, 6) if self.total else None,
+            'p50': self.quantil(0.5),
+            'p95': self.quantil(0.95),
+            'p99': self.quantil(0.99),
+            'buckets': {str(limite): n for limite, n in zip(self.limites + (math.inf,), self.contagens)}
+        }
+
+def _chave(nome: str, rotulos: dict):
+    return nome, tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+class Metricas:
+    """Registro de métricas identificadas por nome + rótulos"""
+    def __init__(self, buckets=BUCKETS_LATENCIA):
+        self.buckets = buckets
+        self.contadores = {}
+        self.medidores = {}
+        self.histogramas = {}
+        self.inicio = time.time()
+        self._lock = threading.Lock()
+
+    def contar(self, nome: str, valor: float = 1, **rotulos):
+        chave = _chave(nome, rotulos)
+        with self._lock:
+            self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def definir(self, nome: str, valor: float, **rotulos):
+        with self._lock:
+            self.medidores[_chave(nome, rotulos)] = valor
+
+    def observar(self, nome: str, valor: float, **rotulos):
+        chave = _chave(nome, rotulos)
+        with self._lock:
+            histograma = self.histogramas.get(chave)
+            if histograma is None:
+                histograma = self.histogramas[chave] = Histograma(self.buckets)
+            histograma.observar(valor)
+
+    @contextmanager
+    def cronometrar(self, etapa: str):
+        """Mede o bloco como uma observação de etapa_segundos{etapa=...}"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar('etapa_segundos', time.perf_counter() - inicio, etapa=etapa)
+
+    def valor(self, nome: str, **rotulos) -> float:
+        """Soma dos contadores `nome` cujos rótulos incluem os informados"""
+        filtro = set(_chave(nome, rotulos)[1])
+        with self._lock:
+            return sum(v for (n, r), v in self.contadores.items() if n == nome and filtro <= set(r))
+
+    def medidor(self, nome: str, **rotulos) -> float:
+        """Valor atual do medidor `nome` com exatamente esses rótulos (0 se nunca definido)"""
+        with self._lock:
+            return self.medidores.get(_chave(nome, rotulos), 0)
+
+    def zerar(self):
+        with self._lock:
+            self.contadores.clear()
+            self.medidores.clear()
+            self.histogramas.clear()
+            self.inicio = time.time()
+
+    def instantaneo(self) -> dict:
+        """Cópia serializável de todas as métricas"""
+        with self._lock:
+            contadores = list(self.contadores.items())
+            medidores = list(self.medidores.items())
+            histogramas = [(chave, h.resumo()) for chave, h in self.histogramas.items()]
+
+        def agrupar(itens):
+            saida = {}
+            for (nome, rotulos), valor in sorted(itens, key=lambda item: item[0]):
+                saida.setdefault(nome, []).append({'rotulos': dict(rotulos), 'valor': valor})
+            return saida
+
+        return {
+            'desde': self.inicio,
+            'contadores': agrupar(contadores),
+            'medidores': agrupar(medidores),
+            'histogramas': agrupar(histogramas)
+        }
+
+    def para_json(self) -> str:
+        return json.dumps(self.instantaneo(), ensure_ascii=False, indent=2)
+
+    def para_prometheus(self, prefixo: str = 'grupos_economicos') -> str:
+        """Formato texto de exposição do Prometheus (versão 0.0.4)"""
+        def rotular(rotulos, extra=()):
+            pares = list(rotulos) + list(extra)
+            if not pares:
+                return ''
+            escapar = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            return '{' + ','.join(f'{k}="{escapar(v)}"' for k, v in pares) + '}'
+
+        def cabecalho(nome, tipo):
+            linhas.append(f"# HELP {prefixo}_{nome} {DESCRICOES.get(nome, nome)}")
+            linhas.append(f"# TYPE {prefixo}_{nome} {tipo}")
+
+        with self._lock:
+            contadores = sorted(self.contadores.items())
+            medidores = sorted(self.medidores.items())
+            histogramas = sorted(
+                ((chave, h.limites, list(h.contagens), h.soma, h.total) for chave, h in self.histogramas.items()),
+                key=lambda item: item[0]
+            )
+
+        linhas = []
+        for tipo, itens in (('counter', contadores), ('gauge', medidores)):
+            anterior = None
+            for (nome, rotulos), valor in itens:
+                if nome != anterior:
+                    cabecalho(nome, tipo)
+                    anterior = nome
+                linhas.append(f"{prefixo}_{nome}{rotular(rotulos)} {valor}")
+
+        anterior = None
+        for (nome, rotulos), limites, contagens, soma, total in histogramas:
+            if nome != anterior:
+                cabecalho(nome, 'histogram')
+                anterior = nome
+            acumulado = 0
+            for limite, n in zip(limites + ('+Inf',), contagens):
+                acumulado += n
+                linhas.append(f"{prefixo}_{nome}_bucket{rotular(rotulos, [('le', str(limite))])} {acumulado}")
+            linhas.append(f"{prefixo}_{nome}_sum{rotular(rotulos)} {soma}")
+            linhas.append(f"{prefixo}_{nome}_count{rotular(rotulos)} {total}")
+        return '\n'.join(linhas) + '\n'
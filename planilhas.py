@@ -0,0 +1,274 @@
+"""Leitura e escrita de planilhas em blocos, para arquivos grandes
+
+A entrada é lida em DataFrames de `tamanho_bloco` linhas (openpyxl em modo
+read-only para .xlsx, chunks do pandas para .csv, row groups do pyarrow para
+.parquet) e o resultado é gravado incrementalmente (openpyxl write-only, CSV
+ou Parquet), sem nunca montar a planilha inteira em memória.
+"""
+
+import csv
+import io
+import os
+import pickle
+
+import pandas as pd
+
+TAMANHO_BLOCO = 5_000
+
+FORMATOS_SAIDA = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+def _extensao(nome: str) -> str:
+    return os.path.splitext(nome or '')[1].lower().lstrip('.')
+
+def acumular_resumo(resumo: dict, df: pd.DataFrame) -> dict:
+    """Soma um bloco de resultado aos agregados (total, erros e contagem por grupo)"""
+    resumo['total'] += len(df)
+    resumo['erros'] += int(df['erro'].notna().sum())
+    for grupo, n in df.loc[df['erro'].isna(), 'grupo_economico'].value_counts().items():
+        resumo['grupos'][grupo] = resumo['grupos'].get(grupo, 0) + int(n)
+    return resumo
+
+def resumo_vazio() -> dict:
+    return {'total': 0, 'erros': 0, 'grupos': {}}
+
+def ler_em_blocos(origem, nome: str = None, tamanho_bloco: int = TAMANHO_BLOCO):
+    """Itera a planilha em DataFrames; o índice continua entre blocos (número da linha de dados)
+
+    `origem` pode ser um caminho ou um arquivo aberto (ex.: UploadedFile do Streamlit).
+    """
+    extensao = _extensao(nome or (origem if isinstance(origem, str) else getattr(origem, 'name', '')))
+    inicio = 0
+
+    if extensao == 'csv':
+        # utf-8-sig: aceita o BOM que o EscritorCSV grava (para o Excel) e também UTF-8 puro
+        for bloco in pd.read_csv(origem, chunksize=tamanho_bloco, dtype=str, keep_default_na=False, sep=None, engine='python', encoding='utf-8-sig'):
+            yield bloco
+        return
+
+    if extensao == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Leitura de Parquet requer o pacote pyarrow (pip install pyarrow)") from e
+        for lote in pq.ParquetFile(origem).iter_batches(batch_size=tamanho_bloco):
+            bloco = lote.to_pandas()
+            bloco.index = range(inicio, inicio + len(bloco))
+            inicio += len(bloco)
+            yield bloco
+        return
+
+    if extensao != 'xlsx':
+        # .xls e outros formatos não têm leitura em streaming
+        df = pd.read_excel(origem)
+        for inicio in range(0, len(df), tamanho_bloco):
+            yield df.iloc[inicio:inicio + tamanho_bloco]
+        return
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(origem, read_only=True, data_only=True)
+    try:
+        linhas = wb.active.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        colunas = [str(c) if c is not None else f'Unnamed: {i}' for i, c in enumerate(cabecalho)]
+        bloco = []
+        for linha in linhas:
+            if all(v is None for v in linha):
+                continue
+            bloco.append(linha[:len(colunas)])
+            if len(bloco) >= tamanho_bloco:
+                yield pd.DataFrame(bloco, columns=colunas, index=range(inicio, inicio + len(bloco)))
+                inicio += len(bloco)
+                bloco = []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=colunas, index=range(inicio, inicio + len(bloco)))
+    finally:
+        wb.close()
+
+class EscritorCSV:
+    """Escreve blocos de resultado em CSV, cabeçalho só no primeiro"""
+    def __init__(self, destino):
+        self.arquivo = open(destino, 'w', newline='', encoding='utf-8-sig') if isinstance(destino, str) else destino
+        self.proprio = isinstance(destino, str)
+        self.colunas = None
+
+    def escrever(self, df: pd.DataFrame):
+        if self.colunas is None:
+            self.colunas = list(df.columns)
+            csv.writer(self.arquivo).writerow(self.colunas)
+        df.reindex(columns=self.colunas).to_csv(self.arquivo, header=False, index=False)
+
+    def fechar(self):
+        if self.proprio:
+            self.arquivo.close()
+        else:
+            self.arquivo.flush()
+
+class EscritorXLSX:
+    """Escreve blocos de resultado com openpyxl em modo write-only"""
+    def __init__(self, destino, nome_aba: str = 'Resultado'):
+        from openpyxl import Workbook
+
+        self.destino = destino
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(nome_aba)
+        self.colunas = None
+
+    def escrever(self, df: pd.DataFrame):
+        if self.colunas is None:
+            self.colunas = list(df.columns)
+            self.ws.append(self.colunas)
+        for linha in df.reindex(columns=self.colunas).itertuples(index=False, name=None):
+            self.ws.append([None if pd.isna(v) else v for v in linha])
+
+    def fechar(self):
+        self.wb.save(self.destino)
+
+class EscritorXLSXRapido:
+    """Escreve blocos com xlsxwriter em modo constant_memory, bem mais rápido que o openpyxl (requer xlsxwriter)"""
+    def __init__(self, destino, nome_aba: str = 'Resultado'):
+        import xlsxwriter
+
+        # Textos ficam como texto: CNPJs não viram números nem URLs viram hyperlinks
+        self.wb = xlsxwriter.Workbook(destino, {'constant_memory': True, 'strings_to_numbers': False, 'strings_to_urls': False, 'nan_inf_to_errors': True})
+        self.ws = self.wb.add_worksheet(nome_aba)
+        self.linha = 0
+        self.colunas = None
+
+    def escrever(self, df: pd.DataFrame):
+        if self.colunas is None:
+            self.colunas = list(df.columns)
+            self.ws.write_row(0, 0, [str(c) for c in self.colunas])
+            self.linha = 1
+        for linha in df.reindex(columns=self.colunas).itertuples(index=False, name=None):
+            self.ws.write_row(self.linha, 0, [None if pd.isna(v) else v for v in linha])
+            self.linha += 1
+
+    def fechar(self):
+        self.wb.close()
+
+def _escritor_xlsx(destino):
+    try:
+        import xlsxwriter  # noqa: F401
+    except ImportError:
+        return EscritorXLSX(destino)
+    return EscritorXLSXRapido(destino)
+
+class EscritorParquet:
+    """Escreve blocos de resultado como row groups de um Parquet (requer pyarrow)"""
+    def __init__(self, destino):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Saída Parquet requer o pacote pyarrow (pip install pyarrow)") from e
+        self.pa, self.pq = pa, pq
+        self.destino = destino
+        self.writer = None
+        self.colunas = None
+
+    def escrever(self, df: pd.DataFrame):
+        if self.colunas is None:
+            self.colunas = list(df.columns)
+        # Tipos fixos para o schema não variar entre blocos (colunas vazias viram null no pyarrow)
+        df = df.reindex(columns=self.colunas).astype('string')
+        if 'confianca' in df.columns:
+            df['confianca'] = pd.to_numeric(df['confianca'], errors='coerce').astype('float64')
+        tabela = self.pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.destino, tabela.schema)
+        self.writer.write_table(tabela.cast(self.writer.schema))
+
+    def fechar(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class EscritorPrevia:
+    """Cópia dos blocos em pickle, com a linha inicial e o deslocamento de cada um no arquivo
+
+    Serve para mostrar qualquer página de um resultado grande (ver ler_linhas)
+    sem reler o .xlsx ou o .csv desde o começo.
+    """
+    def __init__(self, destino: str):
+        self.destino = destino
+        self.arquivo = open(destino, 'wb')
+        self.blocos = []
+        self.linhas = 0
+
+    def escrever(self, df: pd.DataFrame):
+        self.blocos.append((self.linhas, self.arquivo.tell()))
+        pickle.dump(df, self.arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+        self.linhas += len(df)
+
+    def fechar(self):
+        self.arquivo.close()
+
+def ler_linhas(caminho: str, blocos: list, inicio: int, quantidade: int) -> pd.DataFrame:
+    """Linhas [inicio, inicio + quantidade) de uma cópia gravada pelo EscritorPrevia, lendo só os blocos necessários"""
+    partes = []
+    with open(caminho, 'rb') as arquivo:
+        for primeira, deslocamento in blocos:
+            if primeira >= inicio + quantidade:
+                break
+            arquivo.seek(deslocamento)
+            df = pickle.load(arquivo)
+            if primeira + len(df) > inicio:
+                partes.append(df.iloc[max(0, inicio - primeira):inicio + quantidade - primeira])
+    return pd.concat(partes) if partes else pd.DataFrame()
+
+class EscritorMultiplo:
+    """Repassa cada bloco a vários escritores (ex.: o arquivo de saída e a prévia)"""
+    def __init__(self, escritores: list):
+        self.escritores = escritores
+
+    def escrever(self, df: pd.DataFrame):
+        for escritor in self.escritores:
+            escritor.escrever(df)
+
+    def fechar(self):
+        erros = []
+        for escritor in self.escritores:
+            try:
+                escritor.fechar()
+            except Exception as e:
+                erros.append(e)
+        if erros:
+            raise erros[0]
+
+ESCRITORES = {
+    'xlsx': _escritor_xlsx,
+    'csv': EscritorCSV,
+    'parquet': EscritorParquet
+}
+
+def abrir_escritor(destino, formato: str = None):
+    """Escritor incremental para o formato pedido (ou deduzido da extensão do destino)"""
+    formato = formato or _extensao(destino)
+    if formato not in ESCRITORES:
+        raise ValueError(f"Formato de saída não suportado: {formato} (use {', '.join(ESCRITORES)})")
+    return ESCRITORES[formato](destino)
+
+def exportar(blocos, formato: str) -> bytes:
+    """Grava blocos de resultado num arquivo em memória no formato pedido e devolve o conteúdo"""
+    buffer = io.BytesIO()
+    destino = io.TextIOWrapper(buffer, encoding='utf-8-sig', newline='') if formato == 'csv' else buffer
+    escritor = abrir_escritor(destino, formato)
+    try:
+        for bloco in blocos:
+            escritor.escrever(bloco)
+    finally:
+        escritor.fechar()
+    if formato == 'csv':
+        destino.detach()
+    return buffer.getvalue()
+
+def em_blocos(df: pd.DataFrame, tamanho_bloco: int = TAMANHO_BLOCO):
+    """Fatias de um DataFrame já em memória, para os escritores incrementais"""
+    for inicio in range(0, len(df), tamanho_bloco):
+        yield df.iloc[inicio:inicio + tamanho_bloco]
@@ -0,0 +1,275 @@
+"""Fontes de dados de CNPJ e a estratégia de consulta entre elas
+
+Cada fonte implementa `ProvedorCNPJ.buscar`; a `EstrategiaProvedores` decide
+em que ordem e com quanto paralelismo chamá-las:
+
+- sequencial: uma de cada vez, passando para a próxima em falha;
+- hedged: chama a melhor fonte e, se ela não responder dentro do p95 de
+  latência observado, dispara também a próxima;
+- corrida: chama todas de uma vez e fica com a primeira resposta válida.
+
+A ordem das fontes se adapta à latência e à taxa de sucesso observadas.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from http_cliente import CircuitoAberto
+
+logger = logging.getLogger('GrupoEconomicoApp')
+
+MODOS = ('sequencial', 'hedged', 'corrida')
+
+class CNPJInexistente(Exception):
+    """A fonte afirmou que o CNPJ não existe (resposta definitiva, não uma falha)"""
+
+class ProvedorCNPJ:
+    """Interface de uma fonte de dados de CNPJ
+
+    `buscar` devolve {'razao_social', 'nome_fantasia', 'atividade', 'situacao', 'qsa'},
+    onde 'qsa' é a lista de sócios {'nome', 'qualificacao', 'documento'}
+    ('documento' só para sócios pessoa jurídica com CNPJ informado); levanta CNPJInexistente quando a fonte afirma que o CNPJ não existe e
+    devolve None (ou levanta qualquer outra exceção) em falhas.
+    """
+    nome = None
+    rotulo = None
+    timeout = 10
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def buscar(self, cnpj: str, http):
+        raise NotImplementedError
+
+class ProvedorReceitaWS(ProvedorCNPJ):
+    nome = 'receitaws'
+    rotulo = 'ReceitaWS'
+
+    def buscar(self, cnpj: str, http):
+        response = http.get(self.nome, self.url.format(cnpj=cnpj), timeout=self.timeout)
+        logger.debug(f"ReceitaWS status: {response.status_code}")
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        if data.get('status') != 'OK':
+            logger.warning(f"ReceitaWS retornou status: {data.get('status')}")
+            if data.get('status') == 'ERROR':
+                raise CNPJInexistente(data.get('message', ''))
+            return None
+        atividade = data.get('atividade_principal', {})
+        return {
+            'razao_social': data.get('nome', ''),
+            'nome_fantasia': data.get('fantasia', ''),
+            'atividade': atividade.get('text', '') if isinstance(atividade, dict) else str(atividade or ''),
+            'situacao': data.get('situacao', ''),
+            # A ReceitaWS não informa o documento dos sócios, só nome e qualificação
+            'qsa': [
+                {'nome': socio.get('nome', ''), 'qualificacao': socio.get('qual', ''), 'documento': None}
+                for socio in data.get('qsa') or []
+            ]
+        }
+
+def _cnpj_socio(socio: dict):
+    documento = re.sub(r'\D', '', str(socio.get('cnpj_cpf_do_socio') or ''))
+    return documento if len(documento) == 14 else None
+
+class ProvedorBrasilAPI(ProvedorCNPJ):
+    nome = 'brasilapi'
+    rotulo = 'BrasilAPI'
+
+    def buscar(self, cnpj: str, http):
+        response = http.get(self.nome, self.url.format(cnpj=cnpj), timeout=self.timeout)
+        logger.debug(f"BrasilAPI status: {response.status_code}")
+        if response.status_code == 404:
+            raise CNPJInexistente()
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        return {
+            'razao_social': data.get('razao_social', ''),
+            'nome_fantasia': data.get('nome_fantasia', ''),
+            'atividade': data.get('cnae_fiscal_descricao', ''),
+            'situacao': data.get('descricao_situacao_cadastral', ''),
+            'qsa': [
+                {
+                    'nome': socio.get('nome_socio', ''),
+                    'qualificacao': socio.get('qualificacao_socio', ''),
+                    # identificador_de_socio: 1 = pessoa jurídica, 2 = pessoa física (CPF mascarado), 3 = estrangeiro
+                    'documento': _cnpj_socio(socio) if socio.get('identificador_de_socio') == 1 else None
+                }
+                for socio in data.get('qsa') or []
+            ]
+        }
+
+class EstatisticasProvedor:
+    """Latências e resultados recentes de uma fonte (janela deslizante)
+
+    Com `metricas`, cada consulta também entra no histograma
+    provedor_latencia_segundos{provedor=nome, resultado=...}.
+    """
+    def __init__(self, janela: int = 200, latencia_inicial: float = 1.0, nome: str = None, metricas=None):
+        self.latencias = deque(maxlen=janela)
+        self.resultados = deque(maxlen=janela)
+        self.latencia_inicial = latencia_inicial
+        self.nome = nome
+        self.metricas_globais = metricas
+        self.lock = threading.Lock()
+
+    def registrar(self, segundos: float, sucesso: bool, resultado: str = None):
+        with self.lock:
+            self.latencias.append(segundos)
+            self.resultados.append(sucesso)
+        if self.metricas_globais is not None:
+            self.metricas_globais.observar(
+                'provedor_latencia_segundos', segundos, provedor=self.nome, resultado=resultado or ('ok' if sucesso else 'falha')
+            )
+
+    def percentil(self, p: float) -> float:
+        with self.lock:
+            if not self.latencias:
+                return self.latencia_inicial
+            ordenadas = sorted(self.latencias)
+        return ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))]
+
+    def taxa_sucesso(self) -> float:
+        # Suavização de Laplace: uma fonte sem histórico começa em 50% e não é descartada por um azar
+        with self.lock:
+            return (sum(self.resultados) + 1) / (len(self.resultados) + 2)
+
+    def custo_esperado(self) -> float:
+        """Tempo esperado até uma resposta válida; menor é melhor"""
+        return self.percentil(0.5) / self.taxa_sucesso()
+
+    def resumo(self) -> dict:
+        return {
+            'amostras': len(self.resultados),
+            'p50': round(self.percentil(0.5), 3),
+            'p95': round(self.percentil(0.95), 3),
+            'taxa_sucesso': round(self.taxa_sucesso(), 3)
+        }
+
+class EstrategiaProvedores:
+    """Consulta as fontes de CNPJ em modo sequencial, hedged ou corrida
+
+    Uma fonte com o disjuntor aberto é ignorada; sem token no limitador de
+    taxa ela é pulada, exceto a última opção do modo sequencial, que espera.
+    Requisições já enviadas não são interrompidas quando outra fonte vence:
+    seus resultados são só descartados (os tokens já foram gastos).
+    """
+    def __init__(self, provedores: list, http, limitadores: dict, modo: str = 'sequencial', hedge_minimo: float = 0.05, max_paralelo: int = 32, metricas=None):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de consulta desconhecido: {modo} (use {', '.join(MODOS)})")
+        self.provedores = list(provedores)
+        self.http = http
+        self.limitadores = limitadores
+        self.modo = modo
+        self.hedge_minimo = hedge_minimo
+        self.estatisticas = {p.nome: EstatisticasProvedor(nome=p.nome, metricas=metricas) for p in self.provedores}
+        self._executor = ThreadPoolExecutor(max_workers=max_paralelo, thread_name_prefix='provedor')
+
+    def ordem(self) -> list:
+        """Fontes disponíveis (disjuntor fechado), da menor para a maior latência esperada"""
+        disponiveis = [p for p in self.provedores if self.http.disjuntor(p.nome).permitir()]
+        # sorted é estável: sem diferença de custo, vale a ordem configurada
+        return sorted(disponiveis, key=lambda p: self.estatisticas[p.nome].custo_esperado())
+
+    def _chamar(self, provedor: ProvedorCNPJ, cnpj: str, esperar_token: bool):
+        """Chama uma fonte e registra o resultado: ('ok', dados), ('inexistente', None), ('falha', None) ou ('pulado', None)"""
+        limitador = self.limitadores.get(provedor.nome)
+        if limitador is not None and not limitador.adquirir(timeout=None if esperar_token else 0):
+            logger.debug(f"Limite de taxa atingido em {provedor.nome}, tentando próximo provedor")
+            return 'pulado', None
+
+        inicio = time.monotonic()
+        try:
+            dados = provedor.buscar(cnpj, self.http)
+            status = 'ok' if dados is not None else 'falha'
+        except CNPJInexistente:
+            dados, status = None, 'inexistente'
+        except CircuitoAberto as e:
+            logger.debug(str(e))
+            return 'pulado', None
+        except Exception as e:
+            dados, status = None, 'falha'
+            logger.error(f"Erro ao buscar CNPJ {cnpj} em {provedor.rotulo}: {str(e)}")
+
+        duracao = time.monotonic() - inicio
+        self.estatisticas[provedor.nome].registrar(duracao, status != 'falha', status)
+        if status == 'ok':
+            logger.info(f"✅ Dados encontrados ({provedor.rotulo}): {dados['razao_social']}")
+        return status, dados
+
+    def buscar(self, cnpj: str):
+        """Retorna (dados ou None, se alguma fonte afirmou que o CNPJ não existe)"""
+        ordem = self.ordem()
+        if not ordem:
+            return None, False
+        if self.modo == 'sequencial' or len(ordem) == 1:
+            return self._sequencial(cnpj, ordem)
+        return self._paralelo(cnpj, ordem)
+
+    def _sequencial(self, cnpj: str, ordem: list):
+        nao_encontrado = False
+        for i, provedor in enumerate(ordem):
+            status, dados = self._chamar(provedor, cnpj, esperar_token=i == len(ordem) - 1)
+            if status == 'ok':
+                return dados, False
+            nao_encontrado = nao_encontrado or status == 'inexistente'
+        return None, nao_encontrado
+
+    def _paralelo(self, cnpj: str, ordem: list):
+        """Hedged e corrida: dispara fontes conforme o modo e fica com a primeira resposta válida"""
+        pendentes_fontes = list(ordem)
+        em_andamento = {}
+        statuses = []
+
+        def disparar():
+            provedor = pendentes_fontes.pop(0)
+            em_andamento[self._executor.submit(self._chamar, provedor, cnpj, False)] = provedor
+
+        disparar()
+        if self.modo == 'corrida':
+            while pendentes_fontes:
+                disparar()
+
+        try:
+            while em_andamento:
+                espera = None
+                if self.modo == 'hedged' and pendentes_fontes:
+                    # Espera até o p95 das fontes em andamento antes de disparar a próxima
+                    espera = max(self.hedge_minimo, max(self.estatisticas[p.nome].percentil(0.95) for p in em_andamento.values()))
+                prontos, _ = wait(em_andamento, timeout=espera, return_when=FIRST_COMPLETED)
+
+                if not prontos:
+                    logger.debug(f"Hedge: {', '.join(p.rotulo for p in em_andamento.values())} sem resposta em {espera:.2f}s, disparando próximo")
+                    disparar()
+                    continue
+
+                for futuro in prontos:
+                    em_andamento.pop(futuro)
+                    status, dados = futuro.result()
+                    if status == 'ok':
+                        return dados, False
+                    statuses.append(status)
+                # Falhou antes do prazo: não há motivo para esperar o hedge
+                if self.modo == 'hedged' and pendentes_fontes and not em_andamento:
+                    disparar()
+        finally:
+            for futuro in em_andamento:
+                futuro.cancel()
+
+        if all(status == 'pulado' for status in statuses):
+            # Nenhuma fonte tinha token: espera o limitador da melhor, como o último passo do modo sequencial
+            status, dados = self._chamar(ordem[0], cnpj, esperar_token=True)
+            statuses.append(status)
+            if status == 'ok':
+                return dados, False
+        return None, 'inexistente' in statuses
+
+    def metricas(self) -> dict:
+        """Resumo (amostras, p50, p95, taxa de sucesso) de cada fonte"""
+        return {nome: estatisticas.resumo() for nome, estatisticas in self.estatisticas.items()}
@@ -0,0 +1,174 @@
+"""Execução em vários processos para listas com milhões de CNPJs
+
+A entrada é dividida por raiz de CNPJ (8 primeiros dígitos) em N shards, de
+modo que filiais da mesma empresa caem no mesmo processo e aproveitam o
+cache de classificação local. Cada processo recebe 1/N dos limites de taxa de
+cada provedor e usa os mesmos caches SQLite em disco. A saída é remontada na
+ordem original das linhas, então o resultado não depende de qual shard
+terminou primeiro.
+"""
+
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import pandas as pd
+
+from planilhas import TAMANHO_BLOCO, abrir_escritor, acumular_resumo, ler_em_blocos, resumo_vazio
+
+logger = logging.getLogger('GrupoEconomicoApp')
+
+def shards_dos_cnpjs(valores, n_shards: int) -> pd.Series:
+    """Shard estável de cada valor (crc32 da raiz do CNPJ); valores inválidos são distribuídos pelo texto
+
+    A raiz vem de normalizar_cnpjs, a mesma normalização do processamento:
+    '7526557000100' (número no Excel), '07.526.557/0001-00' e o CNPJ de um
+    resultado anterior caem no mesmo shard.
+    """
+    from grupos_economicos import normalizar_cnpjs
+
+    normalizados = normalizar_cnpjs(valores)
+    chaves = normalizados['cnpj'].str[:8].fillna(normalizados['original'])
+    return chaves.map(lambda chave: zlib.crc32(str(chave).encode('utf-8')) % n_shards)
+
+def shard_do_cnpj(valor, n_shards: int) -> int:
+    """shards_dos_cnpjs para um único valor"""
+    return int(shards_dos_cnpjs([valor], n_shards).iloc[0])
+
+def dividir_anteriores(anteriores: dict, n_shards: int) -> list:
+    """Divide {cnpj: resultado} do modo incremental pelo mesmo critério das linhas de entrada"""
+    divididos = [{} for _ in range(n_shards)]
+    if anteriores:
+        for cnpj, shard in zip(anteriores, shards_dos_cnpjs(list(anteriores), n_shards)):
+            divididos[shard][cnpj] = anteriores[cnpj]
+    return divididos
+
+def _gravar_bloco(arquivo, df):
+    pickle.dump(df, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _ler_blocos(caminho: str):
+    with open(caminho, 'rb') as arquivo:
+        while True:
+            try:
+                yield pickle.load(arquivo)
+            except EOFError:
+                return
+
+def limites_por_processo(limites: dict, n_processos: int) -> dict:
+    """Divide (por minuto, rajada) de cada provedor igualmente entre os processos"""
+    return {
+        provedor: (por_minuto / n_processos, max(1, rajada // n_processos))
+        for provedor, (por_minuto, rajada) in limites.items()
+    }
+
+def configuracao_shard(app, n_processos: int) -> dict:
+    """Parâmetros (serializáveis) para recriar `app` num processo filho com 1/N dos limites e os mesmos caches"""
+    return {
+        'grupos': app.grupos_conhecidos,
+        'limites': limites_por_processo(app.limites, n_processos),
+        'urls': app.urls,
+        'modo_provedores': app.estrategia.modo,
+        'limiar_similaridade': app.similaridade.limiar,
+        'cache': app.cache.caminho,
+        'cache_classificacao': (app.cache_classificacao.versao, app.cache_classificacao.caminho),
+        'base_offline': app.base_offline.caminho if app.base_offline else None
+    }
+
+def _criar_app(config: dict):
+    from base_receita import BaseReceita
+    from grupos_economicos import CacheClassificacao, CacheCNPJ, GrupoEconomicoApp
+
+    return GrupoEconomicoApp(
+        config['grupos'], limites=config['limites'], urls=config['urls'], cache=CacheCNPJ(config['cache']),
+        cache_classificacao=CacheClassificacao(*config['cache_classificacao']),
+        base_offline=BaseReceita(config['base_offline']) if config['base_offline'] else None,
+        modo_provedores=config['modo_provedores'], limiar_similaridade=config['limiar_similaridade']
+    )
+
+def _processar_shard(indice: int, entrada: str, saida: str, cnpj_col: str, config: dict,
+                     gemini_key: str, perplexity_key: str, max_workers: int, tamanho_lote: int, nivel_log: int, anteriores: dict = None) -> int:
+    """Executado no processo filho: processa os blocos de um shard, um bloco de saída por bloco de entrada"""
+    logging.basicConfig(level=nivel_log, format=f'%(asctime)s - shard {indice} - %(levelname)s - %(message)s')
+    from grupos_economicos import GrafoSocietario
+
+    app = _criar_app(config)
+    # Filiais da mesma raiz estão todas neste shard; sócios PJ em comum só se ligam dentro dele
+    grafo = GrafoSocietario()
+    linhas = 0
+    with open(saida, 'wb') as arquivo:
+        for bloco in _ler_blocos(entrada):
+            if len(bloco):
+                resultados = app.processar_cnpjs(
+                    bloco[cnpj_col].tolist(), gemini_key, perplexity_key, max_workers, tamanho_lote, anteriores=anteriores, grafo=grafo
+                )
+                bloco = app.montar_resultado(bloco, cnpj_col, resultados)
+            else:
+                bloco = app.montar_resultado(bloco, cnpj_col, [])
+            _gravar_bloco(arquivo, bloco)
+            linhas += len(bloco)
+    return linhas
+
+def processar_em_shards(app, entrada: str, saida: str, cnpj_col: str, n_processos: int, gemini_key: str = None,
+                        perplexity_key: str = None, max_workers: int = 1, tamanho_lote: int = 1,
+                        tamanho_bloco: int = TAMANHO_BLOCO, ao_progredir=None, diretorio_trabalho: str = None, anteriores: dict = None) -> dict:
+    """Processa `entrada` em `n_processos` processos e grava o resultado único em `saida`
+
+    `app` fornece os grupos, as URLs, os caminhos dos caches e os limites
+    totais de taxa, que são divididos entre os processos. `anteriores` (modo
+    incremental) é dividido pelo mesmo critério dos CNPJs. Retorna o mesmo resumo de processar_em_blocos.
+    """
+    temporario = tempfile.mkdtemp(prefix='shards_', dir=diretorio_trabalho)
+    try:
+        # 1) Divisão: cada bloco de entrada gera um pedaço (possivelmente vazio) em cada shard
+        entradas = [os.path.join(temporario, f'entrada_{i}.pkl') for i in range(n_processos)]
+        arquivos = [open(caminho, 'wb') for caminho in entradas]
+        total = 0
+        try:
+            for bloco in ler_em_blocos(entrada, tamanho_bloco=tamanho_bloco):
+                shards = shards_dos_cnpjs(bloco[cnpj_col], n_processos)
+                for i, arquivo in enumerate(arquivos):
+                    _gravar_bloco(arquivo, bloco[shards == i])
+                total += len(bloco)
+        finally:
+            for arquivo in arquivos:
+                arquivo.close()
+        logger.info(f"{total} linhas divididas em {n_processos} shards")
+
+        # 2) Processamento paralelo; os caches SQLite em disco são compartilhados
+        saidas = [os.path.join(temporario, f'saida_{i}.pkl') for i in range(n_processos)]
+        config = configuracao_shard(app, n_processos)
+        anteriores_shard = dividir_anteriores(anteriores or {}, n_processos)
+        concluidas = 0
+        with ProcessPoolExecutor(max_workers=n_processos, mp_context=get_context('spawn')) as executor:
+            futuros = [
+                executor.submit(
+                    _processar_shard, i, entradas[i], saidas[i], cnpj_col, config,
+                    gemini_key, perplexity_key, max_workers, tamanho_lote, logger.getEffectiveLevel(), anteriores_shard[i]
+                )
+                for i in range(n_processos)
+            ]
+            for futuro in as_completed(futuros):
+                concluidas += futuro.result()
+                logger.info(f"Shard concluído: {concluidas}/{total} linhas")
+                if ao_progredir:
+                    ao_progredir(concluidas, total, None)
+
+        # 3) Junção determinística: bloco k de todos os shards, reordenado pelo índice original
+        resumo = resumo_vazio()
+        escritor = abrir_escritor(saida)
+        leitores = [_ler_blocos(caminho) for caminho in saidas]
+        try:
+            for pedacos in zip(*leitores):
+                df_bloco = pd.concat(pedacos).sort_index()
+                escritor.escrever(df_bloco)
+                acumular_resumo(resumo, df_bloco)
+        finally:
+            escritor.fechar()
+        return resumo
+    finally:
+        shutil.rmtree(temporario, ignore_errors=True)
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos do projeto ficam na raiz do repositório, sem pacote
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grupos_economicos import CacheClassificacao, CacheCNPJ, GrupoEconomicoApp  # noqa: E402
+from provedores import ProvedorCNPJ  # noqa: E402
+
+class ProvedorFalso(ProvedorCNPJ):
+    """Fonte de CNPJ em memória: devolve `responder(cnpj)` e registra as consultas"""
+    nome = 'falso'
+    rotulo = 'Falso'
+
+    def __init__(self, responder):
+        super().__init__('')
+        self.responder = responder
+        self.consultas = []
+
+    def buscar(self, cnpj, http):
+        self.consultas.append(cnpj)
+        return self.responder(cnpj)
+
+@pytest.fixture
+def provedor_falso():
+    """Cria um ProvedorFalso a partir da função que responde cada CNPJ"""
+    return ProvedorFalso
+
+@pytest.fixture
+def criar_app(tmp_path):
+    """Cria um GrupoEconomicoApp com caches em tmp_path e, se informada, uma única fonte de CNPJ"""
+    def criar(grupos: dict = None, provedor: ProvedorCNPJ = None, ttl_campos: dict = None, **kwargs):
+        return GrupoEconomicoApp(
+            grupos if grupos is not None else {},
+            cache=CacheCNPJ(str(tmp_path / 'cnpj.db'), ttl_campos=ttl_campos),
+            cache_classificacao=CacheClassificacao('teste', str(tmp_path / 'classificacao.db')),
+            provedores_cnpj=[provedor] if provedor is not None else None,
+            **kwargs
+        )
+    return criar
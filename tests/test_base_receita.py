@@ -0,0 +1,66 @@
+import os
+import zipfile
+
+import pytest
+
+from base_receita import BaseReceita, ingerir
+
+# Mesmo layout dos Dados Abertos: CSV ';' em latin-1, sem cabeçalho, todos os campos entre aspas
+EMPRESAS = [
+    ['07526557', 'AMBEV S.A.', '2046', '10', '57000000000,00', '05', ''],
+    ['33000167', 'PETRÓLEO BRASILEIRO S.A. PETROBRAS', '2038', '16', '205431960490,52', '05', ''],
+]
+ESTABELECIMENTOS = [
+    ['07526557', '0001', '00', '1', 'AMBEV', '02', '20050903', '00', '', '', '19990714', '1113502', ''],
+    ['07526557', '0010', '09', '2', 'FILIAL JAGUARIÚNA', '08', '20200101', '01', '', '', '20000101', '1113502', ''],
+    ['33000167', '0001', '01', '1', 'PETROBRAS', '02', '20050903', '00', '', '', '19661007', '0600001', ''],
+]
+CNAES = [
+    ['1113502', 'Fabricação de cervejas e chopes'],
+    ['0600001', 'Extração de petróleo e gás natural'],
+]
+
+def gravar_csv(caminho, linhas):
+    with open(caminho, 'w', encoding='latin-1', newline='') as f:
+        for linha in linhas:
+            f.write(';'.join(f'"{campo}"' for campo in linha) + '\r\n')
+
+@pytest.fixture
+def dump(tmp_path):
+    diretorio = tmp_path / 'dados_abertos'
+    diretorio.mkdir()
+    gravar_csv(diretorio / 'K3241.K03200Y0.D40511.EMPRECSV', EMPRESAS)
+    gravar_csv(diretorio / 'F.K03200$Z.D40511.CNAECSV', CNAES)
+    # Estabelecimentos zipados, como são distribuídos, divididos em dois arquivos
+    for i, linhas in enumerate((ESTABELECIMENTOS[:2], ESTABELECIMENTOS[2:])):
+        gravar_csv(tmp_path / f'K3241.K03200Y{i}.D40511.ESTABELE', linhas)
+        with zipfile.ZipFile(diretorio / f'Estabelecimentos{i}.zip', 'w') as zf:
+            zf.write(tmp_path / f'K3241.K03200Y{i}.D40511.ESTABELE', f'K3241.K03200Y{i}.D40511.ESTABELE')
+    return str(diretorio)
+
+def test_ingerir_e_buscar(dump, tmp_path):
+    destino = str(tmp_path / 'base' / 'receita.sqlite3')
+    contagens = ingerir(dump, destino, tamanho_bloco=1)
+    assert contagens == {'empresas': 2, 'estabelecimentos': 3, 'cnaes': 2}
+    assert not os.path.exists(destino + '.tmp')
+
+    base = BaseReceita(destino)
+    assert base.buscar('07526557000100') == {
+        'razao_social': 'AMBEV S.A.',
+        'nome_fantasia': 'AMBEV',
+        'atividade': 'Fabricação de cervejas e chopes',
+        'situacao': 'ATIVA'
+    }
+    filial = base.buscar('07526557001009')
+    assert filial['razao_social'] == 'AMBEV S.A.'
+    assert filial['nome_fantasia'] == 'FILIAL JAGUARIÚNA'
+    assert filial['situacao'] == 'BAIXADA'
+    assert base.buscar('33000167000101')['razao_social'] == 'PETRÓLEO BRASILEIRO S.A. PETROBRAS'
+    assert base.buscar('11222333000181') is None
+
+def test_nova_carga_substitui_a_base(dump, tmp_path):
+    destino = str(tmp_path / 'receita.sqlite3')
+    ingerir(dump, destino)
+    os.remove(os.path.join(dump, 'Estabelecimentos1.zip'))
+    assert ingerir(dump, destino)['estabelecimentos'] == 2
+    assert BaseReceita(destino).buscar('33000167000101') is None
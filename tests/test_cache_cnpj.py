@@ -0,0 +1,63 @@
+import pytest
+
+from grupos_economicos import NAO_ENCONTRADO, CacheCNPJ
+
+CNPJ = '07526557000100'
+DADOS = {
+    'razao_social': 'AMBEV S.A.', 'nome_fantasia': 'AMBEV', 'atividade': 'Fabricação de cerveja',
+    'situacao': 'ATIVA', 'qsa': [{'nome': 'HOLDING X S.A.', 'qualificacao': 'Sócio', 'documento': None}]
+}
+
+def test_registro_completo(tmp_path):
+    cache = CacheCNPJ(str(tmp_path / 'cnpj.db'))
+    cache.salvar(CNPJ, DADOS)
+    assert cache.obter(CNPJ) == DADOS
+    assert cache.vencidos(cache.obter(CNPJ)) == []
+
+def test_campo_vencido_nao_derruba_os_outros(tmp_path):
+    cache = CacheCNPJ(str(tmp_path / 'cnpj.db'), ttl_campos={'situacao': -1})
+    cache.salvar(CNPJ, DADOS)
+    dados = cache.obter(CNPJ)
+    assert 'situacao' not in dados
+    assert dados['razao_social'] == 'AMBEV S.A.'
+    assert cache.vencidos(dados) == ['situacao']
+
+def test_registro_vence_com_o_campo_mais_longo(tmp_path):
+    cache = CacheCNPJ(str(tmp_path / 'cnpj.db'), ttl_campos={campo: -1 for campo in DADOS})
+    cache.salvar(CNPJ, DADOS)
+    assert cache.obter(CNPJ) is None
+
+def test_nao_encontrado(tmp_path):
+    cache = CacheCNPJ(str(tmp_path / 'cnpj.db'))
+    cache.salvar_nao_encontrado(CNPJ)
+    assert cache.obter(CNPJ) is NAO_ENCONTRADO
+    cache.limpar()
+    assert cache.obter(CNPJ) is None
+
+def test_despejo_lru(tmp_path):
+    cache = CacheCNPJ(str(tmp_path / 'cnpj.db'), max_entradas=2)
+    for i in range(3):
+        cache.salvar(f'{i:014d}', DADOS)
+    cache.obter(f'{0:014d}')
+    cache.despejar()
+    assert len(cache) == 2
+    assert cache.obter(f'{1:014d}') is None
+
+@pytest.fixture
+def app_com_respostas(criar_app, provedor_falso):
+    """App cuja fonte devolve `respostas` em ordem, com a situação cadastral sempre vencida no cache"""
+    def criar(respostas):
+        return criar_app(provedor=provedor_falso(lambda cnpj: respostas.pop(0)), ttl_campos={'situacao': -1})
+    return criar
+
+def test_situacao_vencida_busca_de_novo(app_com_respostas):
+    app = app_com_respostas([DADOS, {**DADOS, 'situacao': 'BAIXADA'}])
+    assert app.buscar_cnpj(CNPJ)['situacao'] == 'ATIVA'
+    assert app.buscar_cnpj(CNPJ)['situacao'] == 'BAIXADA'
+
+def test_fontes_fora_do_ar_usam_os_campos_validos(app_com_respostas):
+    app = app_com_respostas([DADOS, None])
+    app.buscar_cnpj(CNPJ)
+    dados = app.buscar_cnpj(CNPJ)
+    assert dados['razao_social'] == 'AMBEV S.A.'
+    assert dados['situacao'] == ''
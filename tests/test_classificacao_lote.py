@@ -0,0 +1,46 @@
+import json
+import re
+
+import pytest
+
+from grupos_economicos import PROMPT_LOTE, PROMPT_SISTEMA_LOTE, _linha_lote
+
+def empresas(quantidade: int) -> list:
+    return [{'cnpj': f'{i:014d}', 'razao_social': f'PADARIA {i}', 'nome_fantasia': ''} for i in range(1, quantidade + 1)]
+
+@pytest.fixture
+def app(criar_app):
+    return criar_app({f'GRUPO {i}': [f'marca {i}'] for i in range(200)})
+
+def test_lotes_respeitam_o_orcamento_com_a_parte_fixa_do_prompt(app):
+    max_tokens_prompt = 900
+    lotes = app._montar_lotes(empresas(60), 25, max_tokens_prompt)
+    assert sum(map(len, lotes)) == 60
+    for lote in lotes:
+        prompt = PROMPT_SISTEMA_LOTE + PROMPT_LOTE.format(grupos=app.lista_grupos, empresas='\n'.join(map(_linha_lote, lote)))
+        assert len(prompt) // 4 <= max_tokens_prompt
+
+def test_parte_fixa_maior_que_o_orcamento_manda_uma_empresa_por_lote(app):
+    assert [len(lote) for lote in app._montar_lotes(empresas(3), 25, 100)] == [1, 1, 1]
+
+def test_itens_faltando_na_resposta_voltam_em_lotes_menores(app):
+    prompts = []
+
+    def gerar_varios(lista, api_key, modo_json=False):
+        respostas = []
+        for prompt in lista:
+            prompts.append(prompt)
+            cnpjs = re.findall(r'^(\d{14}) \|', prompt, re.MULTILINE)
+            texto = json.dumps([{'cnpj': cnpj, 'grupo_economico': 'INDEPENDENTE', 'confianca': 80} for cnpj in cnpjs])
+            # Lotes grandes voltam truncados no meio do último objeto
+            respostas.append((texto[:texto.rindex('{') + 20] if len(cnpjs) > 2 else texto, 'falso'))
+        return respostas
+
+    app.gemini.gerar_varios = gerar_varios
+    lista = empresas(9)
+    resultados = app.classificar_em_lote(lista, gemini_key='g', tamanho_lote=4)
+
+    assert set(resultados) == {empresa['cnpj'] for empresa in lista}
+    assert {r['metodo'] for r in resultados.values()} == {'Gemini (falso) lote'}
+    # Tentativa 1: lotes de 4, 4 e 1 (dois itens truncados); tentativa 2: os dois num lote de até 2
+    assert [len(re.findall(r'^\d{14} \|', p, re.MULTILINE)) for p in prompts] == [4, 4, 1, 2]
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from grupos_economicos import Coalescedor
+
+CHAMADAS = 8
+
+def esperar(condicao, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, 'condição não atingida a tempo'
+        time.sleep(0.005)
+
+def em_paralelo(coalescedor, chave, funcao, liberar):
+    """Dispara CHAMADAS execuções simultâneas e só libera `funcao` quando todas estão esperando"""
+    executor = ThreadPoolExecutor(max_workers=CHAMADAS)
+    futuros = [executor.submit(coalescedor.executar, chave, funcao) for _ in range(CHAMADAS)]
+    try:
+        esperar(lambda: coalescedor.metricas()['coalescidas'] == CHAMADAS - 1)
+    finally:
+        liberar.set()
+        executor.shutdown(wait=True)
+    return futuros
+
+def test_chamadas_simultaneas_executam_uma_vez():
+    coalescedor, liberar, chamadas = Coalescedor(), threading.Event(), []
+
+    def funcao():
+        chamadas.append(threading.current_thread().name)
+        liberar.wait()
+        return {'grupo_economico': 'AMBEV'}
+
+    futuros = em_paralelo(coalescedor, 'chave', funcao, liberar)
+    resultados = [futuro.result() for futuro in futuros]
+    assert len(chamadas) == 1
+    assert all(resultado is resultados[0] for resultado in resultados)
+    assert coalescedor.metricas() == {'executadas': 1, 'coalescidas': CHAMADAS - 1, 'em_andamento': 0}
+
+def test_erro_chega_a_todos_que_esperavam():
+    coalescedor, liberar = Coalescedor(), threading.Event()
+
+    def funcao():
+        liberar.wait()
+        raise ValueError('fonte fora do ar')
+
+    futuros = em_paralelo(coalescedor, 'chave', funcao, liberar)
+    erros = [futuro.exception() for futuro in futuros]
+    assert all(isinstance(erro, ValueError) for erro in erros)
+    assert coalescedor.metricas()['em_andamento'] == 0
+    # Terminada a execução com erro, a próxima chamada executa de novo
+    assert coalescedor.executar('chave', lambda: 'ok') == 'ok'
+
+def test_chaves_diferentes_nao_se_esperam():
+    coalescedor, liberar = Coalescedor(), threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        bloqueada = executor.submit(coalescedor.executar, 'a', liberar.wait)
+        esperar(lambda: coalescedor.metricas()['em_andamento'] == 1)
+        assert coalescedor.executar('b', lambda: 'b') == 'b'
+        liberar.set()
+        assert bloqueada.result() is True
+    assert coalescedor.metricas()['coalescidas'] == 0
+
+def test_consultas_simultaneas_ao_mesmo_cnpj_chamam_a_fonte_uma_vez(criar_app, provedor_falso):
+    liberar = threading.Event()
+
+    def responder(cnpj):
+        liberar.wait()
+        return {'razao_social': 'AMBEV S.A.', 'nome_fantasia': '', 'atividade': '', 'situacao': 'ATIVA', 'qsa': []}
+
+    provedor = provedor_falso(responder)
+    app = criar_app(provedor=provedor)
+    with ThreadPoolExecutor(max_workers=CHAMADAS) as executor:
+        futuros = [executor.submit(app.buscar_cnpj, '07526557000100') for _ in range(CHAMADAS)]
+        try:
+            esperar(lambda: app.coalescedores['cnpj'].metricas()['coalescidas'] == CHAMADAS - 1)
+        finally:
+            liberar.set()
+    assert provedor.consultas == ['07526557000100']
+    assert {futuro.result()['razao_social'] for futuro in futuros} == {'AMBEV S.A.'}
@@ -0,0 +1,69 @@
+import json
+import re
+import threading
+
+from gemini_cliente import ClienteGemini
+from http_cliente import ClienteHTTP
+
+class Resposta:
+    def __init__(self, texto):
+        self.text = texto
+        self.usage_metadata = None
+
+class ModeloFalso:
+    """Responde ao prompt com `responder(prompt)`; levanta a exceção se `falhar`"""
+    def __init__(self, nome, responder, falhar=False):
+        self.nome = nome
+        self.responder = responder
+        self.falhar = falhar
+        self.chamadas = []
+
+    def generate_content(self, prompt):
+        self.chamadas.append(threading.current_thread().name)
+        if self.falhar:
+            raise RuntimeError(f'{self.nome} fora do ar')
+        return Resposta(self.responder(prompt))
+
+def cliente_falso(modelos: dict, **kwargs) -> ClienteGemini:
+    cliente = ClienteGemini(modelos=list(modelos), **kwargs)
+    cliente._handle = lambda api_key, modelo, modo_json: modelos[modelo]
+    return cliente
+
+def test_modelo_com_falhas_seguidas_fica_de_fora():
+    flash = ModeloFalso('flash', lambda prompt: '{}', falhar=True)
+    pro = ModeloFalso('pro', lambda prompt: '{"ok": true}')
+    cliente = cliente_falso({'flash': flash, 'pro': pro}, falhas_para_resfriar=2, resfriamento=60)
+
+    for _ in range(3):
+        assert cliente.gerar_json('p', 'chave') == ({'ok': True}, 'pro')
+    assert len(flash.chamadas) == 2
+    assert cliente.ordem() == ['pro']
+    assert cliente.saude() == {'flash': False, 'pro': True}
+
+def test_gerar_json_invalido():
+    cliente = cliente_falso({'flash': ModeloFalso('flash', lambda prompt: 'não é json')})
+    assert cliente.gerar_json('p', 'chave') == (None, 'flash')
+
+def test_gerar_varios_em_paralelo_na_ordem():
+    modelo = ModeloFalso('flash', lambda prompt: prompt.upper())
+    cliente = cliente_falso({'flash': modelo}, max_paralelo=3)
+    prompts = [f'prompt {i}' for i in range(6)]
+    assert cliente.gerar_varios(prompts, 'chave') == [(p.upper(), 'flash') for p in prompts]
+    assert all(nome.startswith('gemini') for nome in modelo.chamadas)
+
+def responder_lote(prompt):
+    cnpjs = re.findall(r'^(\d{14}) \|', prompt, re.MULTILINE)
+    return json.dumps([{'cnpj': cnpj, 'grupo_economico': 'INDEPENDENTE', 'confianca': 80} for cnpj in cnpjs])
+
+def test_lotes_vao_ao_gemini_pelo_cliente(criar_app):
+    # Perplexity inacessível: os lotes caem no Gemini
+    app = criar_app(urls={'perplexity': 'http://127.0.0.1:9/'}, http=ClienteHTTP(max_tentativas=1))
+    modelo = ModeloFalso('gemini-2.5-flash', responder_lote)
+    app.gemini._handle = lambda api_key, nome, modo_json: modelo
+    empresas = [{'cnpj': f'{i:014d}', 'razao_social': f'PADARIA {i}', 'nome_fantasia': ''} for i in range(1, 10)]
+
+    resultados = app.classificar_em_lote(empresas, gemini_key='g', perplexity_key='p', tamanho_lote=3)
+    assert set(resultados) == {empresa['cnpj'] for empresa in empresas}
+    assert {r['metodo'] for r in resultados.values()} == {'Gemini (gemini-2.5-flash) lote'}
+    assert len(modelo.chamadas) == 3
+    assert all(nome.startswith('gemini') for nome in modelo.chamadas)
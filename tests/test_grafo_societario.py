@@ -0,0 +1,42 @@
+from grupos_economicos import GrafoSocietario, normalizar_nome, NOME_PESSOA_JURIDICA
+
+AMBEV = {'grupo_economico': 'AMBEV', 'confianca': 90, 'metodo': 'Regras'}
+
+def empresa(razao, *socios):
+    return {'razao_social': razao, 'qsa': [{'nome': nome, 'qualificacao': '', 'documento': documento} for nome, documento in socios]}
+
+def test_nome_pessoa_juridica():
+    for nome in ('XYZ PARTICIPACOES LTDA', 'ACME S/A', 'ACME S.A.', 'CIA DE BEBIDAS'):
+        assert NOME_PESSOA_JURIDICA.search(normalizar_nome(nome)), nome
+    for nome in ('JOSÉ DE SÁ', 'MARIA SÁ DE OLIVEIRA', 'SAMUEL SANTOS'):
+        assert not NOME_PESSOA_JURIDICA.search(normalizar_nome(nome)), nome
+
+def test_socio_pessoa_fisica_nao_liga_empresas():
+    grafo = GrafoSocietario()
+    grafo.adicionar('11111111000111', empresa('BAR DO ZE LTDA', ('JOSÉ DE SÁ', None)))
+    grafo.adicionar('22222222000122', empresa('PADARIA CENTRAL LTDA', ('JOSÉ DE SÁ', None)))
+    grafo.definir_grupo('11111111000111', AMBEV)
+    assert grafo.grupo('22222222000122') is None
+    assert grafo.componente('11111111000111') != grafo.componente('22222222000122')
+
+def test_socio_pessoa_juridica_propaga_o_grupo():
+    grafo = GrafoSocietario()
+    grafo.adicionar('11111111000111', empresa('DISTRIBUIDORA A LTDA', ('HOLDING XYZ PARTICIPACOES S.A.', None)))
+    grafo.adicionar('22222222000122', empresa('DISTRIBUIDORA B LTDA', ('HOLDING XYZ PARTICIPACOES S.A.', None)))
+    grafo.adicionar('33333333000133', empresa('DISTRIBUIDORA C LTDA', ('SOCIO COM CNPJ', '11111111000111')))
+    grafo.definir_grupo('22222222000122', AMBEV)
+    assert grafo.grupo('11111111000111') == AMBEV
+    assert grafo.grupo('33333333000133') == AMBEV
+
+def test_filiais_compartilham_a_raiz():
+    grafo = GrafoSocietario()
+    grafo.adicionar('11111111000111', empresa('EMPRESA A LTDA'))
+    grafo.adicionar('11111111000292', empresa('EMPRESA A LTDA FILIAL'))
+    assert grafo.componente('11111111000111') == grafo.componente('11111111000292')
+
+def test_independente_e_padrao_nao_propagam():
+    grafo = GrafoSocietario()
+    grafo.adicionar('11111111000111', empresa('EMPRESA A LTDA'))
+    grafo.definir_grupo('11111111000111', {'grupo_economico': 'INDEPENDENTE', 'confianca': 80, 'metodo': 'Gemini'})
+    grafo.definir_grupo('11111111000111', {'grupo_economico': 'AMBEV', 'confianca': 30, 'metodo': 'Padrão'})
+    assert grafo.grupo('11111111000292') is None
@@ -0,0 +1,125 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_cliente import CircuitoAberto, ClienteHTTP, Disjuntor
+from metricas import Metricas
+
+class Stub:
+    """Servidor HTTP local que responde uma fila de (status, headers) e registra as requisições"""
+    def __init__(self):
+        self.respostas = []
+        self.requisicoes = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.requisicoes.append(self.client_address)
+                status, headers = stub.respostas.pop(0) if stub.respostas else (200, {})
+                corpo = b'{}'
+                self.send_response(status)
+                for nome, valor in headers.items():
+                    self.send_header(nome, valor)
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.servidor.server_address[1]}/'
+        threading.Thread(target=self.servidor.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    def fechar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+@pytest.fixture
+def stub():
+    servidor = Stub()
+    yield servidor
+    servidor.fechar()
+
+def test_repete_5xx_e_devolve_o_sucesso(stub):
+    metricas = Metricas()
+    cliente = ClienteHTTP(backoff_base=0.01, metricas=metricas)
+    stub.respostas = [(503, {}), (502, {}), (200, {})]
+    assert cliente.get('teste', stub.url).status_code == 200
+    assert len(stub.requisicoes) == 3
+    assert metricas.valor('http_retentativas_total', provedor='teste') == 2
+
+def test_ultima_resposta_volta_ao_chamador(stub):
+    cliente = ClienteHTTP(max_tentativas=2, backoff_base=0.01)
+    stub.respostas = [(500, {}), (500, {})]
+    assert cliente.get('teste', stub.url).status_code == 500
+    assert len(stub.requisicoes) == 2
+
+def test_respeita_retry_after(stub):
+    # Sem o Retry-After, o backoff de 10s estouraria o tempo do teste
+    cliente = ClienteHTTP(backoff_base=10)
+    stub.respostas = [(429, {'Retry-After': '0.3'}), (200, {})]
+    inicio = time.monotonic()
+    assert cliente.get('teste', stub.url).status_code == 200
+    assert 0.3 <= time.monotonic() - inicio < 3
+
+def test_retry_after_longo_suspende_o_provedor(stub):
+    cliente = ClienteHTTP(max_retry_after=5)
+    stub.respostas = [(429, {'Retry-After': '120'})]
+    assert cliente.get('teste', stub.url).status_code == 429
+    with pytest.raises(CircuitoAberto):
+        cliente.get('teste', stub.url)
+    assert len(stub.requisicoes) == 1
+    # Outros provedores não são afetados
+    assert cliente.get('outro', stub.url).status_code == 200
+
+def test_disjuntor_abre_e_libera_uma_tentativa(stub):
+    cliente = ClienteHTTP(max_tentativas=1, falhas_para_abrir=2, tempo_aberto=0.3)
+    stub.respostas = [(500, {}), (500, {}), (500, {})]
+    cliente.get('teste', stub.url)
+    cliente.get('teste', stub.url)
+    with pytest.raises(CircuitoAberto):
+        cliente.get('teste', stub.url)
+    assert len(stub.requisicoes) == 2
+
+    time.sleep(0.35)
+    # Meio-aberto: uma tentativa passa e, falhando, reabre na hora
+    assert cliente.get('teste', stub.url).status_code == 500
+    with pytest.raises(CircuitoAberto):
+        cliente.get('teste', stub.url)
+
+    time.sleep(0.35)
+    assert cliente.get('teste', stub.url).status_code == 200
+    assert cliente.disjuntor('teste').falhas == 0
+
+def test_reaproveita_a_conexao(stub):
+    cliente = ClienteHTTP(pools={stub.url: 2})
+    for _ in range(3):
+        cliente.get('teste', stub.url)
+    assert len(set(stub.requisicoes)) == 1
+
+def porta_livre() -> int:
+    """Porta local sem ninguém escutando"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def test_erro_de_conexao_repete_e_propaga():
+    porta = porta_livre()
+    cliente = ClienteHTTP(max_tentativas=2, backoff_base=0.01)
+    with pytest.raises(requests.ConnectionError):
+        cliente.get('teste', f'http://127.0.0.1:{porta}/', timeout=1)
+    assert cliente.disjuntor('teste').falhas == 2
+
+def test_disjuntor_pausar():
+    disjuntor = Disjuntor()
+    disjuntor.pausar(60)
+    assert not disjuntor.permitir()
+    disjuntor.registrar_sucesso()
+    assert disjuntor.permitir()
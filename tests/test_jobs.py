@@ -0,0 +1,55 @@
+import re
+
+import pandas as pd
+
+import jobs
+from benchmark import gerar_planilha
+from jobs import GerenciadorJobs
+
+LINHAS = 35
+
+def executar(gerenciador: GerenciadorJobs, job_id: str, app):
+    assert gerenciador.iniciar(job_id, app)
+    gerenciador._threads[job_id].join(timeout=30)
+    return gerenciador.status(job_id)
+
+def test_job_pausado_retoma_sem_repetir_nem_pular_linhas(tmp_path, monkeypatch, criar_app, provedor_falso):
+    monkeypatch.setattr(jobs, 'LINHAS_POR_CHECKPOINT', 10)
+    planilha = tmp_path / 'entrada.csv'
+    gerar_planilha(str(planilha), LINHAS, duplicados=0.0)
+    gerenciador = GerenciadorJobs(str(tmp_path / 'jobs'))
+    job_id = gerenciador.criar(planilha.read_bytes(), 'entrada.csv', 'cnpj', 'csv')
+
+    def responder(cnpj):
+        # Pausa no meio do segundo checkpoint: ele termina e o job para antes do terceiro
+        if len(provedor.consultas) == 15:
+            gerenciador.pausar(job_id)
+        return {'razao_social': f'EMPRESA {cnpj}', 'nome_fantasia': '', 'atividade': '', 'situacao': 'ATIVA', 'qsa': []}
+
+    provedor = provedor_falso(responder)
+    app = criar_app(provedor=provedor)
+    processadas = []
+    processar_cnpjs = app.processar_cnpjs
+
+    def registrar(cnpjs, *args, **kwargs):
+        processadas.extend(range(kwargs['inicio'], kwargs['inicio'] + len(cnpjs)))
+        return processar_cnpjs(cnpjs, *args, **kwargs)
+
+    app.processar_cnpjs = registrar
+
+    status = executar(gerenciador, job_id, app)
+    assert status['status'] == 'pausado'
+    assert status['feitas'] == 20
+
+    # Outro gerenciador sobre o mesmo diretório, como depois de reiniciar o servidor
+    status = executar(GerenciadorJobs(str(tmp_path / 'jobs')), job_id, app)
+    assert status['status'] == 'concluido'
+    assert status['feitas'] == LINHAS
+    assert sorted(processadas) == list(range(LINHAS))
+    assert len(provedor.consultas) == LINHAS
+
+    entrada = pd.read_csv(planilha, dtype=str)
+    saida = pd.read_csv(status['caminho_saida'], dtype=str)
+    assert saida['original_linha'].tolist() == entrada['linha'].tolist()
+    assert saida['cnpj'].tolist() == [re.sub(r'\D', '', c) for c in entrada['cnpj']]
+    assert (saida['razao_social'] == 'EMPRESA ' + saida['cnpj']).all()
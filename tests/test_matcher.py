@@ -0,0 +1,51 @@
+import pandas as pd
+
+from grupos_economicos import GRUPOS_PATH, MatcherGrupos, carregar_grupos
+
+GRUPOS = carregar_grupos(GRUPOS_PATH)
+
+def grupos(matcher, texto):
+    return [m['grupo'] for m in matcher.encontrar(texto)]
+
+def test_trecho_de_palavra_casa_por_padrao():
+    matcher = MatcherGrupos(GRUPOS)
+    assert grupos(matcher, 'ITAUCARD S.A.') == ['ITAU']
+    assert grupos(matcher, 'ITAUSA S.A.') == ['ITAU']
+    assert grupos(matcher, 'Cervejaria Brahma') == ['AMBEV']
+
+def test_palavra_inteira_e_opcional():
+    matcher = MatcherGrupos(GRUPOS, palavra_inteira=True)
+    assert grupos(matcher, 'VALENÇA TÊXTIL LTDA') == []
+    assert grupos(matcher, 'ITAUCARD S.A.') == []
+    assert grupos(matcher, 'VALE S.A.') == ['VALE']
+
+def test_ignora_acentos_e_informa_posicoes():
+    matcher = MatcherGrupos(GRUPOS)
+    encontrados = matcher.encontrar('Banco Itaú Unibanco S/A')
+    assert [(m['grupo'], m['keyword'], m['inicio'], m['fim']) for m in encontrados] == [
+        ('ITAU', 'itau', 6, 10), ('ITAU', 'unibanco', 11, 19)
+    ]
+
+def test_keyword_de_varios_grupos():
+    matcher = MatcherGrupos({'A': ['xpto'], 'B': ['xpto', 'outra']})
+    assert grupos(matcher, 'XPTO LTDA') == ['A', 'B']
+
+def test_classificar_serie():
+    matcher = MatcherGrupos(GRUPOS)
+    nomes = pd.Series(['ITAUCARD S.A.', None, 'Padaria do Zé', 'Friboi Alimentos'], index=[10, 11, 12, 13])
+    resultado = matcher.classificar_serie(nomes)
+    assert list(resultado.index) == [10, 11, 12, 13]
+    assert resultado['grupo'].tolist()[0] == 'ITAU' and resultado['grupo'].tolist()[3] == 'JBS'
+    assert resultado['grupo'].isna().tolist() == [False, True, True, False]
+
+def test_keywords_sobrepostas_nao_se_escondem():
+    matcher = MatcherGrupos({'BRADESCO': ['bradesco'], 'BRADESCO SEGUROS': ['bradesco seguros'], 'LUIZA': ['seguros luiza']})
+    encontrados = matcher.encontrar('Bradesco Seguros Luiza S.A.')
+    assert [(m['grupo'], m['inicio'], m['fim']) for m in encontrados] == [
+        ('BRADESCO SEGUROS', 0, 16), ('BRADESCO', 0, 8), ('LUIZA', 9, 22)
+    ]
+
+def test_keywords_sobrepostas_com_palavra_inteira():
+    matcher = MatcherGrupos({'VALE': ['vale'], 'DOCE': ['vale do rio doce', 'rio']}, palavra_inteira=True)
+    assert grupos(matcher, 'VALE DO RIO DOCE S.A.') == ['DOCE', 'VALE', 'DOCE']
+    assert grupos(matcher, 'VALENCA DO RIOZINHO') == []
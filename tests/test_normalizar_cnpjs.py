@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from grupos_economicos import normalizar_cnpjs
+
+AMBEV = '07526557000100'
+PETROBRAS = '33000167000101'
+
+@pytest.mark.parametrize('valor', [
+    AMBEV, '07.526.557/0001-00', ' 07526557000100 ', 7526557000100, 7526557000100.0, '7526557000100.0', '7526557000100',
+])
+def test_formatos_validos(valor):
+    normalizado = normalizar_cnpjs(pd.Series([valor], dtype=object)).iloc[0]
+    assert normalizado['cnpj'] == AMBEV
+    assert pd.isna(normalizado['erro'])
+
+@pytest.mark.parametrize('valor, erro', [
+    ('07526557000101', 'CNPJ inválido (dígito verificador)'),
+    ('07526557000110', 'CNPJ inválido (dígito verificador)'),
+    ('00000000000000', 'CNPJ inválido (dígito verificador)'),
+    ('11111111111111', 'CNPJ inválido (dígito verificador)'),
+    # Só valores numéricos recuperam os zeros à esquerda; texto pontuado curto continua curto
+    ('7.526.557/0001-00', 'CNPJ inválido'),
+    ('075265570001000', 'CNPJ inválido'),
+    ('abc', 'CNPJ inválido'),
+    ('', 'CNPJ inválido'),
+])
+def test_invalidos(valor, erro):
+    normalizado = normalizar_cnpjs([valor]).iloc[0]
+    assert pd.isna(normalizado['cnpj'])
+    assert normalizado['erro'] == erro
+
+def test_preserva_indice_e_original():
+    valores = pd.Series([7526557000100, 'x', '33.000.167/0001-01'], index=[5, 7, 9], dtype=object)
+    normalizados = normalizar_cnpjs(valores)
+    assert normalizados.index.tolist() == [5, 7, 9]
+    assert normalizados['original'].tolist() == ['7526557000100', 'x', '33.000.167/0001-01']
+    assert normalizados['cnpj'].tolist()[2] == PETROBRAS
+
+def test_so_cnpjs_validos_distintos_sao_consultados(criar_app, provedor_falso):
+    provedor = provedor_falso(lambda cnpj: {'razao_social': f'EMPRESA {cnpj}', 'nome_fantasia': '', 'atividade': '', 'situacao': 'ATIVA', 'qsa': []})
+    app = criar_app(provedor=provedor)
+    entrada = [AMBEV, 7526557000100, '07.526.557/0001-00', '07526557000101', 'abc', PETROBRAS, AMBEV]
+    resultados = app.processar_cnpjs(entrada)
+
+    assert sorted(provedor.consultas) == [AMBEV, PETROBRAS]
+    assert [r['cnpj_original'] for r in resultados] == [str(v) for v in entrada]
+    assert [r.get('cnpj') for r in resultados] == [AMBEV, AMBEV, AMBEV, None, None, PETROBRAS, AMBEV]
+    assert resultados[3]['erro'] == 'CNPJ inválido (dígito verificador)'
+    assert resultados[4]['erro'] == 'CNPJ inválido'
+    assert resultados[1]['razao_social'] == f'EMPRESA {AMBEV}'
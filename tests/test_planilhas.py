@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+from planilhas import EscritorMultiplo, EscritorPrevia, abrir_escritor, em_blocos, ler_em_blocos, ler_linhas
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({'cnpj_original': [f'{i:014d}' for i in range(1234)], 'erro': None, 'grupo_economico': 'G'})
+
+def test_previa_le_so_a_pagina_pedida(tmp_path, df):
+    previa = EscritorPrevia(str(tmp_path / 'resultado.previa'))
+    for bloco in em_blocos(df, 500):
+        previa.escrever(bloco)
+    previa.fechar()
+    assert previa.blocos[1][0] == 500
+
+    pagina = ler_linhas(previa.destino, previa.blocos, 450, 100)
+    assert pagina.index.tolist() == list(range(450, 550))
+    assert len(ler_linhas(previa.destino, previa.blocos, 1200, 100)) == 34
+    assert ler_linhas(previa.destino, previa.blocos, 2000, 100).empty
+
+def test_escritor_multiplo_grava_saida_e_previa(tmp_path, df):
+    destino = str(tmp_path / 'resultado.csv')
+    previa = EscritorPrevia(destino + '.previa')
+    escritor = EscritorMultiplo([abrir_escritor(destino), previa])
+    for bloco in em_blocos(df, 500):
+        escritor.escrever(bloco)
+    escritor.fechar()
+
+    relido = pd.concat(ler_em_blocos(destino))
+    assert relido['cnpj_original'].tolist() == df['cnpj_original'].tolist()
+    assert ler_linhas(previa.destino, previa.blocos, 0, 3)['cnpj_original'].tolist() == df['cnpj_original'].tolist()[:3]
@@ -0,0 +1,48 @@
+import pytest
+
+from grupos_economicos import PESOS_DV1, PESOS_DV2
+
+def cnpj(raiz: str, filial: str = '0001') -> str:
+    """CNPJ válido a partir da raiz de 8 dígitos"""
+    base = raiz + filial
+    for pesos in (PESOS_DV1, PESOS_DV2):
+        resto = sum(int(d) * p for d, p in zip(base, pesos)) % 11
+        base += str(0 if resto < 2 else 11 - resto)
+    return base
+
+CERVEJARIA = cnpj('11111111')
+DISTRIBUIDORA = cnpj('22222222')
+HOLDING = 'HOLDING XYZ PARTICIPACOES S.A.'
+
+def empresa(razao: str, socios: list) -> dict:
+    return {
+        'razao_social': razao, 'nome_fantasia': '', 'atividade': '', 'situacao': 'ATIVA',
+        'qsa': [{'nome': nome, 'qualificacao': 'Sócio', 'documento': None} for nome in socios]
+    }
+
+@pytest.fixture
+def app(criar_app, provedor_falso):
+    empresas = {
+        CERVEJARIA: empresa('CERVEJARIA BRAHMA LTDA', [HOLDING]),
+        DISTRIBUIDORA: empresa('DISTRIBUIDORA SOL NASCENTE LTDA', [HOLDING]),
+    }
+    return criar_app({'AMBEV': ['ambev', 'brahma']}, provedor_falso(empresas.get))
+
+@pytest.mark.parametrize('tamanho_lote', [1, 10])
+def test_socio_pj_em_comum_propaga_o_grupo_na_mesma_execucao(app, tamanho_lote):
+    resultados = app.processar_cnpjs([CERVEJARIA, DISTRIBUIDORA], tamanho_lote=tamanho_lote)
+    assert [r['grupo_economico'] for r in resultados] == ['AMBEV', 'AMBEV']
+    assert resultados[1]['metodo_analise'] == 'QSA'
+
+@pytest.mark.parametrize('tamanho_lote', [1, 10])
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_resultado_nao_depende_da_ordem_das_linhas(app, tamanho_lote, max_workers):
+    resultados = app.processar_cnpjs([DISTRIBUIDORA, CERVEJARIA], tamanho_lote=tamanho_lote, max_workers=max_workers)
+    assert [r['grupo_economico'] for r in resultados] == ['AMBEV', 'AMBEV']
+    assert [r['metodo_analise'] for r in resultados] == ['QSA', 'Regras']
+
+def test_grafo_nao_passa_de_uma_execucao_para_outra(app):
+    app.processar_cnpjs([CERVEJARIA])
+    resultado = app.processar_cnpjs([DISTRIBUIDORA])[0]
+    assert resultado['metodo_analise'] != 'QSA'
+    assert resultado['grupo_economico'] != 'AMBEV'
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from grupos_economicos import LimitadorTaxa
+from http_cliente import ClienteHTTP
+from metricas import Metricas
+from provedores import CNPJInexistente, EstrategiaProvedores, ProvedorCNPJ
+
+CNPJ = '11222333000181'
+
+class ProvedorLento(ProvedorCNPJ):
+    """Fonte falsa que demora `latencia` segundos e devolve 'ok', 'falha' ou 'inexistente'"""
+    timeout = 5
+
+    def __init__(self, nome: str, latencia: float = 0.0, resultado: str = 'ok'):
+        super().__init__('')
+        self.nome = self.rotulo = nome
+        self.latencia = latencia
+        self.resultado = resultado
+        self.chamadas = []
+
+    def buscar(self, cnpj, http):
+        self.chamadas.append(time.monotonic())
+        time.sleep(self.latencia)
+        if self.resultado == 'inexistente':
+            raise CNPJInexistente()
+        if self.resultado == 'falha':
+            return None
+        return {'razao_social': self.nome.upper(), 'nome_fantasia': '', 'atividade': '', 'situacao': 'ATIVA', 'qsa': []}
+
+def estrategia(provedores, modo='sequencial', limitadores=None, **kwargs):
+    return EstrategiaProvedores(provedores, ClienteHTTP(max_tentativas=1), limitadores or {}, modo, **kwargs)
+
+def test_metricas_resumem_cada_fonte_e_alimentam_o_histograma():
+    metricas = Metricas()
+    fontes = estrategia([ProvedorLento('a', resultado='falha'), ProvedorLento('b')], metricas=metricas)
+    assert fontes.buscar(CNPJ)[0]['razao_social'] == 'B'
+
+    resumo = fontes.metricas()
+    assert resumo['a']['amostras'] == resumo['b']['amostras'] == 1
+    assert resumo['b']['taxa_sucesso'] > resumo['a']['taxa_sucesso']
+    observados = {
+        dict(rotulos)['provedor']: (dict(rotulos)['resultado'], histograma.total)
+        for (nome, rotulos), histograma in metricas.histogramas.items() if nome == 'provedor_latencia_segundos'
+    }
+    assert observados == {'a': ('falha', 1), 'b': ('ok', 1)}
+
+def rapida(estrategia_, nome, latencia, amostras=20):
+    """Dá à fonte um histórico de latência, para a ordem e o p95 do hedge não dependerem do valor inicial"""
+    for _ in range(amostras):
+        estrategia_.estatisticas[nome].registrar(latencia, True)
+
+def test_hedge_dispara_a_proxima_fonte_depois_do_p95():
+    lenta, reserva = ProvedorLento('lenta', latencia=1.0), ProvedorLento('reserva')
+    fontes = estrategia([lenta, reserva], 'hedged')
+    rapida(fontes, 'lenta', 0.1)
+
+    inicio = time.monotonic()
+    dados, inexistente = fontes.buscar(CNPJ)
+    assert dados['razao_social'] == 'RESERVA'
+    assert not inexistente
+    assert time.monotonic() - inicio < 0.8
+    assert 0.1 <= reserva.chamadas[0] - lenta.chamadas[0] < 0.8
+
+def test_hedge_nao_dispara_se_a_primeira_responde_no_prazo():
+    primeira, reserva = ProvedorLento('primeira', latencia=0.01), ProvedorLento('reserva')
+    fontes = estrategia([primeira, reserva], 'hedged')
+    rapida(fontes, 'primeira', 0.5)
+    assert fontes.buscar(CNPJ)[0]['razao_social'] == 'PRIMEIRA'
+    assert reserva.chamadas == []
+
+def test_hedge_falha_rapida_dispara_a_proxima_sem_esperar():
+    falha, reserva = ProvedorLento('falha', resultado='falha'), ProvedorLento('reserva')
+    fontes = estrategia([falha, reserva], 'hedged')
+    rapida(fontes, 'falha', 5.0)
+    inicio = time.monotonic()
+    assert fontes.buscar(CNPJ)[0]['razao_social'] == 'RESERVA'
+    assert time.monotonic() - inicio < 1.0
+
+def test_corrida_fica_com_a_primeira_resposta_valida():
+    falha = ProvedorLento('falha', latencia=0.0, resultado='falha')
+    lenta = ProvedorLento('lenta', latencia=1.0)
+    valida = ProvedorLento('valida', latencia=0.1)
+    fontes = estrategia([falha, lenta, valida], 'corrida')
+
+    inicio = time.monotonic()
+    assert fontes.buscar(CNPJ)[0]['razao_social'] == 'VALIDA'
+    assert time.monotonic() - inicio < 0.8
+    assert all(len(p.chamadas) == 1 for p in (falha, lenta, valida))
+
+@pytest.mark.parametrize('modo', ['sequencial', 'hedged', 'corrida'])
+def test_inexistente_em_qualquer_fonte_e_informado(modo):
+    fontes = estrategia([ProvedorLento('falha', resultado='falha'), ProvedorLento('receita', resultado='inexistente')], modo)
+    assert fontes.buscar(CNPJ) == (None, True)
+
+@pytest.mark.parametrize('modo', ['sequencial', 'hedged', 'corrida'])
+def test_so_falhas_nao_sao_inexistente(modo):
+    fontes = estrategia([ProvedorLento('a', resultado='falha'), ProvedorLento('b', resultado='falha')], modo)
+    assert fontes.buscar(CNPJ) == (None, False)
+
+@pytest.mark.parametrize('modo', ['hedged', 'corrida'])
+def test_sem_token_em_nenhuma_fonte_espera_a_melhor(modo):
+    melhor, outra = ProvedorLento('melhor'), ProvedorLento('outra')
+    limitadores = {'melhor': LimitadorTaxa(por_minuto=600), 'outra': LimitadorTaxa(por_minuto=1)}
+    for limitador in limitadores.values():
+        limitador.adquirir()
+    fontes = estrategia([melhor, outra], modo, limitadores)
+    rapida(fontes, 'melhor', 0.01)
+
+    assert fontes.buscar(CNPJ)[0]['razao_social'] == 'MELHOR'
+    assert len(melhor.chamadas) == 1
+    assert outra.chamadas == []
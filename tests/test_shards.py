@@ -0,0 +1,24 @@
+import pandas as pd
+
+from shards import dividir_anteriores, shards_dos_cnpjs
+
+AMBEV = '07526557000100'
+AMBEV_FILIAL = '07526557001009'
+
+def test_formatos_da_mesma_raiz_caem_no_mesmo_shard():
+    valores = pd.Series([7526557000100, 7526557000100.0, '07.526.557/0001-00', AMBEV, AMBEV_FILIAL], dtype=object)
+    for n in (2, 3, 7):
+        assert shards_dos_cnpjs(valores, n).nunique() == 1
+
+def test_anteriores_acompanham_as_linhas_de_entrada():
+    entrada = pd.Series([7526557000100, '33.000.167/0001-01', '60746948000112'], dtype=object)
+    anteriores = {'07526557000100': {'grupo_economico': 'AMBEV'}, '33000167000101': {'grupo_economico': 'PETROBRAS'}}
+    for n in (2, 3, 5):
+        shards = shards_dos_cnpjs(entrada, n).tolist()
+        divididos = dividir_anteriores(anteriores, n)
+        assert '07526557000100' in divididos[shards[0]]
+        assert '33000167000101' in divididos[shards[1]]
+        assert sum(len(d) for d in divididos) == len(anteriores)
+
+def test_sem_anteriores():
+    assert dividir_anteriores({}, 3) == [{}, {}, {}]
@@ -0,0 +1,58 @@
+import pytest
+
+from grupos_economicos import GRUPOS_PATH, IndiceSimilaridade, carregar_grupos, normalizar_razao, termos_distintivos
+
+@pytest.fixture(scope='module')
+def indice():
+    return IndiceSimilaridade(carregar_grupos(GRUPOS_PATH), limiar=0.8)
+
+def test_normalizar_razao_remove_sufixos_e_expande_abreviacoes():
+    assert normalizar_razao('CIA. BRAS. DE BEBIDAS S/A') == 'companhia brasileira bebidas'
+    assert normalizar_razao('Magazine Luíza Ltda - EPP') == 'magazine luiza'
+
+def test_termos_distintivos_ignoram_palavras_genericas():
+    assert termos_distintivos('CIA BRASILEIRA DE DISTRIBUICAO') == []
+    assert termos_distintivos('IND E COM DE ALUMINIO GERDAU LTDA') == ['aluminio', 'gerdau']
+
+@pytest.mark.parametrize('nome, grupo', [
+    ('CERVEJARIA ANHEUSSER LTDA', 'AMBEV'),
+    ('MAGAZINE LUIZZA S/A', 'MAGAZINE LUIZA'),
+    ('BRADESCCO SEGUROS S.A.', 'BRADESCO'),
+    ('SAMARCCO MINERACAO S.A.', 'VALE'),
+    ('GERDAU ACOS LONGOS S.A.', 'GERDAU'),
+])
+def test_variacoes_do_nome_casam_com_o_grupo(indice, nome, grupo):
+    encontrado, _, pontuacao = indice.pontuar(nome)
+    assert encontrado == grupo
+    assert pontuacao >= indice.limiar
+
+@pytest.mark.parametrize('nome, grupo', [
+    ('MAG LUIZA', 'MAGAZINE LUIZA'),
+    ('BR DISTRIB LTDA', 'PETROBRAS'),
+])
+def test_abreviacoes_casam_com_o_apelido_por_extenso(indice, nome, grupo):
+    encontrado, _, pontuacao = indice.pontuar(nome)
+    assert encontrado == grupo
+    assert pontuacao >= indice.limiar
+
+def test_palavras_genericas_abreviadas_ajudam_o_apelido_que_as_contem():
+    indice = IndiceSimilaridade({'AMBEV': ['companhia de bebidas das americas']}, limiar=0.8)
+    assert indice.pontuar('CIA DE BEBIDAS DAS AMERICAS S/A') == ('AMBEV', 'companhia bebidas americas', 1.0)
+    assert indice.pontuar('BEBIDAS AMERICAS')[2] < 1.0
+    assert indice.pontuar('CIA BRAS DE BEBIDAS')[2] < indice.limiar
+
+@pytest.mark.parametrize('nome', [
+    'CIA BRASILEIRA DE DISTRIBUICAO',
+    'COMPANHIA BRASILEIRA DE ALUMINIO',
+    'CIA BRAS DE BEBIDAS',
+    'NATURAL ALIMENTOS LTDA',
+    'VALENCA TEXTIL LTDA',
+    'BR MALLS PARTICIPACOES S.A.',
+    'XR DISTRIBUIDORA LTDA',
+])
+def test_palavras_genericas_nao_geram_grupo(indice, nome):
+    assert indice.pontuar(nome)[2] < indice.limiar
+
+def test_pontuar_em_massa_preserva_a_ordem(indice):
+    nomes = ['MAGAZINE LUIZZA S/A', 'CIA BRASILEIRA DE DISTRIBUICAO', 'MAGAZINE LUIZZA S/A']
+    assert indice.pontuar_em_massa(nomes) == [indice.pontuar(nome) for nome in nomes]